@@ -0,0 +1,203 @@
+# autocomplete.py
+import tkinter as tk
+from tkinter import ttk
+
+from background import BackgroundLoader
+from search import search_index
+
+DEBOUNCE_MS = 120       # wait this long after the last keystroke before searching
+MAX_SUGGESTIONS = 8
+
+
+class MedicineAutocomplete:
+    """Drop-down medicine suggestions for an existing entry widget.
+
+    Works with tk/ttk entries and customtkinter's CTkEntry. Suggestions come
+    from the in-memory search index (prefix, substring and typo matches),
+    ranked with live stock. Lookups are debounced, so only the text present
+    once typing pauses is searched. They run on a background worker, because
+    a due catalog or stock refresh reads the database, and typing never waits.
+    """
+
+    _NAVIGATION_KEYS = {"Up", "Down", "Return", "KP_Enter", "Tab", "Escape"}
+
+    def __init__(self, entry, on_select=None, limit=MAX_SUGGESTIONS, delay=DEBOUNCE_MS):
+        self.entry = entry
+        self.on_select = on_select
+        self.limit = limit
+        self.delay = delay
+        self._job = None
+        self._popup = None
+        self._listbox = None
+        self._names = []
+        self._last_text = None
+        # No busy cursor: it would flicker on every pause in typing
+        self._loader = BackgroundLoader(entry, indicator=lambda busy: None)
+
+        entry.bind("<KeyRelease>", self._on_key_release, add="+")
+        entry.bind("<Down>", self._on_down, add="+")
+        entry.bind("<Up>", self._on_up, add="+")
+        entry.bind("<Return>", self._on_return, add="+")
+        entry.bind("<KP_Enter>", self._on_return, add="+")
+        entry.bind("<Escape>", self._on_escape, add="+")
+        entry.bind("<FocusOut>", lambda event: entry.after(150, self._hide_unless_focused), add="+")
+
+    # ---------- typing ----------
+
+    def _on_key_release(self, event):
+        if event.keysym in self._NAVIGATION_KEYS:
+            return
+        if self._job is not None:
+            self.entry.after_cancel(self._job)
+        self._job = self.entry.after(self.delay, self._refresh)
+
+    def _refresh(self):
+        self._job = None
+        text = self.entry.get().strip()
+        if text == self._last_text:
+            return
+        self._last_text = text
+        if not text:
+            self.hide()
+            return
+        self._loader.submit("suggest", search_index.suggest, text, self.limit,
+                            on_done=lambda suggestions: self._suggestions_ready(text, suggestions),
+                            on_error=lambda error: self.hide())
+
+    def _suggestions_ready(self, text, suggestions):
+        # Typing went on, or the list (or its dialog) was closed, while the lookup ran
+        try:
+            current = self.entry.get().strip()
+        except tk.TclError:
+            return
+        if text != self._last_text or text != current:
+            return
+        if not suggestions:
+            self.hide()
+            return
+        self._show(suggestions)
+
+    # ---------- popup ----------
+
+    def _show(self, suggestions):
+        if self._popup is None:
+            self._popup = tk.Toplevel(self.entry)
+            self._popup.wm_overrideredirect(True)
+            self._listbox = tk.Listbox(self._popup, activestyle="dotbox", exportselection=False)
+            self._listbox.pack(fill=tk.BOTH, expand=True)
+            self._listbox.bind("<ButtonRelease-1>", lambda event: self._accept())
+            self._listbox.bind("<Return>", lambda event: self._accept())
+            self._listbox.bind("<Escape>", lambda event: self.hide())
+
+        self._names = [name for name, _ in suggestions]
+        self._listbox.delete(0, tk.END)
+        for name, stock in suggestions:
+            self._listbox.insert(tk.END, f"{name}    ({stock} in stock)" if stock else f"{name}    (out of stock)")
+            if not stock:
+                self._listbox.itemconfig(tk.END, foreground="gray")
+        self._listbox.configure(height=len(suggestions))
+        self._listbox.selection_clear(0, tk.END)
+
+        x = self.entry.winfo_rootx()
+        y = self.entry.winfo_rooty() + self.entry.winfo_height()
+        self._popup.wm_geometry(f"{max(self.entry.winfo_width(), 280)}x{self._listbox.winfo_reqheight()}+{x}+{y}")
+        self._popup.deiconify()
+        self._popup.lift()
+
+    def hide(self):
+        self._loader.cancel("suggest")
+        if self._popup is not None:
+            self._popup.withdraw()
+        self._last_text = None
+
+    def has_selection(self):
+        """True while a suggestion is highlighted in the open list"""
+        return self._visible() and bool(self._listbox.curselection())
+
+    def _visible(self):
+        return self._popup is not None and bool(self._popup.winfo_viewable())
+
+    def _hide_unless_focused(self):
+        if self._listbox is None or self.entry.focus_get() is not self._listbox:
+            self.hide()
+
+    # ---------- keyboard ----------
+
+    def _move(self, step):
+        if not self._visible() or not self._names:
+            return
+        current = self._listbox.curselection()
+        index = (current[0] + step) if current else (0 if step > 0 else len(self._names) - 1)
+        index = max(0, min(index, len(self._names) - 1))
+        self._listbox.selection_clear(0, tk.END)
+        self._listbox.selection_set(index)
+        self._listbox.see(index)
+
+    def _on_down(self, event):
+        self._move(1)
+        return "break"
+
+    def _on_up(self, event):
+        self._move(-1)
+        return "break"
+
+    def _on_return(self, event):
+        if self.has_selection():
+            self._accept()
+            return "break"
+
+    def _on_escape(self, event):
+        if self._visible():
+            self.hide()
+            return "break"
+
+    def _accept(self):
+        current = self._listbox.curselection()
+        if not current:
+            return
+        name = self._names[current[0]]
+        self.entry.delete(0, tk.END)
+        self.entry.insert(0, name)
+        self.hide()
+        self._last_text = name
+        self.entry.focus_set()
+        if self.on_select:
+            self.on_select(name)
+
+
+def ask_medicine_name(parent, title="Select Medicine", prompt="Enter medicine name:"):
+    """Modal replacement for simpledialog.askstring with medicine suggestions.
+
+    Returns the entered name, or None if the dialog was cancelled.
+    """
+    dialog = tk.Toplevel(parent)
+    dialog.title(title)
+    dialog.transient(parent)
+    dialog.resizable(False, False)
+    result = {"name": None}
+
+    frame = ttk.Frame(dialog, padding=12)
+    frame.pack(fill=tk.BOTH, expand=True)
+    ttk.Label(frame, text=prompt).pack(anchor=tk.W)
+    entry = ttk.Entry(frame, width=40)
+    entry.pack(fill=tk.X, pady=(4, 10))
+
+    def submit(name=None):
+        result["name"] = (name or entry.get()).strip() or None
+        dialog.destroy()
+
+    MedicineAutocomplete(entry, on_select=submit)
+
+    buttons = ttk.Frame(frame)
+    buttons.pack(anchor=tk.E)
+    ttk.Button(buttons, text="OK", command=submit).pack(side=tk.LEFT, padx=4)
+    ttk.Button(buttons, text="Cancel", command=dialog.destroy).pack(side=tk.LEFT)
+
+    # Enter with no suggestion highlighted submits the typed text
+    entry.bind("<Return>", lambda event: submit(), add="+")
+    dialog.bind("<Escape>", lambda event: dialog.destroy())
+
+    entry.focus_set()
+    dialog.grab_set()
+    parent.wait_window(dialog)
+    return result["name"]
@@ -0,0 +1,241 @@
+import re
+import sqlite3
+import threading
+from datetime import date, datetime
+from decimal import Decimal
+
+
+class MySQLBackend:
+    """MySQL server backend (mysql-connector-python)"""
+    name = "mysql"
+    explain_prefix = "EXPLAIN "
+
+    def __init__(self, config):
+        import mysql.connector
+        self._connector = mysql.connector
+        self.config = config
+        self.errors = (mysql.connector.Error,)
+
+    def connect(self):
+        return self._connector.connect(**self.config)
+
+    def is_duplicate_key(self, error):
+        return getattr(error, "errno", None) == 1062
+
+    def is_retryable(self, error):
+        # ER_LOCK_DEADLOCK, ER_LOCK_WAIT_TIMEOUT: the transaction can be rerun as a whole
+        return getattr(error, "errno", None) in (1213, 1205)
+
+    def describe_error(self, error):
+        return f"Database error ({error.errno}): {error.msg}"
+
+
+# ---------- SQLite ----------
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS medicines (
+    medicine_id INTEGER PRIMARY KEY,
+    name VARCHAR(100) NOT NULL UNIQUE COLLATE NOCASE,
+    manufacturer VARCHAR(100),
+    price DECIMAL(10,2) NOT NULL,
+    category VARCHAR(50),
+    description TEXT,
+    dosage VARCHAR(100),
+    requires_prescription BOOLEAN NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS suppliers (
+    supplier_id INTEGER PRIMARY KEY,
+    name VARCHAR(100) NOT NULL,
+    phone VARCHAR(20) UNIQUE,
+    email VARCHAR(100) UNIQUE,
+    address TEXT
+);
+CREATE TABLE IF NOT EXISTS inventory (
+    inventory_id INTEGER PRIMARY KEY,
+    medicine_id INTEGER NOT NULL REFERENCES medicines(medicine_id),
+    supplier_id INTEGER REFERENCES suppliers(supplier_id),
+    quantity_added INTEGER NOT NULL,
+    date_added TIMESTAMP,
+    batch_number VARCHAR(50),
+    expiry_date DATE,
+    current_quantity INTEGER NOT NULL,
+    location VARCHAR(100)
+);
+CREATE TABLE IF NOT EXISTS prescriptions (
+    prescription_id INTEGER PRIMARY KEY,
+    date DATE NOT NULL,
+    total_amount DECIMAL(10,2) NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS prescription_medicines (
+    prescription_id INTEGER NOT NULL REFERENCES prescriptions(prescription_id),
+    medicine_id INTEGER NOT NULL REFERENCES medicines(medicine_id),
+    quantity_bought INTEGER NOT NULL,
+    total_price DECIMAL(10,2) NOT NULL,
+    PRIMARY KEY (prescription_id, medicine_id)
+);
+CREATE TABLE IF NOT EXISTS users (
+    user_id INTEGER PRIMARY KEY,
+    name VARCHAR(100) NOT NULL,
+    email VARCHAR(100) NOT NULL UNIQUE,
+    phone VARCHAR(20) UNIQUE,
+    role VARCHAR(20) NOT NULL,
+    password VARCHAR(255) NOT NULL
+);
+"""
+
+# Type adapters so SQLite hands back the same Python types as MySQL
+sqlite3.register_adapter(Decimal, str)
+sqlite3.register_adapter(date, lambda value: value.isoformat())
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(" "))
+sqlite3.register_converter("DECIMAL", lambda raw: Decimal(raw.decode()))
+sqlite3.register_converter("BOOLEAN", lambda raw: bool(int(raw)))
+sqlite3.register_converter("DATE", lambda raw: date.fromisoformat(raw.decode()[:10]))
+sqlite3.register_converter("TIMESTAMP", lambda raw: datetime.fromisoformat(raw.decode()))
+
+# Compiled statements sqlite3 keeps per connection (its default is 128);
+# sized for the registered hot statements plus their IN-list variants
+SQLITE_STATEMENT_CACHE = 256
+
+_PLACEHOLDER = re.compile(r"%s")
+_FOR_UPDATE = re.compile(r"\s+FOR\s+UPDATE\s*$", re.IGNORECASE)
+
+
+def _to_qmark(query):
+    """Translate the %s paramstyle used throughout the code base to SQLite's ?"""
+    return _PLACEHOLDER.sub("?", query).replace("%%", "%")
+
+
+class SQLiteCursor:
+    """DB-API cursor with the mysql-connector options this code relies on"""
+
+    def __init__(self, raw_connection, dictionary=False):
+        self._raw = raw_connection
+        self._cursor = raw_connection.cursor()
+        self._dictionary = dictionary
+
+    def execute(self, query, params=()):
+        # SQLite has no row locks: SELECT ... FOR UPDATE takes the database
+        # write lock up front so the read-check-write sequence is serialized
+        if _FOR_UPDATE.search(query):
+            query = _FOR_UPDATE.sub("", query)
+            if not self._raw.in_transaction:
+                self._raw.execute("BEGIN IMMEDIATE")
+        self._cursor.execute(_to_qmark(query), tuple(params or ()))
+        return self
+
+    def executemany(self, query, seq_of_params):
+        self._cursor.executemany(_to_qmark(query), [tuple(p) for p in seq_of_params])
+        return self
+
+    def _row(self, row):
+        if row is None or not self._dictionary:
+            return row
+        return {col[0]: value for col, value in zip(self._cursor.description, row)}
+
+    def fetchone(self):
+        return self._row(self._cursor.fetchone())
+
+    def fetchmany(self, size=None):
+        rows = self._cursor.fetchmany(size) if size else self._cursor.fetchmany()
+        return [self._row(r) for r in rows]
+
+    def fetchall(self):
+        return [self._row(r) for r in self._cursor.fetchall()]
+
+    def __iter__(self):
+        for row in self._cursor:
+            yield self._row(row)
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    def close(self):
+        self._cursor.close()
+
+
+class SQLiteConnection:
+    """Wraps sqlite3.Connection with the mysql-connector surface used by the app"""
+
+    def __init__(self, raw):
+        self._raw = raw
+
+    def cursor(self, dictionary=False, buffered=None, prepared=None):
+        return SQLiteCursor(self._raw, dictionary=dictionary)
+
+    def commit(self):
+        self._raw.commit()
+
+    def rollback(self):
+        self._raw.rollback()
+
+    @property
+    def in_transaction(self):
+        return self._raw.in_transaction
+
+    def is_connected(self):
+        try:
+            self._raw.execute("SELECT 1")
+            return True
+        except sqlite3.Error:
+            return False
+
+    def close(self):
+        self._raw.close()
+
+
+class SQLiteBackend:
+    """Embedded SQLite backend for local runs, CI and benchmarks"""
+    name = "sqlite"
+    explain_prefix = "EXPLAIN QUERY PLAN "
+    errors = (sqlite3.Error,)
+
+    def __init__(self, path):
+        self.path = path
+        self._schema_ready = False
+        self._lock = threading.Lock()
+
+    def connect(self):
+        raw = sqlite3.connect(
+            self.path,
+            timeout=30,
+            detect_types=sqlite3.PARSE_DECLTYPES,
+            check_same_thread=False,  # the pool hands a connection to one thread at a time
+            cached_statements=SQLITE_STATEMENT_CACHE,
+        )
+        raw.execute("PRAGMA foreign_keys = ON")
+        if self.path != ":memory:":
+            raw.execute("PRAGMA journal_mode = WAL")
+        with self._lock:
+            if not self._schema_ready or self.path == ":memory:":
+                raw.executescript(SQLITE_SCHEMA)
+                self._schema_ready = True
+        return SQLiteConnection(raw)
+
+    def is_duplicate_key(self, error):
+        return isinstance(error, sqlite3.IntegrityError) and "UNIQUE" in str(error)
+
+    def is_retryable(self, error):
+        # SQLITE_BUSY: the write lock was not granted within the busy timeout
+        return isinstance(error, sqlite3.OperationalError) and (
+            "locked" in str(error) or "busy" in str(error))
+
+    def describe_error(self, error):
+        return f"Database error: {error}"
+
+
+def create_backend(name, mysql_config=None, sqlite_path=None):
+    """Build the backend selected in database.py"""
+    if name == "mysql":
+        return MySQLBackend(mysql_config)
+    if name == "sqlite":
+        return SQLiteBackend(sqlite_path)
+    raise ValueError(f"Unknown database backend '{name}' (expected 'mysql' or 'sqlite')")
@@ -0,0 +1,117 @@
+# background.py
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from tkinter import messagebox
+
+LOADER_WORKERS = 4      # shared worker threads for all screens
+POLL_MS = 25            # how often the Tk thread collects finished loads
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Worker pool shared by every screen (lazily created)"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=LOADER_WORKERS,
+                                               thread_name_prefix="ui-loader")
+    return _executor
+
+
+def busy_cursor(widget):
+    """Default loading indicator: a watch cursor on the widget's window"""
+    def indicate(busy):
+        try:
+            widget.winfo_toplevel().configure(cursor="watch" if busy else "")
+        except Exception:
+            pass
+    return indicate
+
+
+class BackgroundLoader:
+    """Runs blocking data calls off the Tk thread and delivers results on it.
+
+    Each request has a key naming the view it fills (e.g. "inventory").
+    A newer request with the same key supersedes the older one: the old one
+    is cancelled if it has not started yet, and its result is dropped if it
+    has. Workers never touch widgets. They put results on a queue that the
+    Tk thread drains with after(), so callbacks always run on the Tk thread.
+    """
+
+    def __init__(self, widget, indicator=None, poll_ms=POLL_MS):
+        self.widget = widget
+        self.indicator = indicator or busy_cursor(widget)
+        self.poll_ms = poll_ms
+        self._results = queue.Queue()
+        self._latest = {}       # key -> (ticket, future)
+        self._next_ticket = 0
+        self._polling = False
+
+    def submit(self, key, func, *args, on_done, on_error=None, **kwargs):
+        """Run ``func(*args, **kwargs)`` in the background; returns a ticket"""
+        self._next_ticket += 1
+        ticket = self._next_ticket
+        self._drop(key)
+
+        def work():
+            try:
+                self._results.put((key, ticket, True, func(*args, **kwargs), on_done, on_error))
+            except Exception as e:
+                self._results.put((key, ticket, False, e, on_done, on_error))
+
+        self._latest[key] = (ticket, get_executor().submit(work))
+        self.indicator(True)
+        if not self._polling:
+            self._polling = True
+            self.widget.after(self.poll_ms, self._poll)
+        return ticket
+
+    def cancel(self, key):
+        """Drop the outstanding request for a key (if any)"""
+        self._drop(key)
+        if not self._latest:
+            self.indicator(False)
+
+    def _drop(self, key):
+        latest = self._latest.pop(key, None)
+        if latest:
+            latest[1].cancel()
+
+    def cancel_all(self):
+        for key in list(self._latest):
+            self.cancel(key)
+
+    def busy(self, key=None):
+        return key in self._latest if key else bool(self._latest)
+
+    def _poll(self):
+        while True:
+            try:
+                key, ticket, ok, value, on_done, on_error = self._results.get_nowait()
+            except queue.Empty:
+                break
+            latest = self._latest.get(key)
+            if not latest or latest[0] != ticket:
+                continue  # superseded or cancelled
+            del self._latest[key]
+            if not self._latest:
+                self.indicator(False)
+            if ok:
+                on_done(value)
+            elif on_error:
+                on_error(value)
+            else:
+                messagebox.showerror("Error", f"Failed to load data: {value}")
+
+        try:
+            if self._latest:
+                self.widget.after(self.poll_ms, self._poll)
+            else:
+                self._polling = False
+        except Exception:
+            # Window closed while a load was running
+            self._polling = False
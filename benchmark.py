@@ -0,0 +1,246 @@
+# benchmark.py
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import sys
+import time
+from datetime import datetime
+
+from database import get_backend, transaction
+from catalog import catalog
+from search import search_index
+from stock import stock_levels
+from inventory import PharmacyInventory
+from medicines import Medicine
+from suppliers import SupplierManager
+from prescriptions import PrescriptionManager
+from predictor import MedicineEffectivenessPredictor
+from datagen import add_database_arguments, configure_database
+from instrumentation import query_stats
+
+DEFAULT_REPEAT = 50
+DEFAULT_WARMUP = 3
+PERCENTILES = (50, 90, 95, 99)
+
+
+def percentile(sorted_samples, p):
+    """The p-th percentile (linear interpolation) of already sorted samples"""
+    if not sorted_samples:
+        return None
+    position = (len(sorted_samples) - 1) * p / 100
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_samples) - 1)
+    return sorted_samples[lower] + (sorted_samples[upper] - sorted_samples[lower]) * (position - lower)
+
+
+def summarize(samples):
+    """Timing summary in milliseconds for a list of durations in seconds"""
+    ordered = sorted(sample * 1000 for sample in samples)
+    summary = {"runs": len(ordered)}
+    if ordered:
+        summary.update(min=ordered[0], mean=sum(ordered) / len(ordered), max=ordered[-1])
+        summary.update({f"p{p}": percentile(ordered, p) for p in PERCENTILES})
+    return summary
+
+
+class BenchmarkSuite:
+    """Times the pharmacy's key operations against whatever data is loaded.
+
+    Each benchmark is a method ``bench_<name>(rng)`` timing one call; the
+    operations pick their inputs (search terms, baskets, conditions) with
+    a seeded random generator so runs are comparable. Prescriptions
+    created by the dispensing benchmark are edited and then deleted by the
+    following ones. Returns go onto the newest batch, so that alone would
+    shift stock between batches from run to run. The batch quantities are
+    therefore snapshotted before the mutating benchmarks and restored
+    afterwards. Output printed by the operations themselves is discarded.
+    """
+
+    NAMES = ("catalog_search", "medicine_page", "inventory_page", "low_stock_report", "expiry_report",
+             "fifo_dispensing", "prescription_edit", "prescription_delete", "supplier_top_n",
+             "predictor_scoring")
+    MUTATING = ("fifo_dispensing", "prescription_edit", "prescription_delete")
+
+    def __init__(self, repeat=DEFAULT_REPEAT, warmup=DEFAULT_WARMUP, seed=42):
+        self.repeat = repeat
+        self.warmup = warmup
+        self.seed = seed
+        self.inventory = PharmacyInventory()
+        self.prescriptions = PrescriptionManager()
+        self.suppliers = SupplierManager()
+        self.predictor = MedicineEffectivenessPredictor()
+        self._created = []      # prescriptions from fifo_dispensing: (id, medicine_id, quantity)
+
+    def run(self, names=None):
+        """Run the selected benchmarks (all by default); returns the JSON-ready results"""
+        names = list(names or self.NAMES)
+        unknown = [name for name in names if name not in self.NAMES]
+        if unknown:
+            raise ValueError(f"Unknown benchmark(s): {', '.join(unknown)}")
+
+        self._medicines = catalog.all()
+        if not self._medicines:
+            raise ValueError("The database has no medicines; load data with datagen.py first")
+        self._conditions = list(self.predictor.tables.conditions)
+
+        results = {}
+        snapshot = self._snapshot() if set(names) & set(self.MUTATING) else None
+        query_stats.reset()
+        try:
+            with open(os.devnull, "w") as sink, contextlib.redirect_stdout(sink):
+                for name in names:
+                    rng = random.Random(f"{self.seed}:{name}")
+                    bench = getattr(self, f"bench_{name}")
+                    for _ in range(self.warmup):
+                        bench(rng)
+                    samples = []
+                    for _ in range(self.repeat):
+                        samples.append(bench(rng))
+                    results[name] = summarize([sample for sample in samples if sample is not None])
+        finally:
+            if snapshot is not None:
+                self._restore(snapshot)
+
+        return {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "backend": type(get_backend()).__name__,
+            "python": platform.python_version(),
+            "repeat": self.repeat,
+            "warmup": self.warmup,
+            "seed": self.seed,
+            "medicines": len(self._medicines),
+            "unit": "ms",
+            "results": results,
+            "queries": query_stats.snapshot(25),
+            "slow_queries": query_stats.slow_queries(),
+        }
+
+    @staticmethod
+    def _snapshot():
+        """Batch quantities and the highest prescription ID before anything is written"""
+        with transaction() as (conn, cursor):
+            cursor.execute("SELECT inventory_id, current_quantity FROM inventory")
+            quantities = dict(cursor.fetchall())
+            cursor.execute("SELECT COALESCE(MAX(prescription_id), 0) FROM prescriptions")
+            last_prescription = cursor.fetchone()[0]
+        return quantities, last_prescription
+
+    def _restore(self, snapshot):
+        """Undo the mutating benchmarks in one transaction.
+
+        Drops the prescriptions and return batches they created and puts
+        every batch back to its snapshotted quantity. IDs only ever grow,
+        so anything above the snapshot's highest key is new.
+        """
+        quantities, last_prescription = snapshot
+        self._created = []
+        with transaction() as (conn, cursor):
+            for table in ("prescription_batches", "prescription_medicines", "prescriptions"):
+                cursor.execute(f"DELETE FROM {table} WHERE prescription_id > %s", (last_prescription,))
+            cursor.execute("SELECT inventory_id, current_quantity FROM inventory")
+            current = dict(cursor.fetchall())
+            added = [(inventory_id,) for inventory_id in current if inventory_id not in quantities]
+            changed = [(quantity, inventory_id) for inventory_id, quantity in quantities.items()
+                       if current.get(inventory_id) != quantity]
+            if added:
+                cursor.executemany("DELETE FROM inventory WHERE inventory_id = %s", added)
+                search_index.bump_batches(cursor)
+            if changed:
+                cursor.executemany(
+                    "UPDATE inventory SET current_quantity = %s, row_version = row_version + 1 "
+                    "WHERE inventory_id = %s", changed)
+        search_index.invalidate_batches()
+        stock_levels.reconcile(fix=True)
+
+    @staticmethod
+    def _time(func, *args, **kwargs):
+        start = time.perf_counter()
+        func(*args, **kwargs)
+        return time.perf_counter() - start
+
+    # ---------- benchmarks ----------
+
+    def bench_catalog_search(self, rng):
+        name = rng.choice(self._medicines)['name']
+        return self._time(search_index.search_medicines, name[:rng.randint(3, 6)])
+
+    def bench_medicine_page(self, rng):
+        return self._time(Medicine.read_medicines_page)
+
+    def bench_inventory_page(self, rng):
+        return self._time(self.inventory.list_inventory_page)
+
+    def bench_low_stock_report(self, rng):
+        return self._time(self.inventory.get_low_stock_items, 10)
+
+    def bench_expiry_report(self, rng):
+        return self._time(self.inventory.get_expiring_soon, 30)
+
+    def bench_fifo_dispensing(self, rng):
+        in_stock = [medicine_id for medicine_id, total in stock_levels.totals().items() if total >= 5]
+        if not in_stock:
+            return None
+        basket = [(medicine_id, rng.randint(1, 2)) for medicine_id in rng.sample(in_stock, min(3, len(in_stock)))]
+        start = time.perf_counter()
+        receipt = self.prescriptions.checkout(basket)
+        elapsed = time.perf_counter() - start
+        medicine_id, quantity = basket[0]
+        self._created.append((receipt.prescription_id, medicine_id, quantity))
+        return elapsed
+
+    def bench_prescription_edit(self, rng):
+        if not self._created:
+            return None
+        index = rng.randrange(len(self._created))
+        prescription_id, medicine_id, quantity = self._created[index]
+        # Baskets use 1-2 units per line, so toggle between the two
+        self._created[index] = (prescription_id, medicine_id, 3 - quantity)
+        return self._time(self.prescriptions.update_prescription_medicine, prescription_id, medicine_id,
+                          3 - quantity)
+
+    def bench_prescription_delete(self, rng):
+        if not self._created:
+            return None
+        prescription_id, _, _ = self._created.pop()
+        return self._time(self.prescriptions.delete_prescription, prescription_id)
+
+    def bench_supplier_top_n(self, rng):
+        return self._time(self.suppliers.get_top_suppliers, 10)
+
+    def bench_predictor_scoring(self, rng):
+        condition = rng.choice(self._conditions)
+        return self._time(self.predictor.top_k, condition, 10)
+
+
+def main(argv=None):
+    """python benchmark.py [--sqlite PATH] [--repeat N] [--only NAME ...] [--output FILE]"""
+    parser = argparse.ArgumentParser(description="Time the pharmacy's key operations")
+    add_database_arguments(parser)
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT)
+    parser.add_argument("--warmup", type=int, default=DEFAULT_WARMUP)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--only", nargs="+", metavar="NAME", choices=BenchmarkSuite.NAMES)
+    parser.add_argument("--output", default="benchmark_results.json")
+    args = parser.parse_args(argv)
+    configure_database(args)
+
+    report = BenchmarkSuite(args.repeat, args.warmup, args.seed).run(args.only)
+    with open(args.output, "w", encoding="utf-8") as handle:
+        json.dump(report, handle, indent=2)
+
+    print(f"{'Benchmark':<22}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}  (ms)")
+    for name, summary in report["results"].items():
+        if summary["runs"]:
+            print(f"{name:<22}{summary['p50']:>10.2f}{summary['p95']:>10.2f}"
+                  f"{summary['p99']:>10.2f}{summary['max']:>10.2f}")
+        else:
+            print(f"{name:<22}{'(no runs)':>10}")
+    print(f"Results written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
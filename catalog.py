@@ -0,0 +1,246 @@
+import threading
+import time
+
+from database import get_db_connection, db_errors, is_duplicate_key, register_schema
+
+# How often (seconds) a reader asks the database whether the catalog changed
+VERSION_CHECK_INTERVAL = 2.0
+
+CATALOG_COLUMNS = ("medicine_id, name, manufacturer, price, category, "
+                   "description, dosage, requires_prescription")
+
+
+def normalize_name(name):
+    """Key used for name lookups (MySQL compares names case-insensitively)"""
+    return name.strip().lower()
+
+
+def create_version_table(cursor):
+    """Schema hook: version stamps that let processes detect stale caches"""
+    cursor.execute(
+        """CREATE TABLE IF NOT EXISTS cache_versions (
+            name VARCHAR(64) PRIMARY KEY,
+            version BIGINT NOT NULL
+        )"""
+    )
+
+
+def bump_version(cursor, key):
+    """Advance a version stamp inside the writer's transaction; returns the new value"""
+    cursor.execute("UPDATE cache_versions SET version = version + 1 WHERE name = %s", (key,))
+    if cursor.rowcount == 0:
+        try:
+            cursor.execute("INSERT INTO cache_versions (name, version) VALUES (%s, 1)", (key,))
+        except db_errors() as db_error:
+            if not is_duplicate_key(db_error):
+                raise
+            # Created by another process in the meantime
+            cursor.execute("UPDATE cache_versions SET version = version + 1 WHERE name = %s", (key,))
+    cursor.execute("SELECT version FROM cache_versions WHERE name = %s", (key,))
+    row = cursor.fetchone()
+    return row['version'] if isinstance(row, dict) else row[0]
+
+
+def read_version(key):
+    """Current value of a version stamp (0 if it was never bumped)"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT version FROM cache_versions WHERE name = %s", (key,))
+        row = cursor.fetchone()
+        return row[0] if row else 0
+    finally:
+        cursor.close()
+        conn.close()
+
+
+class CatalogCache:
+    """Process-wide copy of the MEDICINES table, keyed by id and by name.
+
+    The whole table is loaded in one query the first time it is needed.
+    Every catalog write bumps a row in ``cache_versions`` inside its own
+    transaction. Readers compare that stamp with the loaded one at most
+    every VERSION_CHECK_INTERVAL seconds and reload when another process
+    has changed the catalog. Writes made in this process are applied to
+    the cache directly once they commit.
+    """
+
+    VERSION_KEY = "medicines"
+
+    def __init__(self, check_interval=VERSION_CHECK_INTERVAL):
+        self.check_interval = check_interval
+        self._by_id = {}
+        self._by_name = {}
+        self._version = None        # None = not loaded
+        self._checked_at = 0.0
+        self._generation = 0        # bumped by invalidate() and by each applied local write
+        # Guards the cache state and the order listeners hear about changes;
+        # never held for I/O. The dicts are replaced, not changed in place,
+        # so reads need no lock
+        self._state_lock = threading.Lock()
+        self._listeners = []
+
+    # ---------- reads ----------
+
+    def get_by_id(self, medicine_id):
+        """Medicine row for an ID, or None"""
+        self._ensure_fresh()
+        row = self._by_id.get(medicine_id)
+        return dict(row) if row else None
+
+    def get_by_name(self, name):
+        """Medicine row for a name (case-insensitive), or None"""
+        self._ensure_fresh()
+        row = self._by_name.get(normalize_name(name))
+        return dict(row) if row else None
+
+    def id_for_name(self, name):
+        """medicine_id for a name, or None"""
+        self._ensure_fresh()
+        row = self._by_name.get(normalize_name(name))
+        return row['medicine_id'] if row else None
+
+    def all(self):
+        """All medicines ordered by ID"""
+        self._ensure_fresh()
+        by_id = self._by_id
+        return [dict(by_id[key]) for key in sorted(by_id)]
+
+    def refresh(self):
+        """Reload now if another process changed the catalog (subject to the check interval)"""
+        self._ensure_fresh()
+
+    @property
+    def version(self):
+        return self._version
+
+    # ---------- writes ----------
+
+    def bump_version(self, cursor):
+        """Mark the catalog as changed; call on the writer's cursor before commit.
+
+        Returns the new version stamp to pass to after_write().
+        """
+        return bump_version(cursor, self.VERSION_KEY)
+
+    def subscribe(self, listener):
+        """Keep a derived structure in step with the catalog.
+
+        ``listener.catalog_reloaded(rows)`` is called after every full load
+        and ``listener.catalog_changed(medicine_id, row)`` for each committed
+        local write (row is None for a deleted medicine).
+        """
+        with self._state_lock:
+            self._listeners.append(listener)
+            if self._version is not None:
+                listener.catalog_reloaded(list(self._by_id.values()))
+
+    def after_write(self, version, *medicine_ids):
+        """Apply a committed write to the cache (write-through).
+
+        If some other write landed in between, the cache is reloaded on the
+        next read instead.
+        """
+        if self._version != version - 1:
+            self.invalidate()
+            return
+        rows = self._fetch(medicine_ids)
+        with self._state_lock:
+            # Another write or a reload landed while the rows were read
+            if self._version is None or self._version != version - 1:
+                self._version = None
+                self._generation += 1
+                return
+            by_id = dict(self._by_id)
+            by_name = dict(self._by_name)
+            for medicine_id in medicine_ids:
+                self._discard(by_id, by_name, medicine_id)
+            for row in rows:
+                self._store(by_id, by_name, row)
+            self._by_id = by_id
+            self._by_name = by_name
+            self._version = version
+            self._generation += 1
+            for medicine_id in medicine_ids:
+                for listener in self._listeners:
+                    listener.catalog_changed(medicine_id, by_id.get(medicine_id))
+
+    def invalidate(self):
+        """Make the next read reload the catalog.
+
+        Must not wait for a reload in progress: the caller may hold a pooled
+        connection that the reload is waiting for.
+        """
+        with self._state_lock:
+            self._version = None
+            self._generation += 1
+
+    # ---------- internals ----------
+
+    def _ensure_fresh(self):
+        now = time.monotonic()
+        if self._version is not None and now - self._checked_at < self.check_interval:
+            return
+        # Read outside the lock; two threads may both reload, which is harmless
+        with self._state_lock:
+            generation = self._generation
+            loaded = self._version
+        current = read_version(self.VERSION_KEY)
+        if current == loaded:
+            with self._state_lock:
+                if self._generation == generation:
+                    self._checked_at = now
+            return
+        self._load(current, generation, now)
+
+    def _load(self, version, generation, now):
+        """Bulk-load the whole catalog in one query"""
+        by_id = {}
+        by_name = {}
+        for row in self._fetch():
+            self._store(by_id, by_name, row)
+        with self._state_lock:
+            self._by_id = by_id
+            self._by_name = by_name
+            # Invalidated or written to while reading: keep the rows but reload next time
+            if self._generation == generation:
+                self._version = version
+                self._checked_at = now
+            else:
+                self._version = None
+            for listener in self._listeners:
+                listener.catalog_reloaded(list(by_id.values()))
+
+    def _fetch(self, medicine_ids=None):
+        query = f"SELECT {CATALOG_COLUMNS} FROM medicines"
+        params = ()
+        if medicine_ids is not None:
+            if not medicine_ids:
+                return []
+            query += f" WHERE medicine_id IN ({', '.join(['%s'] * len(medicine_ids))})"
+            params = tuple(medicine_ids)
+        conn = get_db_connection()
+        cursor = conn.cursor(dictionary=True)
+        try:
+            cursor.execute(query, params)
+            return cursor.fetchall()
+        finally:
+            cursor.close()
+            conn.close()
+
+    @staticmethod
+    def _store(by_id, by_name, row):
+        row['requires_prescription'] = bool(row['requires_prescription'])
+        by_id[row['medicine_id']] = row
+        by_name[normalize_name(row['name'])] = row
+
+    @staticmethod
+    def _discard(by_id, by_name, medicine_id):
+        row = by_id.pop(medicine_id, None)
+        if row:
+            by_name.pop(normalize_name(row['name']), None)
+
+
+register_schema(create_version_table)
+
+catalog = CatalogCache()
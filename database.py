@@ -1,9 +1,478 @@
-import mysql.connector
+import functools
+import os
+import random
+import re
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from datetime import date, datetime
+
+from backends import create_backend
+from instrumentation import InstrumentedCursor, query_stats
+from migrations import apply_migrations
+from prepared import statements
+
+# Storage backend: "mysql" for the shared server, "sqlite" for an embedded
+# single-machine database (load tests, CI benchmarks, offline terminals)
+DB_BACKEND = os.environ.get("PHARMACY_DB_BACKEND", "mysql")
+SQLITE_PATH = os.environ.get("PHARMACY_DB_PATH", "pharmacy.db")
+
+DB_CONFIG = {
+    "host": "localhost",
+    "user": "root",
+    "password": "saad2004",
+    "database": "pharmacy"
+}
+
+_FOR_UPDATE = re.compile(r"\s+FOR\s+UPDATE\s*$", re.IGNORECASE)
+
+# Pool settings
+POOL_SIZE = 8               # maximum open connections per process
+POOL_TIMEOUT = 10           # seconds to wait for a free connection
+MAX_LIFETIME = 1800         # seconds before a connection is retired
+HEALTH_CHECK_AFTER = 30     # ping idle connections older than this before reuse
+EXPLAIN_TIMEOUT = 0.5       # seconds to wait for a connection to capture a slow query's plan
+
+# Deadlock / lock timeout handling for @retry_on_deadlock operations
+DEADLOCK_RETRIES = 4        # reruns after the first attempt
+DEADLOCK_BACKOFF = 0.05     # seconds before the first rerun; doubles each time, with jitter
+
+
+class PoolTimeoutError(Exception):
+    """Raised when no connection becomes free within the pool timeout"""
+
+
+class StaleRowError(Exception):
+    """Raised when a row's version no longer matches the one an edit was based on.
+
+    Not retried: the user has to look at the current row and edit again.
+    """
+
+
+class PooledConnection:
+    """Connection borrowed from the pool.
+
+    Behaves like the underlying connection, except that close() hands it
+    back to the pool instead of closing the socket.
+    """
+
+    def __init__(self, pool, raw, created_at):
+        self._pool = pool
+        self._raw = raw
+        self._created_at = created_at
+
+    def __getattr__(self, name):
+        if self._raw is None:
+            raise AttributeError(f"Connection already returned to the pool ({name})")
+        return getattr(self._raw, name)
+
+    def is_connected(self):
+        return self._raw is not None and self._raw.is_connected()
+
+    def cursor(self, *args, **kwargs):
+        """A cursor on the underlying connection, timed by the query registry"""
+        if self._raw is None:
+            raise AttributeError("Connection already returned to the pool (cursor)")
+        return InstrumentedCursor(self._raw.cursor(*args, **kwargs), query_stats, self._raw)
+
+    def commit(self):
+        """Commit, then run the callbacks registered with after_commit()"""
+        if self._raw is None:
+            raise AttributeError("Connection already returned to the pool (commit)")
+        self._raw.commit()
+        for callback in _commit_hooks.pop(self._raw, ()):
+            callback()
+
+    def rollback(self):
+        """Roll back and drop the callbacks registered with after_commit()"""
+        if self._raw is None:
+            raise AttributeError("Connection already returned to the pool (rollback)")
+        _commit_hooks.pop(self._raw, None)
+        self._raw.rollback()
+
+    def close(self):
+        """Return the connection to the pool (safe to call more than once)"""
+        raw, self._raw = self._raw, None
+        if raw is not None:
+            _commit_hooks.pop(raw, None)
+            self._pool.checkin(raw, self._created_at)
+
+    def discard(self):
+        """Close the connection instead of returning it (e.g. with unread results)"""
+        raw, self._raw = self._raw, None
+        if raw is not None:
+            _commit_hooks.pop(raw, None)
+            self._pool._discard(raw)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None and self._raw is not None:
+            try:
+                self._raw.rollback()
+            except Exception:
+                pass
+        self.close()
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+class ConnectionPool:
+    """Bounded, thread-safe pool of database connections"""
+
+    def __init__(self, connect, size=POOL_SIZE, timeout=POOL_TIMEOUT,
+                 max_lifetime=MAX_LIFETIME, health_check_after=HEALTH_CHECK_AFTER):
+        self._connect = connect
+        self.size = size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.health_check_after = health_check_after
+        self._idle = deque()  # (raw, created_at, returned_at)
+        self._open = 0
+        self._waits = 0         # checkouts that had to wait for a free connection
+        self._wait_time = 0.0   # seconds spent waiting, in total
+        self._cond = threading.Condition()
+
+    def checkout(self, timeout=None):
+        """Borrow a connection, reusing a healthy idle one when possible"""
+        timeout = self.timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+
+        while True:
+            candidate = None
+            with self._cond:
+                if not self._idle and self._open >= self.size:
+                    waited_from = time.monotonic()
+                    try:
+                        while not self._idle and self._open >= self.size:
+                            remaining = deadline - time.monotonic()
+                            if remaining <= 0:
+                                raise PoolTimeoutError(
+                                    f"No database connection available after {timeout}s "
+                                    f"(pool size {self.size})")
+                            self._cond.wait(remaining)
+                    finally:
+                        self._waits += 1
+                        self._wait_time += time.monotonic() - waited_from
+
+                if self._idle:
+                    candidate = self._idle.pop()  # most recently used first
+                else:
+                    self._open += 1
+
+            if candidate is None:
+                try:
+                    raw = self._connect()
+                except Exception:
+                    self._release_slot()
+                    raise
+                return PooledConnection(self, raw, time.monotonic())
+
+            raw, created_at, returned_at = candidate
+            now = time.monotonic()
+            if now - created_at > self.max_lifetime:
+                self._discard(raw)
+                continue
+            if now - returned_at > self.health_check_after and not self._is_healthy(raw):
+                self._discard(raw)
+                continue
+            return PooledConnection(self, raw, created_at)
+
+    def checkin(self, raw, created_at):
+        """Take a connection back, discarding it if it is broken or too old"""
+        try:
+            # Never hand out a connection with a half-finished transaction
+            if getattr(raw, "in_transaction", False):
+                raw.rollback()
+        except Exception:
+            self._discard(raw)
+            return
+
+        if time.monotonic() - created_at > self.max_lifetime:
+            self._discard(raw)
+            return
+
+        with self._cond:
+            self._idle.append((raw, created_at, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self, timeout=None):
+        """Borrow a connection for the duration of a with-block"""
+        conn = self.checkout(timeout)
+        with conn:
+            yield conn
+
+    def close_all(self):
+        """Close every idle connection (borrowed ones close on checkin)"""
+        with self._cond:
+            idle, self._idle = list(self._idle), deque()
+        for raw, _, _ in idle:
+            self._discard(raw)
+
+    def stats(self):
+        with self._cond:
+            return {"size": self.size, "open": self._open, "idle": len(self._idle),
+                    "waits": self._waits, "wait_seconds": round(self._wait_time, 3)}
+
+    def _is_healthy(self, raw):
+        try:
+            return raw.is_connected()
+        except Exception:
+            return False
+
+    def _discard(self, raw):
+        statements.forget(raw)
+        try:
+            raw.close()
+        except Exception:
+            pass
+        self._release_slot()
+
+    def _release_slot(self):
+        with self._cond:
+            self._open -= 1
+            self._cond.notify()
+
+
+_backend = None
+_pool = None
+_pool_lock = threading.Lock()
+
+# Helper tables owned by other modules, created once per database
+_schema_hooks = []
+_schema_ready = False
+_schema_running = False
+_schema_lock = threading.RLock()
+
+# Driver connection -> callbacks to run after its open transaction commits
+_commit_hooks = {}
+
+
+def get_backend():
+    """Return the configured storage backend"""
+    global _backend
+    if _backend is None:
+        with _pool_lock:
+            if _backend is None:
+                _backend = create_backend(DB_BACKEND, DB_CONFIG, SQLITE_PATH)
+    return _backend
+
+
+def get_pool():
+    """Return the process-wide connection pool, creating it on first use"""
+    global _pool
+    if _pool is None:
+        backend = get_backend()
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(backend.connect)
+    if not _schema_ready:
+        _prepare_schema()
+    return _pool
+
+
+def register_schema(hook):
+    """Register ``hook(cursor)`` to create a module's helper tables.
+
+    Hooks run in one transaction the first time the pool is used, before any
+    caller gets a connection, so the tables never have to be created from
+    inside someone else's transaction. Must be idempotent.
+    """
+    _schema_hooks.append(hook)
+    if _schema_ready:
+        with transaction() as (conn, cursor):
+            hook(cursor)
+
+
+def _prepare_schema():
+    global _schema_ready, _schema_running
+    with _schema_lock:
+        if _schema_ready or _schema_running:
+            return
+        _schema_running = True
+        try:
+            with transaction() as (conn, cursor):
+                # Versioned core schema first, then the modules' helper tables
+                apply_migrations(cursor, get_backend())
+                for hook in list(_schema_hooks):
+                    hook(cursor)
+            _schema_ready = True
+        finally:
+            _schema_running = False
+
+
+def after_commit(cursor, callback):
+    """Run ``callback()`` once the transaction of the cursor's connection commits.
+
+    Dropped if it rolls back, or the connection goes back to the pool first.
+    Callbacks run on the committing thread while it still holds the
+    connection, so they must not borrow another one.
+    """
+    _commit_hooks.setdefault(cursor.connection, []).append(callback)
+
+
+def configure(backend=None, sqlite_path=None, **mysql_config):
+    """Switch backend at runtime (before any connection is borrowed)"""
+    global DB_BACKEND, SQLITE_PATH, _backend, _pool, _schema_ready
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close_all()
+        DB_BACKEND = backend or DB_BACKEND
+        SQLITE_PATH = sqlite_path or SQLITE_PATH
+        DB_CONFIG.update(mysql_config)
+        _backend = None
+        _pool = None
+        _schema_ready = False
+
+
+def db_errors():
+    """Driver exception classes of the active backend, for use in ``except``"""
+    return get_backend().errors
+
+
+def is_duplicate_key(error):
+    return get_backend().is_duplicate_key(error)
+
+
+def describe_error(error):
+    return get_backend().describe_error(error)
+
+
+_retry = threading.local()
+_retry_counts = Counter()
+_retry_counts_lock = threading.Lock()
+
+
+def is_retryable(error):
+    """True for errors that a rerun of the whole transaction can resolve"""
+    return isinstance(error, db_errors()) and get_backend().is_retryable(error)
+
+
+def will_retry(error):
+    """True if the surrounding @retry_on_deadlock call will rerun after ``error``.
+
+    Handlers that turn exceptions into messages re-raise in that case, so
+    only the last attempt's failure is reported (and counted as given up).
+    """
+    remaining = getattr(_retry, "remaining", None)
+    if remaining is None or not is_retryable(error):
+        return False
+    if remaining == 0:
+        _count("gave_up")
+    return remaining > 0
+
+
+def _count(outcome):
+    with _retry_counts_lock:
+        _retry_counts[outcome] += 1
+
+
+def retry_counts():
+    """{"retried": reruns, "gave_up": operations that failed after the last rerun}"""
+    with _retry_counts_lock:
+        return dict(_retry_counts)
+
+
+def retry_on_deadlock(func):
+    """Rerun a transactional operation after a deadlock or lock wait timeout.
+
+    The operation must open, commit and roll back its own transaction, so
+    a rerun starts from scratch. Reruns back off exponentially with jitter.
+    Nested decorated calls run once; the outermost call does the retrying.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if getattr(_retry, "remaining", None) is not None:
+            return func(*args, **kwargs)
+        try:
+            for attempt in range(DEADLOCK_RETRIES + 1):
+                _retry.remaining = DEADLOCK_RETRIES - attempt
+                try:
+                    return func(*args, **kwargs)
+                except Exception as error:
+                    if not is_retryable(error):
+                        raise
+                    if attempt == DEADLOCK_RETRIES:
+                        _count("gave_up")
+                        raise
+                    _count("retried")
+                time.sleep(DEADLOCK_BACKOFF * 2 ** attempt * random.uniform(0.5, 1.5))
+        finally:
+            _retry.remaining = None
+    return wrapper
+
+
+def as_date(value):
+    """Normalize a DATE value; aggregates come back as text on SQLite"""
+    if value is None or isinstance(value, date):
+        return value.date() if isinstance(value, datetime) else value
+    return date.fromisoformat(str(value)[:10])
+
+
+def explain(query, params=()):
+    """Return the engine's query plan rows for a statement"""
+    with pooled_connection() as conn:
+        cursor = conn.cursor(dictionary=True)
+        try:
+            cursor.execute(get_backend().explain_prefix + query, params)
+            return cursor.fetchall()
+        finally:
+            cursor.close()
+
+
+def _explain_slow_query(query, params):
+    """Plan rows for the slow-query log, or an error note; never raises"""
+    try:
+        conn = get_pool().checkout(timeout=EXPLAIN_TIMEOUT)
+    except Exception as e:
+        return f"plan unavailable: {e}"
+    try:
+        # Raw cursor: the EXPLAIN itself is not recorded. FOR UPDATE is
+        # dropped so the plan never takes locks next to the slow statement.
+        cursor = conn._raw.cursor(dictionary=True)
+        try:
+            cursor.execute(get_backend().explain_prefix + _FOR_UPDATE.sub("", query), params)
+            return cursor.fetchall()
+        finally:
+            cursor.close()
+    except Exception as e:
+        return f"plan unavailable: {e}"
+    finally:
+        conn.close()
+
+
+query_stats.explainer = _explain_slow_query
+
 
 def get_db_connection():
-    return mysql.connector.connect(
-        host="localhost",
-        user="root",
-        password="saad2004",
-        database="pharmacy"
-    )
+    """Borrow a pooled connection; call close() on it to give it back"""
+    return get_pool().checkout()
+
+
+@contextmanager
+def pooled_connection():
+    """Borrow a connection for a with-block; rolls back if the block raises"""
+    with get_pool().connection() as conn:
+        yield conn
+
+
+@contextmanager
+def transaction(dictionary=False):
+    """Run a with-block in one transaction, yielding (conn, cursor)"""
+    with get_pool().connection() as conn:
+        cursor = conn.cursor(dictionary=dictionary)
+        try:
+            yield conn, cursor
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
@@ -0,0 +1,209 @@
+# datagen.py
+import argparse
+import random
+import sys
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+import database
+from database import get_db_connection
+from catalog import catalog
+from sequences import allocate_ids
+from stock import stock_levels
+from search import search_index
+from predictor_rules import DEFAULT_CATEGORY_ADJUSTMENTS
+
+INSERT_CHUNK = 1000     # rows per executemany / commit
+
+_STEMS = ("Para", "Amox", "Ibu", "Cefa", "Metfor", "Lora", "Dexa", "Panto", "Azi", "Cipro",
+          "Salbu", "Omep", "Diclo", "Levo", "Gaba", "Ranit", "Fexo", "Mont", "Vita", "Zinco")
+_ENDINGS = ("cillin", "mol", "profen", "zole", "min", "tadine", "thro", "floxacin", "dine",
+            "lukast", "cort", "pril", "sartan", "statin", "cal", "vir")
+_MANUFACTURERS = ("GSK", "Abbott", "Pfizer", "Novartis", "Sanofi", "Getz Pharma", "Searle",
+                  "Hilton Pharma", "Martin Dow", "Bayer")
+_DOSAGES = ("250mg", "500mg", "5ml", "10mg", "20mg", "1g", "100mg")
+
+
+class SyntheticDataGenerator:
+    """Fills an (empty) database with a reproducible pharmacy data set.
+
+    The same seed, sizes and ``today`` always produce the same rows.
+    Medicines, suppliers and inventory batches describe the current stock;
+    prescriptions cover ``years`` of history ending ``today`` and are written
+    as history (they do not draw down the generated stock). IDs come from
+    the normal ID sequences, and the stock summary, catalog and search
+    caches are brought up to date at the end.
+    """
+
+    def __init__(self, seed=42, medicines=1000, suppliers=50, batches=20000, locations=40,
+                 years=2, prescriptions_per_day=100, max_lines=4):
+        self.seed = seed
+        self.medicines = medicines
+        self.suppliers = suppliers
+        self.batches = batches
+        self.locations = locations
+        self.years = years
+        self.prescriptions_per_day = prescriptions_per_day
+        self.max_lines = max_lines
+
+    def generate(self, today=None, progress=None):
+        """Generate and insert everything; returns {table: rows inserted}"""
+        rng = random.Random(self.seed)
+        today = today or date.today()
+        report = progress or (lambda message: None)
+        counts = {}
+
+        medicines = self._medicine_rows(rng)
+        counts["medicines"] = self._insert(
+            "medicines", "medicine_id, name, manufacturer, price, category, description, dosage, "
+            "requires_prescription", medicines)
+        report(f"{counts['medicines']} medicines")
+
+        suppliers = self._supplier_rows(rng)
+        counts["suppliers"] = self._insert("suppliers", "supplier_id, name, phone, email, address", suppliers)
+        report(f"{counts['suppliers']} suppliers")
+
+        batches = self._batch_rows(rng, medicines, suppliers, today)
+        counts["inventory"] = self._insert(
+            "inventory", "inventory_id, medicine_id, supplier_id, quantity_added, date_added, "
+            "batch_number, expiry_date, current_quantity, location", batches)
+        report(f"{counts['inventory']} inventory batches")
+
+        prescriptions, lines = self._prescription_rows(rng, medicines, today)
+        counts["prescriptions"] = self._insert("prescriptions", "prescription_id, date, total_amount",
+                                               prescriptions)
+        counts["prescription_medicines"] = self._insert(
+            "prescription_medicines", "prescription_id, medicine_id, quantity_bought, total_price", lines)
+        report(f"{counts['prescriptions']} prescriptions ({counts['prescription_medicines']} lines)")
+
+        self._refresh_derived()
+        return counts
+
+    # ---------- rows ----------
+
+    def _medicine_rows(self, rng):
+        categories = [category.title() for category in DEFAULT_CATEGORY_ADJUSTMENTS]
+        rows = []
+        for medicine_id, n in zip(allocate_ids("medicines", self.medicines), range(1, self.medicines + 1)):
+            name = f"{rng.choice(_STEMS)}{rng.choice(_ENDINGS)} {n}"
+            price = Decimal(rng.randint(50, 50000)) / 100
+            rows.append((medicine_id, name, rng.choice(_MANUFACTURERS), price, rng.choice(categories),
+                         f"Synthetic medicine {n}", rng.choice(_DOSAGES), rng.random() < 0.3))
+        return rows
+
+    def _supplier_rows(self, rng):
+        rows = []
+        for supplier_id, n in zip(allocate_ids("suppliers", self.suppliers), range(1, self.suppliers + 1)):
+            rows.append((supplier_id, f"Supplier {n}", f"+92300{n:07d}", f"supplier{n}@example.com",
+                         f"{rng.randint(1, 999)} Industrial Area, Block {rng.choice('ABCDEFGH')}"))
+        return rows
+
+    def _batch_rows(self, rng, medicines, suppliers, today):
+        locations = [f"Shelf {chr(ord('A') + i % 26)}{i // 26 + 1}" for i in range(max(self.locations, 1))]
+        rows = []
+        for inventory_id, n in zip(allocate_ids("inventory", self.batches), range(1, self.batches + 1)):
+            received = today - timedelta(days=rng.randint(0, 365))
+            expiry = received + timedelta(days=rng.randint(90, 1095))  # some already expired
+            quantity = rng.randint(10, 500)
+            current = rng.randint(0, quantity) if rng.random() < 0.8 else 0
+            rows.append((inventory_id, rng.choice(medicines)[0], rng.choice(suppliers)[0], quantity,
+                         datetime.combine(received, datetime.min.time()), f"BN{n:07d}", expiry, current,
+                         rng.choice(locations)))
+        return rows
+
+    def _prescription_rows(self, rng, medicines, today):
+        days = int(self.years * 365)
+        total = days * self.prescriptions_per_day
+        ids = allocate_ids("prescriptions", total)
+        prescriptions = []
+        lines = []
+        for i, prescription_id in enumerate(ids):
+            prescribed_on = today - timedelta(days=days - 1 - i // max(self.prescriptions_per_day, 1))
+            amount = Decimal("0.00")
+            for medicine in rng.sample(medicines, min(rng.randint(1, self.max_lines), len(medicines))):
+                quantity = rng.randint(1, 5)
+                line_total = medicine[3] * quantity
+                amount += line_total
+                lines.append((prescription_id, medicine[0], quantity, line_total))
+            prescriptions.append((prescription_id, prescribed_on, amount))
+        return prescriptions, lines
+
+    # ---------- database ----------
+
+    @staticmethod
+    def _insert(table, columns, rows):
+        placeholders = ", ".join(["%s"] * len(columns.split(",")))
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        try:
+            for start in range(0, len(rows), INSERT_CHUNK):
+                cursor.executemany(f"INSERT INTO {table} ({columns}) VALUES ({placeholders})",
+                                   rows[start:start + INSERT_CHUNK])
+                conn.commit()
+            return len(rows)
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+            conn.close()
+
+    @staticmethod
+    def _refresh_derived():
+        """Rebuild the stock summary and make every terminal reload its caches"""
+        stock_levels.reconcile(fix=True)
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        try:
+            catalog.bump_version(cursor)
+            search_index.bump_batches(cursor)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+            conn.close()
+        catalog.invalidate()
+        search_index.invalidate_batches()
+
+
+def add_database_arguments(parser):
+    """--sqlite PATH selects the embedded backend; otherwise the configured MySQL is used"""
+    parser.add_argument("--sqlite", metavar="PATH",
+                        help="use an embedded SQLite database file instead of MySQL")
+
+
+def configure_database(args):
+    if args.sqlite:
+        database.configure(backend="sqlite", sqlite_path=args.sqlite)
+
+
+def main(argv=None):
+    """python datagen.py [--sqlite PATH] [--seed N] [--medicines N] ..."""
+    parser = argparse.ArgumentParser(description="Load a reproducible synthetic pharmacy data set")
+    add_database_arguments(parser)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--medicines", type=int, default=1000)
+    parser.add_argument("--suppliers", type=int, default=50)
+    parser.add_argument("--batches", type=int, default=20000)
+    parser.add_argument("--locations", type=int, default=40)
+    parser.add_argument("--years", type=float, default=2)
+    parser.add_argument("--prescriptions-per-day", type=int, default=100)
+    parser.add_argument("--today", type=date.fromisoformat, metavar="YYYY-MM-DD",
+                        help="date the generated history ends on (default: the current date); "
+                             "pin it to reproduce a data set exactly")
+    args = parser.parse_args(argv)
+    configure_database(args)
+
+    generator = SyntheticDataGenerator(
+        seed=args.seed, medicines=args.medicines, suppliers=args.suppliers, batches=args.batches,
+        locations=args.locations, years=args.years, prescriptions_per_day=args.prescriptions_per_day
+    )
+    counts = generator.generate(today=args.today, progress=print)
+    print("Done: " + ", ".join(f"{count} {table}" for table, count in counts.items()))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
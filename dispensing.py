@@ -0,0 +1,224 @@
+from datetime import date, timedelta
+
+from sequences import next_id_in
+from stock import stock_levels
+from search import search_index
+from prepared import statements
+
+FIFO_BATCHES = statements.register("fifo_batches", """
+    SELECT inventory_id, medicine_id, current_quantity
+    FROM INVENTORY
+    WHERE medicine_id IN ({list}) AND current_quantity > 0
+    ORDER BY medicine_id, expiry_date, date_added, inventory_id
+    FOR UPDATE""")
+FIFO_DEDUCT = statements.register("fifo_deduct", """
+    UPDATE INVENTORY
+    SET current_quantity = current_quantity - CASE inventory_id {cases} END,
+        row_version = row_version + 1
+    WHERE inventory_id IN ({list})""")
+NEWEST_BATCH = statements.register("newest_batch", """
+    SELECT inventory_id FROM INVENTORY WHERE medicine_id = %s ORDER BY date_added DESC LIMIT 1""")
+RESTOCK_BATCH = statements.register("restock_batch", """
+    UPDATE INVENTORY SET current_quantity = current_quantity + %s, row_version = row_version + 1
+    WHERE inventory_id = %s""")
+ADD_TO_DISPENSED = statements.register("add_to_dispensed", """
+    UPDATE prescription_batches SET quantity = quantity + %s
+    WHERE prescription_id = %s AND medicine_id = %s AND inventory_id = %s""")
+DISPENSED_FOR_LINE = statements.register("dispensed_for_line", """
+    SELECT pb.inventory_id, pb.quantity
+    FROM prescription_batches pb LEFT JOIN INVENTORY i ON i.inventory_id = pb.inventory_id
+    WHERE pb.prescription_id = %s AND pb.medicine_id = %s
+    ORDER BY i.expiry_date DESC, i.date_added DESC, pb.inventory_id DESC""")
+INSERT_DISPENSED = """INSERT INTO prescription_batches
+    (prescription_id, medicine_id, inventory_id, quantity) VALUES (%s, %s, %s, %s)"""
+
+
+class InsufficientStockError(Exception):
+    """Raised when a basket asks for more units than the batches hold"""
+
+    def __init__(self, medicine_id, requested, available):
+        self.medicine_id = medicine_id
+        self.requested = requested
+        self.available = available
+        super().__init__(
+            f"Not enough stock for medicine {medicine_id}: "
+            f"requested {requested}, available {available}")
+
+
+class FifoDispenser:
+    """FIFO batch deduction for a whole basket in one pass.
+
+    All methods work on the caller's cursor, so the deduction is part of the
+    caller's transaction. The batch read uses SELECT ... FOR UPDATE, so the
+    rows stay locked until that transaction commits or rolls back; they are
+    locked in (medicine_id, FIFO) order, the order every writer of batch rows
+    follows, so two baskets can wait on each other but not deadlock. Stock
+    is checked on the locked rows, never on an earlier unlocked read.
+    """
+
+    @staticmethod
+    def plan(cursor, basket):
+        """Compute the batch-level allocation for (medicine_id, qty) pairs.
+
+        Returns a list of {"medicine_id", "inventory_id", "quantity"} dicts in
+        FIFO order (soonest expiry, then oldest delivery). Raises
+        InsufficientStockError if any medicine cannot be covered.
+        """
+        wanted = {}
+        for medicine_id, qty in basket:
+            if qty <= 0:
+                raise ValueError(f"Quantity must be positive (medicine {medicine_id})")
+            wanted[medicine_id] = wanted.get(medicine_id, 0) + qty
+        if not wanted:
+            return []
+
+        medicine_ids = sorted(wanted)
+        batches = statements.fetchall(cursor, FIFO_BATCHES, medicine_ids, arity=len(medicine_ids))
+
+        allocation = []
+        remaining = dict(wanted)
+        available = {medicine_id: 0 for medicine_id in wanted}
+        for inventory_id, medicine_id, batch_qty in batches:
+            available[medicine_id] += batch_qty
+            take = min(remaining[medicine_id], batch_qty)
+            if take:
+                allocation.append({
+                    "medicine_id": medicine_id,
+                    "inventory_id": inventory_id,
+                    "quantity": take
+                })
+                remaining[medicine_id] -= take
+
+        for medicine_id in medicine_ids:
+            if remaining[medicine_id]:
+                raise InsufficientStockError(medicine_id, wanted[medicine_id], available[medicine_id])
+        return allocation
+
+    @staticmethod
+    def apply(cursor, allocation):
+        """Apply an allocation plan with a single set-based UPDATE"""
+        if not allocation:
+            return
+        params = []
+        for item in allocation:
+            params.extend((item["inventory_id"], item["quantity"]))
+        params.extend(item["inventory_id"] for item in allocation)
+        statements.run(cursor, FIFO_DEDUCT, params, arity=len(allocation))
+
+        deltas = {}
+        for item in allocation:
+            deltas[item["medicine_id"]] = deltas.get(item["medicine_id"], 0) - item["quantity"]
+        stock_levels.record(cursor, deltas)
+
+    @staticmethod
+    def locked_stock(cursor, medicine_id):
+        """Lock a medicine's batches and return the units they hold.
+
+        Takes the same row locks as ``plan``, in the same order, so the
+        count stays true until the caller's transaction ends.
+        """
+        batches = statements.fetchall(cursor, FIFO_BATCHES, [medicine_id], arity=1)
+        return sum(batch_qty for _, _, batch_qty in batches)
+
+    @classmethod
+    def dispense(cls, cursor, basket):
+        """Plan and apply FIFO deductions for a basket; returns the allocation"""
+        allocation = cls.plan(cursor, basket)
+        cls.apply(cursor, allocation)
+        return allocation
+
+    @staticmethod
+    def record_allocation(cursor, prescription_id, allocation, new=False):
+        """Persist which batches a prescription's units were drawn from.
+
+        ``new`` is for a prescription created in this transaction: its rows
+        are inserted with one executemany. Otherwise units drawn again from
+        a batch already on record are added to that row.
+        """
+        if not allocation:
+            return
+        rows = [(prescription_id, item["medicine_id"], item["inventory_id"], item["quantity"])
+                for item in allocation]
+        if not new:
+            rows = [row for row in rows
+                    if statements.run(cursor, ADD_TO_DISPENSED, (row[3],) + row[:3]) == 0]
+        if rows:
+            cursor.executemany(INSERT_DISPENSED, rows)
+
+    @staticmethod
+    def release_allocation(cursor, prescription_id, medicine_id, quantity=None):
+        """Take returned units off a line's batch record.
+
+        Units come off the batch FIFO drew from last (latest expiry) first;
+        without ``quantity`` the line's whole record is dropped. Returns the
+        (inventory_id, units) taken off, in that order, for ``restock``.
+        """
+        recorded = statements.fetchall(cursor, DISPENSED_FOR_LINE, (prescription_id, medicine_id))
+        if quantity is None:
+            cursor.execute(
+                "DELETE FROM prescription_batches WHERE prescription_id = %s AND medicine_id = %s",
+                (prescription_id, medicine_id)
+            )
+            return [(inventory_id, dispensed) for inventory_id, dispensed in recorded]
+        released = []
+        deletes = []
+        updates = []
+        for inventory_id, dispensed in recorded:
+            if quantity <= 0:
+                break
+            take = min(quantity, dispensed)
+            if take == dispensed:
+                deletes.append((prescription_id, medicine_id, inventory_id))
+            else:
+                updates.append((dispensed - take, prescription_id, medicine_id, inventory_id))
+            released.append((inventory_id, take))
+            quantity -= take
+        if deletes:
+            cursor.executemany(
+                "DELETE FROM prescription_batches WHERE prescription_id = %s AND medicine_id = %s AND inventory_id = %s",
+                deletes
+            )
+        if updates:
+            cursor.executemany(
+                """UPDATE prescription_batches SET quantity = %s
+                WHERE prescription_id = %s AND medicine_id = %s AND inventory_id = %s""",
+                updates
+            )
+        return released
+
+    @staticmethod
+    def restock(cursor, medicine_id, quantity, batch_number, released=()):
+        """Put returned units back on the batches they were dispensed from.
+
+        ``released`` is what release_allocation took off the line's record,
+        so the batches and the record move together. Units it does not
+        cover (lines sold before batches were recorded, or batches deleted
+        since) go on the newest batch, or a new one if none exist.
+        """
+        remaining = quantity
+        # release_allocation lists the latest expiry first; put units back in
+        # FIFO order, the order every writer of batch rows locks them in
+        for inventory_id, units in reversed(released):
+            units = min(units, remaining)
+            if units and statements.run(cursor, RESTOCK_BATCH, (units, inventory_id)):
+                remaining -= units
+
+        if remaining:
+            batch = statements.fetchone(cursor, NEWEST_BATCH, (medicine_id,))
+            if batch:
+                statements.run(cursor, RESTOCK_BATCH, (remaining, batch[0]))
+            else:
+                # The caller holds the prescription and batch locks, so take the
+                # ID through its cursor rather than a connection of its own.
+                # Returned units have no supplier
+                cursor.execute(
+                    """INSERT INTO INVENTORY
+                    (inventory_id, medicine_id, quantity_added, current_quantity, batch_number, expiry_date)
+                    VALUES (%s, %s, %s, %s, %s, %s)""",
+                    (next_id_in(cursor, "inventory"), medicine_id, remaining, remaining, batch_number,
+                     date.today() + timedelta(days=365))
+                )
+                # Committed by the caller, so let the search index reload the batches
+                search_index.bump_batches(cursor)
+                search_index.invalidate_batches()
+        stock_levels.record(cursor, {medicine_id: quantity})
@@ -0,0 +1,288 @@
+# instrumentation.py
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime
+from functools import lru_cache
+
+# Turn the cursor wrapper off with PHARMACY_INSTRUMENT_QUERIES=0
+INSTRUMENT_QUERIES = os.environ.get("PHARMACY_INSTRUMENT_QUERIES", "1") != "0"
+# Statements slower than this (milliseconds) go to the slow-query log
+SLOW_QUERY_MS = float(os.environ.get("PHARMACY_SLOW_QUERY_MS", "100"))
+# Optional JSON-lines file the slow-query log is also appended to
+SLOW_QUERY_LOG = os.environ.get("PHARMACY_SLOW_QUERY_LOG")
+SLOW_LOG_SIZE = 200         # slow statements kept in memory
+
+LATENCY_BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+# Frames from these modules are plumbing, not the code that issued the query
+_PLUMBING = {__name__, "database", "backends", "streaming", "paging", "contextlib", "threading"}
+CALLER_DEPTH = 2            # application frames recorded per statement
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\bin\s*\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_VALUES_LIST = re.compile(r"\bvalues\s*(\(\s*\?(?:\s*,\s*\?)*\s*\))(?:\s*,\s*\(\s*\?(?:\s*,\s*\?)*\s*\))*")
+_EXPLAINABLE = ("select", "update", "delete", "insert", "replace", "with")
+_READS = ("select", "with", "explain", "show", "pragma")
+
+
+@lru_cache(maxsize=4096)
+def fingerprint(query):
+    """Normalized statement text: literals and placeholders become ?, IN lists
+    and multi-row VALUES collapse, whitespace and case are folded"""
+    text = " ".join(query.split()).lower()
+    text = text.replace("%s", "?")
+    text = _LITERALS.sub("?", text)
+    text = _IN_LIST.sub("in (...)", text)
+    return _VALUES_LIST.sub(r"values \1", text)
+
+
+def caller(depth=CALLER_DEPTH):
+    """'module.function:line' of the nearest application frames, innermost first"""
+    frames = []
+    frame = sys._getframe(1)
+    while frame is not None and len(frames) < depth:
+        module = frame.f_globals.get("__name__", "?")
+        if module not in _PLUMBING:
+            code = frame.f_code
+            frames.append(f"{module}.{getattr(code, 'co_qualname', code.co_name)}:{frame.f_lineno}")
+        frame = frame.f_back
+    return " < ".join(frames) or "?"
+
+
+class QueryHistogram:
+    """Call count, latency histogram, rows and callers for one fingerprint"""
+
+    def __init__(self, fingerprint):
+        self.fingerprint = fingerprint
+        self.calls = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.rows = 0
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.callers = Counter()
+
+    def record(self, elapsed_ms, rows, where, failed):
+        self.calls += 1
+        self.errors += failed
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        self.rows += rows
+        self.buckets[_bucket(elapsed_ms)] += 1
+        self.callers[where] += 1
+
+    def percentile(self, p):
+        """Upper bound of the bucket holding the p-th percentile (max for the last bucket)"""
+        if not self.calls:
+            return None
+        rank = self.calls * p / 100
+        seen = 0
+        for i, count in enumerate(self.buckets):
+            seen += count
+            if seen >= rank and count:
+                return LATENCY_BUCKETS_MS[i] if i < len(LATENCY_BUCKETS_MS) else self.max_ms
+        return self.max_ms
+
+    def as_dict(self):
+        return {
+            "fingerprint": self.fingerprint,
+            "calls": self.calls,
+            "errors": self.errors,
+            "total_ms": round(self.total_ms, 3),
+            "mean_ms": round(self.total_ms / self.calls, 3) if self.calls else None,
+            "p50_ms": self.percentile(50),
+            "p95_ms": self.percentile(95),
+            "p99_ms": self.percentile(99),
+            "max_ms": round(self.max_ms, 3),
+            "rows": self.rows,
+            "callers": dict(self.callers.most_common(5)),
+        }
+
+
+def _bucket(elapsed_ms):
+    for i, bound in enumerate(LATENCY_BUCKETS_MS):
+        if elapsed_ms <= bound:
+            return i
+    return len(LATENCY_BUCKETS_MS)
+
+
+class QueryStats:
+    """In-process registry of per-statement timings plus the slow-query log.
+
+    ``explainer(query, params)`` is installed by database.py; it returns the
+    engine's plan rows and is called once per slow fingerprint.
+    """
+
+    def __init__(self, slow_ms=SLOW_QUERY_MS, log_path=SLOW_QUERY_LOG, enabled=INSTRUMENT_QUERIES):
+        self.enabled = enabled
+        self.slow_ms = slow_ms
+        self.log_path = log_path
+        self.explainer = None
+        self._histograms = {}
+        self._plans = {}            # fingerprint -> captured plan
+        self._slow = deque(maxlen=SLOW_LOG_SIZE)
+        self._lock = threading.Lock()
+
+    def record(self, query, params, elapsed, rows, where, failed=False):
+        """Add one statement: elapsed seconds, rows read or changed, calling code"""
+        key = fingerprint(query)
+        elapsed_ms = elapsed * 1000
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = QueryHistogram(key)
+            histogram.record(elapsed_ms, rows, where, failed)
+        if elapsed_ms >= self.slow_ms and not failed:
+            self._log_slow(key, query, params, elapsed_ms, rows, where)
+
+    def snapshot(self, limit=None):
+        """Per-fingerprint aggregates, most total time first"""
+        with self._lock:
+            rows = [histogram.as_dict() for histogram in self._histograms.values()]
+        rows.sort(key=lambda row: row["total_ms"], reverse=True)
+        return rows[:limit] if limit else rows
+
+    def slow_queries(self):
+        """The most recent slow statements, oldest first"""
+        with self._lock:
+            return list(self._slow)
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._plans.clear()
+            self._slow.clear()
+
+    def report(self, limit=20):
+        """Text table of the statements with the most total time"""
+        lines = [f"{'Calls':>7}{'Total ms':>11}{'Mean':>9}{'p95':>9}{'Rows':>9}  Statement / top caller"]
+        for row in self.snapshot(limit):
+            lines.append(f"{row['calls']:>7}{row['total_ms']:>11.1f}{row['mean_ms']:>9.2f}"
+                         f"{row['p95_ms']:>9.2f}{row['rows']:>9}  {row['fingerprint'][:100]}")
+            if row["callers"]:
+                lines.append(f"{'':>45}  <- {next(iter(row['callers']))}")
+        return "\n".join(lines)
+
+    def _log_slow(self, key, query, params, elapsed_ms, rows, where):
+        with self._lock:
+            captured = key in self._plans
+            plan = self._plans.get(key)
+        if not captured and self.explainer is not None and query.lstrip().lower().startswith(_EXPLAINABLE):
+            plan = self.explainer(query, params)
+            with self._lock:
+                self._plans[key] = plan
+        entry = {
+            "at": datetime.now().isoformat(timespec="milliseconds"),
+            "elapsed_ms": round(elapsed_ms, 3),
+            "rows": rows,
+            "caller": where,
+            "fingerprint": key,
+            "plan": plan,
+        }
+        with self._lock:
+            self._slow.append(entry)
+        if self.log_path:
+            try:
+                with open(self.log_path, "a", encoding="utf-8") as handle:
+                    handle.write(json.dumps(entry, default=str) + "\n")
+            except OSError:
+                pass
+
+
+class InstrumentedCursor:
+    """Cursor wrapper that times statements and counts their rows.
+
+    Writes are recorded as soon as execute() returns. A read is recorded
+    once its result has been consumed (or the cursor is reused or closed),
+    so its latency includes the fetches and its row count is known.
+    ``connection`` is the driver connection the cursor belongs to.
+    """
+
+    def __init__(self, cursor, stats, connection=None):
+        self._cursor = cursor
+        self._stats = stats
+        self._pending = None        # [query, params, elapsed, rows, caller] of an open read
+        self.connection = connection
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def execute(self, query, params=()):
+        return self._run(self._cursor.execute, query, params, params)
+
+    def executemany(self, query, seq_of_params):
+        seq_of_params = list(seq_of_params)
+        return self._run(self._cursor.executemany, query, seq_of_params,
+                         seq_of_params[0] if seq_of_params else ())
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = self._cursor.fetchone()
+        self._fetched(time.perf_counter() - start, row is not None, done=row is None)
+        return row
+
+    def fetchmany(self, *args, **kwargs):
+        start = time.perf_counter()
+        rows = self._cursor.fetchmany(*args, **kwargs)
+        self._fetched(time.perf_counter() - start, len(rows), done=not rows)
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = self._cursor.fetchall()
+        self._fetched(time.perf_counter() - start, len(rows), done=True)
+        return rows
+
+    def __iter__(self):
+        rows = iter(self._cursor)
+        while True:
+            start = time.perf_counter()
+            row = next(rows, None)
+            self._fetched(time.perf_counter() - start, row is not None, done=row is None)
+            if row is None:
+                return
+            yield row
+
+    def close(self):
+        self._finish()
+        return self._cursor.close()
+
+    def _run(self, method, query, args, params):
+        self._finish()
+        if not self._stats.enabled:
+            return method(query, args)
+        where = caller()
+        start = time.perf_counter()
+        try:
+            result = method(query, args)
+        except Exception:
+            self._stats.record(query, params, time.perf_counter() - start, 0, where, failed=True)
+            raise
+        elapsed = time.perf_counter() - start
+        if query.lstrip()[:8].lower().startswith(_READS):
+            self._pending = [query, params, elapsed, 0, where]
+        else:
+            rowcount = getattr(self._cursor, "rowcount", -1)
+            self._stats.record(query, params, elapsed, max(rowcount or 0, 0), where)
+        return result
+
+    def _fetched(self, elapsed, rows, done):
+        pending = self._pending
+        if pending is not None:
+            pending[2] += elapsed
+            pending[3] += rows
+            if done:
+                self._finish()
+
+    def _finish(self):
+        pending, self._pending = self._pending, None
+        if pending is not None:
+            self._stats.record(*pending)
+
+
+query_stats = QueryStats()
@@ -1,34 +1,59 @@
 from datetime import datetime, timedelta
-from database import get_db_connection
+from database import (get_db_connection, db_errors, is_duplicate_key, describe_error, as_date,
+                      retry_on_deadlock, will_retry)
 from medicines import Medicine
-import mysql.connector
+from sequences import next_id
+from stock import stock_levels
+from search import search_index
+from paging import DEFAULT_PAGE_SIZE, fetch_keyset_page
+from streaming import ReportStream, batch_summary, count_batch
+from prepared import statements
 
-class PharmacyInventory:
-    def __init__(self):
-        self.conn = get_db_connection()
-        self.cursor = self.conn.cursor(dictionary=True)
+# Sort key of the inventory listing; also what its page tokens hold
+INVENTORY_PAGE_KEYS = ("expiry_date", "inventory_id")
+
+MEDICINE_EXISTS = statements.register("medicine_exists", "SELECT 1 FROM medicines WHERE medicine_id = %s")
+SUPPLIER_EXISTS = statements.register("supplier_exists", "SELECT 1 FROM suppliers WHERE supplier_id = %s")
+LOCK_BATCH = statements.register("lock_batch", """
+    SELECT medicine_id, current_quantity, row_version FROM inventory WHERE inventory_id = %s FOR UPDATE""")
+LOCK_TRANSFER_SOURCE = statements.register("lock_transfer_source", """
+    SELECT current_quantity, medicine_id, supplier_id, batch_number, expiry_date
+    FROM inventory WHERE inventory_id = %s FOR UPDATE""")
+INSERT_BATCH = statements.register("insert_batch", """
+    INSERT INTO inventory (inventory_id, medicine_id, supplier_id, quantity_added, date_added,
+                           batch_number, expiry_date, current_quantity, location)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)""")
+SET_BATCH_QUANTITY = statements.register("set_batch_quantity", """
+    UPDATE inventory SET current_quantity = %s, row_version = row_version + 1 WHERE inventory_id = %s""")
+TAKE_FROM_BATCH = statements.register("take_from_batch", """
+    UPDATE inventory SET current_quantity = current_quantity - %s, row_version = row_version + 1
+    WHERE inventory_id = %s""")
 
-    def _get_next_inventory_id(self):
-        """Manually get the next available inventory ID"""
-        self.cursor.execute("SELECT MAX(inventory_id) FROM inventory")
-        result = self.cursor.fetchone()
-        return (result['MAX(inventory_id)'] or 0) + 1
+STALE_BATCH_MESSAGE = "This batch was changed at another terminal; reload it and try again"
+
+class PharmacyInventory:
+    """Inventory operations; each call borrows a connection from the pool"""
 
+    @retry_on_deadlock
     def add_inventory_item(self, medicine_id, supplier_id, quantity_added, batch_number, expiry_date, location):
-        """Add new inventory item with manual ID generation matching the table structure"""
+        """Add new inventory item with an allocated ID matching the table structure"""
+        # Take the next ID from this terminal's reserved block before borrowing
+        # a connection: reserving a fresh block needs a pooled connection of its
+        # own, and a busy pool must not wait on itself
+        inventory_id = next_id("inventory")
+        conn = get_db_connection()
+        cursor = conn.cursor(dictionary=True)
         try:
             # Validate quantity
             if quantity_added <= 0:
                 return {"success": False, "message": "Quantity must be positive"}
 
             # Check medicine exists
-            self.cursor.execute("SELECT 1 FROM medicines WHERE medicine_id = %s", (medicine_id,))
-            if not self.cursor.fetchone():
+            if not statements.fetchone(cursor, MEDICINE_EXISTS, (medicine_id,)):
                 return {"success": False, "message": f"Medicine ID {medicine_id} not found"}
 
             # Validate supplier exists
-            self.cursor.execute("SELECT 1 FROM suppliers WHERE supplier_id = %s", (supplier_id,))
-            if not self.cursor.fetchone():
+            if not statements.fetchone(cursor, SUPPLIER_EXISTS, (supplier_id,)):
                 return {"success": False, "message": f"Supplier ID {supplier_id} not found"}
 
             # Validate expiry date
@@ -39,36 +64,24 @@ class PharmacyInventory:
             except ValueError:
                 return {"success": False, "message": "Invalid date format. Use YYYY-MM-DD"}
 
-            # Manually generate the next ID
-            inventory_id = self._get_next_inventory_id()
-
             # Insert new record matching your table structure exactly
-            query = """
-            INSERT INTO inventory (
-                inventory_id,
-                medicine_id,
-                supplier_id,
-                quantity_added,
-                date_added,
-                batch_number,
-                expiry_date,
-                current_quantity,
-                location
-            ) VALUES (%s, %s, %s, %s, NOW(), %s, %s, %s, %s)
-            """
             params = (
                 inventory_id,
                 medicine_id,
                 supplier_id,
                 quantity_added,
+                datetime.now(),
                 batch_number,
                 expiry_date,
                 quantity_added,  # current_quantity starts same as quantity_added
                 location
             )
 
-            self.cursor.execute(query, params)
-            self.conn.commit()
+            statements.run(cursor, INSERT_BATCH, params)
+            stock_levels.record(cursor, {medicine_id: quantity_added})
+            version = search_index.bump_batches(cursor)
+            conn.commit()
+            search_index.batch_added(version, inventory_id, medicine_id, batch_number, location)
 
             return {
                 "success": True,
@@ -83,29 +96,58 @@ class PharmacyInventory:
                 }
             }
 
-        except mysql.connector.Error as db_error:
-            self.conn.rollback()
-            error_msg = f"Database error ({db_error.errno}): {db_error.msg}"
-            if db_error.errno == 1062:  # Duplicate entry
+        except db_errors() as db_error:
+            conn.rollback()
+            if will_retry(db_error):
+                raise
+            error_msg = describe_error(db_error)
+            if is_duplicate_key(db_error):
                 error_msg = "Inventory ID or batch number already exists"
             return {"success": False, "message": error_msg}
         except Exception as e:
-            self.conn.rollback()
+            conn.rollback()
             return {"success": False, "message": f"Unexpected error: {str(e)}"}
+        finally:
+            cursor.close()
+            conn.close()
 
-    def update_inventory_quantity(self, inventory_id, new_quantity):
-        """Update current quantity of an inventory item"""
+    @retry_on_deadlock
+    def update_inventory_quantity(self, inventory_id, new_quantity, expected_version=None):
+        """Update current quantity of an inventory item
+
+        ``expected_version`` is the batch's row_version when it was shown to
+        the user; if the batch has changed since, nothing is written and the
+        result has "conflict": True.
+        """
+        if new_quantity < 0:
+            return {"success": False, "message": "Quantity cannot be negative"}
+        conn = get_db_connection()
+        cursor = conn.cursor(dictionary=True)
         try:
-            query = "UPDATE inventory SET current_quantity = %s WHERE inventory_id = %s"
-            self.cursor.execute(query, (new_quantity, inventory_id))
-            self.conn.commit()
+            item = statements.fetchone(cursor, LOCK_BATCH, (inventory_id,))
+            if not item:
+                return {"success": False, "message": f"Inventory ID {inventory_id} not found"}
+
+            medicine_id, current_quantity, row_version = item
+            if expected_version is not None and row_version != expected_version:
+                return {"success": False, "message": STALE_BATCH_MESSAGE, "conflict": True}
+            statements.run(cursor, SET_BATCH_QUANTITY, (new_quantity, inventory_id))
+            stock_levels.record(cursor, {medicine_id: new_quantity - current_quantity})
+            conn.commit()
             return {"success": True, "message": "Quantity updated successfully"}
         except Exception as e:
-            self.conn.rollback()
+            conn.rollback()
+            if will_retry(e):
+                raise
             return {"success": False, "message": f"Error updating quantity: {str(e)}"}
+        finally:
+            cursor.close()
+            conn.close()
 
     def get_low_stock_items(self, threshold=10):
         """Get items with current quantity below threshold"""
+        conn = get_db_connection()
+        cursor = conn.cursor(dictionary=True)
         try:
             query = """
             SELECT i.*, m.name as medicine_name 
@@ -113,102 +155,147 @@ class PharmacyInventory:
             JOIN medicines m ON i.medicine_id = m.medicine_id
             WHERE i.current_quantity < %s
             """
-            self.cursor.execute(query, (threshold,))
-            return self.cursor.fetchall()
+            cursor.execute(query, (threshold,))
+            return cursor.fetchall()
         except Exception as e:
             return {"error": f"Error fetching low stock items: {str(e)}"}
+        finally:
+            cursor.close()
+            conn.close()
+
+    def stream_low_stock_items(self, threshold=10):
+        """Streaming get_low_stock_items(): a ReportStream with a batch summary"""
+        return ReportStream(
+            """SELECT i.*, m.name as medicine_name
+               FROM inventory i
+               JOIN medicines m ON i.medicine_id = m.medicine_id
+               WHERE i.current_quantity < %s""",
+            (threshold,), accumulate=count_batch, summary=batch_summary()
+        )
 
     def get_expiring_soon(self, days=30):
         """Get items expiring within specified days"""
+        conn = get_db_connection()
+        cursor = conn.cursor(dictionary=True)
         try:
-            expiry_date = datetime.now().date() + timedelta(days=days)
+            today = datetime.now().date()
+            expiry_date = today + timedelta(days=days)
             query = """
-            SELECT i.*, m.name as medicine_name, DATEDIFF(i.expiry_date, CURDATE()) as days_until_expiry
+            SELECT i.*, m.name as medicine_name
             FROM inventory i
             JOIN medicines m ON i.medicine_id = m.medicine_id
-            WHERE i.expiry_date BETWEEN CURDATE() AND %s
+            WHERE i.expiry_date BETWEEN %s AND %s
             ORDER BY i.expiry_date ASC
             """
-            self.cursor.execute(query, (expiry_date,))
-            return self.cursor.fetchall()
+            cursor.execute(query, (today, expiry_date))
+            items = cursor.fetchall()
+            for item in items:
+                item['days_until_expiry'] = (item['expiry_date'] - today).days
+            return items
         except Exception as e:
             return {"error": f"Error fetching expiring items: {str(e)}"}
+        finally:
+            cursor.close()
+            conn.close()
+
+    def stream_expiring_soon(self, days=30):
+        """Streaming get_expiring_soon(): a ReportStream with a batch summary"""
+        today = datetime.now().date()
+
+        def prepare(item):
+            item['days_until_expiry'] = (item['expiry_date'] - today).days
+
+        return ReportStream(
+            """SELECT i.*, m.name as medicine_name
+               FROM inventory i
+               JOIN medicines m ON i.medicine_id = m.medicine_id
+               WHERE i.expiry_date BETWEEN %s AND %s
+               ORDER BY i.expiry_date ASC""",
+            (today, today + timedelta(days=days)),
+            prepare=prepare, accumulate=count_batch, summary=batch_summary()
+        )
 
+    @retry_on_deadlock
     def transfer_inventory(self, inventory_id, new_location, quantity):
         """Transfer inventory between locations with quantity adjustment"""
+        if quantity <= 0:
+            return {"success": False, "message": "Quantity must be positive"}
+        # Generate new inventory ID before the source batch is locked
+        new_inventory_id = next_id("inventory")
+        conn = get_db_connection()
+        cursor = conn.cursor(dictionary=True)
         try:
-            # Check available quantity
-            self.cursor.execute("""
-                SELECT current_quantity, medicine_id, supplier_id, batch_number, expiry_date 
-                FROM inventory 
-                WHERE inventory_id = %s
-            """, (inventory_id,))
-            source_item = self.cursor.fetchone()
+            # Lock the source batch, then check available quantity
+            source_item = statements.fetchone(cursor, LOCK_TRANSFER_SOURCE, (inventory_id,))
             
             if not source_item:
                 return {"success": False, "message": "Source inventory item not found"}
+            current_quantity, medicine_id, supplier_id, batch_number, expiry_date = source_item
                 
-            if quantity > source_item['current_quantity']:
+            if quantity > current_quantity:
                 return {"success": False, "message": "Not enough quantity available"}
 
-            # Generate new inventory ID
-            new_inventory_id = self._get_next_inventory_id()
-
             # Create new inventory record at new location
-            insert_query = """
-            INSERT INTO inventory (
-                inventory_id,
+            statements.run(cursor, INSERT_BATCH, (
+                new_inventory_id,
                 medicine_id,
                 supplier_id,
-                quantity_added,
-                date_added,
+                quantity,
+                datetime.now(),
                 batch_number,
                 expiry_date,
-                current_quantity,
-                location
-            ) VALUES (%s, %s, %s, %s, NOW(), %s, %s, %s, %s)
-            """
-            self.cursor.execute(insert_query, (
-                new_inventory_id,
-                source_item['medicine_id'],
-                source_item['supplier_id'],
-                quantity,
-                source_item['batch_number'],
-                source_item['expiry_date'],
                 quantity,
                 new_location
             ))
             
             # Update original inventory
-            update_query = """
-            UPDATE inventory 
-            SET current_quantity = current_quantity - %s 
-            WHERE inventory_id = %s
-            """
-            self.cursor.execute(update_query, (quantity, inventory_id))
+            statements.run(cursor, TAKE_FROM_BATCH, (quantity, inventory_id))
+            version = search_index.bump_batches(cursor)
             
-            self.conn.commit()
+            conn.commit()
+            search_index.batch_added(version, new_inventory_id, medicine_id, batch_number, new_location)
             
             return {
                 "success": True, 
                 "message": "Inventory transferred successfully",
                 "new_inventory_id": new_inventory_id,
-                "remaining_quantity": source_item['current_quantity'] - quantity
+                "remaining_quantity": current_quantity - quantity
             }
             
         except Exception as e:
-            self.conn.rollback()
+            conn.rollback()
+            if will_retry(e):
+                raise
             return {"success": False, "message": f"Error transferring inventory: {str(e)}"}
+        finally:
+            cursor.close()
+            conn.close()
 
-    def __del__(self):
-        """Clean up database connection"""
-        if hasattr(self, 'conn') and self.conn.is_connected():
-            self.cursor.close()
-            self.conn.close()
+    # Reporting Functions
+    def generate_inventory_report(self, page_size=None, page_token=None):
+        """Generate comprehensive inventory report
 
-            # Reporting Functions
-    def generate_inventory_report(self):
-        """Generate comprehensive inventory report"""
+        With ``page_size`` returns one page of per-medicine rows, in medicine
+        ID order, as (rows, next_token) and no summary.
+        """
+        if page_size is not None:
+            rows, next_token = fetch_keyset_page(
+                """SELECT m.medicine_id, m.name as medicine_name,
+                          SUM(i.current_quantity) as total_quantity,
+                          COUNT(DISTINCT i.batch_number) as batch_count,
+                          MIN(i.expiry_date) as earliest_expiry,
+                          GROUP_CONCAT(DISTINCT i.location) as locations
+                   FROM INVENTORY i
+                   JOIN MEDICINES m ON i.medicine_id = m.medicine_id""",
+                [("m.medicine_id", "medicine_id")],
+                group_by="m.medicine_id", page_token=page_token, page_size=page_size
+            )
+            for item in rows:
+                item['earliest_expiry'] = as_date(item['earliest_expiry'])
+            return rows, next_token
+
+        conn = get_db_connection()
+        cursor = conn.cursor(dictionary=True)
         try:
             query = """
             SELECT 
@@ -222,8 +309,10 @@ class PharmacyInventory:
             GROUP BY m.medicine_id
             ORDER BY total_quantity ASC
             """
-            self.cursor.execute(query)
-            report = self.cursor.fetchall()
+            cursor.execute(query)
+            report = cursor.fetchall()
+            for item in report:
+                item['earliest_expiry'] = as_date(item['earliest_expiry'])
             
             # Add summary statistics
             total_items = sum(item['total_quantity'] for item in report)
@@ -241,23 +330,126 @@ class PharmacyInventory:
             }
         except Exception as e:
             return {"error": f"Error generating report: {str(e)}"}
-        
+        finally:
+            cursor.close()
+            conn.close()
+
+    def stream_inventory_report(self):
+        """Streaming generate_inventory_report(): rows as they arrive, summary built on the way"""
+        today = datetime.now().date()
+
+        def prepare(item):
+            item['earliest_expiry'] = as_date(item['earliest_expiry'])
+
+        def accumulate(summary, item):
+            summary['total_items'] += item['total_quantity'] or 0
+            summary['unique_medicines'] += 1
+            if item['earliest_expiry'] and (item['earliest_expiry'] - today).days <= 30:
+                summary['items_expiring_soon'] += 1
+
+        return ReportStream(
+            """SELECT 
+                m.name as medicine_name,
+                SUM(i.current_quantity) as total_quantity,
+                COUNT(DISTINCT i.batch_number) as batch_count,
+                MIN(i.expiry_date) as earliest_expiry,
+                GROUP_CONCAT(DISTINCT i.location) as locations
+            FROM INVENTORY i
+            JOIN MEDICINES m ON i.medicine_id = m.medicine_id
+            GROUP BY m.medicine_id
+            ORDER BY total_quantity ASC""",
+            prepare=prepare, accumulate=accumulate,
+            summary={"total_items": 0, "unique_medicines": 0, "items_expiring_soon": 0}
+        )
 
-    def delete_inventory_item(self, inventory_id):
-        """Delete an inventory item by its ID"""
+    @retry_on_deadlock
+    def delete_inventory_item(self, inventory_id, expected_version=None):
+        """Delete an inventory item by its ID (refused if it changed since ``expected_version``)"""
+        conn = get_db_connection()
+        cursor = conn.cursor(dictionary=True)
         try:
             # First, check if the inventory item exists
-            self.cursor.execute("SELECT 1 FROM inventory WHERE inventory_id = %s", (inventory_id,))
-            if not self.cursor.fetchone():
+            item = statements.fetchone(cursor, LOCK_BATCH, (inventory_id,))
+            if not item:
                 return {"success": False, "message": f"Inventory ID {inventory_id} not found"}
 
             # Proceed to delete the inventory item
-            self.cursor.execute("DELETE FROM inventory WHERE inventory_id = %s", (inventory_id,))
-            self.conn.commit()
+            medicine_id, current_quantity, row_version = item
+            if expected_version is not None and row_version != expected_version:
+                return {"success": False, "message": STALE_BATCH_MESSAGE, "conflict": True}
+            cursor.execute("DELETE FROM inventory WHERE inventory_id = %s", (inventory_id,))
+            stock_levels.record(cursor, {medicine_id: -current_quantity})
+            version = search_index.bump_batches(cursor)
+            conn.commit()
+            search_index.batch_removed(version, inventory_id)
             return {"success": True, "message": f"Inventory ID {inventory_id} deleted successfully"}
-        except mysql.connector.Error as db_error:
-            self.conn.rollback()
-            return {"success": False, "message": f"Database error: {db_error.msg}"}
+        except db_errors() as db_error:
+            conn.rollback()
+            if will_retry(db_error):
+                raise
+            return {"success": False, "message": describe_error(db_error)}
         except Exception as e:
-            self.conn.rollback()
+            conn.rollback()
             return {"success": False, "message": f"Unexpected error: {str(e)}"}
+        finally:
+            cursor.close()
+            conn.close()
+
+    def list_inventory(self):
+        """Get all inventory batches with medicine names, soonest expiry first"""
+        conn = get_db_connection()
+        cursor = conn.cursor(dictionary=True)
+        try:
+            cursor.execute("""
+                SELECT i.inventory_id, m.name, i.supplier_id, i.batch_number, 
+                       i.current_quantity, i.expiry_date, i.location, i.row_version
+                FROM inventory i
+                JOIN medicines m ON i.medicine_id = m.medicine_id
+                ORDER BY i.expiry_date, i.inventory_id
+            """)
+            return cursor.fetchall()
+        except Exception as e:
+            return {"error": f"Error fetching inventory: {str(e)}"}
+        finally:
+            cursor.close()
+            conn.close()
+
+    def list_inventory_page(self, page_token=None, page_size=DEFAULT_PAGE_SIZE, backward=False):
+        """One page of list_inventory(); returns (rows, next_token)"""
+        return fetch_keyset_page(
+            """SELECT i.inventory_id, m.name, i.supplier_id, i.batch_number,
+                      i.current_quantity, i.expiry_date, i.location, i.row_version
+               FROM inventory i
+               JOIN medicines m ON i.medicine_id = m.medicine_id""",
+            list(zip(("i.expiry_date", "i.inventory_id"), INVENTORY_PAGE_KEYS)),
+            page_token=page_token, page_size=page_size, backward=backward
+        )
+
+    def search_inventory(self, search_term):
+        """Search inventory by medicine name, batch number or location (best match first)"""
+        conn = None
+        cursor = None
+        try:
+            inventory_ids = search_index.search_inventory_ids(search_term)
+            if not inventory_ids:
+                return []
+
+            conn = get_db_connection()
+            cursor = conn.cursor(dictionary=True)
+            placeholders = ", ".join(["%s"] * len(inventory_ids))
+            cursor.execute(f"""
+                SELECT i.inventory_id, m.name, m.name AS medicine_name, i.supplier_id,
+                       i.batch_number, i.current_quantity, i.expiry_date, i.location, i.row_version
+                FROM inventory i
+                JOIN medicines m ON i.medicine_id = m.medicine_id
+                WHERE i.inventory_id IN ({placeholders})
+            """, inventory_ids)
+            rows = {row['inventory_id']: row for row in cursor.fetchall()}
+            return [rows[inventory_id] for inventory_id in inventory_ids if inventory_id in rows]
+        except Exception as e:
+            return {"message": f"Search failed: {str(e)}"}
+        finally:
+            if cursor:
+                cursor.close()
+            if conn:
+                conn.close()
@@ -1,8 +1,13 @@
 # inventory_gui.py
 import customtkinter
-from tkinter import messagebox, ttk
+from tkinter import messagebox, ttk, filedialog
 from theme import setup_theme
-from inventory import PharmacyInventory
+from inventory import PharmacyInventory, INVENTORY_PAGE_KEYS
+from background import BackgroundLoader
+from paged_view import PagedTreeview
+from paging import cursor_for
+from tree_sync import KeyedTreeview
+from receiving import import_delivery
 from datetime import datetime
 
 # Set custom font styles
@@ -18,6 +23,7 @@ class InventoryWindow:
         self.window = customtkinter.CTk()
         self.window.title("Pharmacy Management System - Inventory")
         self.window.geometry("1400x900")
+        self.loader = BackgroundLoader(self.window)
         
         # Configure grid layout
         self.window.grid_rowconfigure(0, weight=1)
@@ -204,6 +210,17 @@ class InventoryWindow:
         )
         refresh_button.pack(side="right", padx=5)
         
+        import_button = customtkinter.CTkButton(
+            search_frame,
+            text="📥 Import Delivery",
+            width=150,
+            height=40,
+            font=MEDIUM_FONT,
+            corner_radius=8,
+            command=self.import_delivery_file
+        )
+        import_button.pack(side="right", padx=5)
+        
         # Inventory list frame with improved styling
         list_frame = customtkinter.CTkFrame(
             main_frame,
@@ -237,6 +254,17 @@ class InventoryWindow:
         scrollbar.pack(side="right", fill="y")
         self.tree.configure(yscrollcommand=scrollbar.set)
         
+        # Full list is a virtual list: pages of batches are loaded as you scroll
+        # Refreshes diff rows by inventory ID instead of rebuilding the tree
+        self.rows = KeyedTreeview(self.tree, lambda item: item["inventory_id"], self.inventory_row_values)
+        self.pager = PagedTreeview(
+            self.rows, scrollbar, self.loader, "inventory",
+            fetch_page=self.inventory.list_inventory_page,
+            row_token=lambda item: cursor_for(item, INVENTORY_PAGE_KEYS),
+            on_empty=lambda: messagebox.showinfo("Info", "No inventory items found"),
+            on_error=lambda e: messagebox.showerror("Error", f"Failed to load inventory: {str(e)}")
+        )
+        
         # Configure columns with improved widths
         self.tree["columns"] = ("id", "medicine", "supplier", "batch", "quantity", "expiry", "location")
         self.tree.column("#0", width=0, stretch=False)
@@ -261,37 +289,22 @@ class InventoryWindow:
         self.tree.bind("<Double-1>", self.show_item_details)
     
     def load_inventory_list(self):
-        """Load all inventory items into the treeview"""
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-            
-        try:
-            self.inventory.cursor.execute("""
-                SELECT i.inventory_id, m.name, i.supplier_id, i.batch_number, 
-                       i.current_quantity, i.expiry_date, i.location
-                FROM inventory i
-                JOIN medicines m ON i.medicine_id = m.medicine_id
-                ORDER BY i.expiry_date
-            """)
-            items = self.inventory.cursor.fetchall()
-            
-            if not items:
-                messagebox.showinfo("Info", "No inventory items found")
-                return
-                
-            for item in items:
-                self.tree.insert("", "end", values=(
-                    item["inventory_id"],
-                    item["name"],
-                    item["supplier_id"],
-                    item["batch_number"],
-                    item["current_quantity"],
-                    item["expiry_date"].strftime("%Y-%m-%d") if item["expiry_date"] else "N/A",
-                    item["location"]
-                ))
-                
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to load inventory: {str(e)}")
+        """Show inventory from the soonest expiry; further pages load on scroll"""
+        self.pager.reload()
+    
+    @staticmethod
+    def inventory_row_values(item):
+        """Treeview values for one inventory row"""
+        return (
+            item["inventory_id"],
+            item["name"],
+            item["supplier_id"],
+            item["batch_number"],
+            item["current_quantity"],
+            item["expiry_date"].strftime("%Y-%m-%d") if item["expiry_date"] else "N/A",
+            item["location"],
+            item["row_version"]     # not a column: kept for the optimistic edit check
+        )
     
     def search_inventory(self):
         """Search inventory by medicine, batch or location"""
@@ -299,40 +312,57 @@ class InventoryWindow:
         if not search_term.strip():
             self.load_inventory_list()
             return
-            
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-            
+        
+        # Same key as the full list: a new search supersedes a running load
+        self.loader.submit(
+            "inventory", self.inventory.search_inventory, search_term,
+            on_done=self.show_search_results,
+            on_error=lambda e: messagebox.showerror("Error", f"Search failed: {str(e)}")
+        )
+    
+    def show_search_results(self, items):
+        """Fill the treeview with inventory search results"""
+        self.pager.suspend()
         try:
-            self.inventory.cursor.execute("""
-                SELECT i.inventory_id, m.name, i.supplier_id, i.batch_number, 
-                       i.current_quantity, i.expiry_date, i.location
-                FROM inventory i
-                JOIN medicines m ON i.medicine_id = m.medicine_id
-                WHERE m.name LIKE %s OR i.batch_number LIKE %s OR i.location LIKE %s
-                ORDER BY i.expiry_date
-            """, (f"%{search_term}%", f"%{search_term}%", f"%{search_term}%"))
-            
-            items = self.inventory.cursor.fetchall()
+            if isinstance(items, dict):
+                self.rows.clear()
+                messagebox.showerror("Error", items["message"])
+                return
             
+            self.rows.sync(items)
             if not items:
                 messagebox.showinfo("Info", "No matching items found")
-                return
-                
-            for item in items:
-                self.tree.insert("", "end", values=(
-                    item["inventory_id"],
-                    item["name"],
-                    item["supplier_id"],
-                    item["batch_number"],
-                    item["current_quantity"],
-                    item["expiry_date"].strftime("%Y-%m-%d") if item["expiry_date"] else "N/A",
-                    item["location"]
-                ))
                 
         except Exception as e:
             messagebox.showerror("Error", f"Search failed: {str(e)}")
     
+    def import_delivery_file(self):
+        """Receive a supplier delivery file (.csv/.xlsx) in one go"""
+        path = filedialog.askopenfilename(
+            title="Select delivery file",
+            filetypes=[("Delivery files", "*.csv *.xlsx"), ("All files", "*.*")]
+        )
+        if not path:
+            return
+        self.loader.submit(
+            "import", import_delivery, path,
+            on_done=self.show_import_result,
+            on_error=lambda e: messagebox.showerror("Error", f"Import failed: {str(e)}")
+        )
+    
+    def show_import_result(self, result):
+        """Report a delivery import and refresh the list"""
+        message = result["message"]
+        if result["errors"]:
+            shown = "\n".join(f"Line {line}: {error}" for line, error in result["errors"][:15])
+            more = len(result["errors"]) - 15
+            message += f"\n\n{shown}" + (f"\n... and {more} more" if more > 0 else "")
+        if result["success"]:
+            messagebox.showinfo("Delivery Imported", message)
+            self.load_inventory_list()
+        else:
+            messagebox.showerror("Import Failed", message)
+    
     def clear_search(self):
         """Clear search results and show all inventory items"""
         self.search_entry.delete(0, "end")
@@ -515,17 +545,19 @@ class InventoryWindow:
             command=lambda: self.update_inventory_quantity(
                 selected['inventory_id'],
                 quantity_entry.get(),
-                dialog
+                dialog,
+                selected['row_version']
             )
         )
         update_btn.pack(fill="x")
     
-    def update_inventory_quantity(self, inventory_id, new_quantity, dialog):
+    def update_inventory_quantity(self, inventory_id, new_quantity, dialog, expected_version=None):
         """Update inventory quantity in database"""
         try:
             result = self.inventory.update_inventory_quantity(
                 int(inventory_id),
-                int(new_quantity)
+                int(new_quantity),
+                expected_version
             )
             
             if result["success"]:
@@ -534,6 +566,10 @@ class InventoryWindow:
                 dialog.destroy()
             else:
                 messagebox.showerror("Error", result["message"])
+                if result.get("conflict"):
+                    # Show the current quantity; the user re-enters the edit
+                    self.load_inventory_list()
+                    dialog.destroy()
                 
         except ValueError:
             messagebox.showerror("Error", "Please enter a valid number")
@@ -1005,7 +1041,8 @@ class InventoryWindow:
             'batch_number': values[3],
             'current_quantity': values[4],
             'expiry_date': values[5],
-            'location': values[6]
+            'location': values[6],
+            'row_version': int(values[7]) if len(values) > 7 else None
         }
     
 
@@ -1028,18 +1065,20 @@ class InventoryWindow:
         )
         
         if response:
-            self.delete_inventory_item(selected['inventory_id'])
+            self.delete_inventory_item(selected['inventory_id'], selected['row_version'])
     
-    def delete_inventory_item(self, inventory_id):
+    def delete_inventory_item(self, inventory_id, expected_version=None):
         """Delete inventory item from database"""
         try:
-            result = self.inventory.delete_inventory_item(inventory_id)
+            result = self.inventory.delete_inventory_item(inventory_id, expected_version)
             
             if result["success"]:
                 messagebox.showinfo("Success", result["message"])
                 self.load_inventory_list()
             else:
                 messagebox.showerror("Error", result["message"])
+                if result.get("conflict"):
+                    self.load_inventory_list()
                 
         except Exception as e:
             messagebox.showerror("Error", f"Failed to delete item: {str(e)}")
@@ -0,0 +1,376 @@
+# loadtest.py
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import platform
+import queue
+import random
+import sys
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+import database
+from database import transaction, get_backend, get_pool, retry_counts
+from catalog import catalog
+from stock import stock_levels
+from medicines import Medicine
+from inventory import PharmacyInventory
+from prescriptions import PrescriptionManager, CheckoutError
+from suppliers import SupplierManager
+from instrumentation import query_stats
+from benchmark import summarize
+from datagen import add_database_arguments, configure_database
+
+DEFAULT_MIX = {"checkout": 50, "search": 30, "receipt": 10, "report": 10}
+DEFAULT_RATE = 20           # arrivals per second over all terminals; 0 = closed loop
+DEFAULT_DURATION = 30       # seconds
+DEFAULT_WORKERS = 8         # terminals (threads) per process
+DRAIN_GRACE = 5.0           # seconds after the run in which queued arrivals may still start
+ERRORS_KEPT = 20            # error messages kept per process
+
+
+def parse_mix(text):
+    """'checkout=50,search=30' -> {"checkout": 50, "search": 30}"""
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in DEFAULT_MIX:
+            raise ValueError(f"Unknown operation '{name}' (expected one of {', '.join(DEFAULT_MIX)})")
+        mix[name] = float(weight or 1)
+    if not any(mix.values()):
+        raise ValueError("The operation mix needs at least one positive weight")
+    return mix
+
+
+class LoadGenerator:
+    """Simulates busy counters by driving the real manager APIs from threads.
+
+    With a positive ``rate`` arrivals are open-loop: a dispatcher draws
+    operations from the weighted ``mix`` at Poisson-distributed times and
+    ``workers`` terminal threads serve them, so latency is measured from
+    arrival and includes time spent queued behind busy terminals. With
+    ``rate=0`` every terminal runs operations back to back (closed loop).
+
+    run() returns raw samples so that the results of several processes can
+    be merged before the percentiles are taken (see build_report()).
+    """
+
+    def __init__(self, mix=None, rate=DEFAULT_RATE, duration=DEFAULT_DURATION,
+                 workers=DEFAULT_WORKERS, seed=42, tag="0"):
+        self.mix = dict(mix or DEFAULT_MIX)
+        self.rate = rate
+        self.duration = duration
+        self.workers = workers
+        self.seed = seed
+        self.tag = tag
+        self.inventory = PharmacyInventory()
+        self.prescriptions = PrescriptionManager()
+        self.suppliers = SupplierManager()
+        self._lock = threading.Lock()
+        self._samples = {name: {"latency": [], "service": [], "outcomes": {}} for name in self.mix}
+        self._errors = []
+        self._dropped = 0
+        self._receipts = 0
+
+    def run(self):
+        self._medicines = catalog.all()
+        with transaction() as (conn, cursor):
+            cursor.execute("SELECT supplier_id FROM suppliers")
+            self._supplier_ids = [row[0] for row in cursor.fetchall()]
+        if not self._medicines or not self._supplier_ids:
+            raise ValueError("The database needs medicines and suppliers; load data with datagen.py first")
+
+        query_stats.reset()
+        retries_before = retry_counts()
+        pool_before = get_pool().stats()
+        names = [name for name in self.mix if self.mix[name] > 0]
+        weights = [self.mix[name] for name in names]
+
+        start = time.perf_counter()
+        end = start + self.duration
+        with open(os.devnull, "w") as sink, contextlib.redirect_stdout(sink):
+            if self.rate > 0:
+                arrivals = queue.Queue()
+                threads = [threading.Thread(target=self._serve, args=(n, arrivals, end)) for n in range(self.workers)]
+                for thread in threads:
+                    thread.start()
+                self._dispatch(arrivals, names, weights, start, end)
+            else:
+                threads = [threading.Thread(target=self._loop, args=(n, names, weights, end))
+                           for n in range(self.workers)]
+                for thread in threads:
+                    thread.start()
+            for thread in threads:
+                thread.join()
+        elapsed = time.perf_counter() - start
+
+        retries = retry_counts()
+        pool = get_pool().stats()
+        return {
+            "elapsed": elapsed,
+            "operations": self._samples,
+            "dropped": self._dropped,
+            "errors": self._errors,
+            "retried": retries.get("retried", 0) - retries_before.get("retried", 0),
+            "gave_up": retries.get("gave_up", 0) - retries_before.get("gave_up", 0),
+            "pool_waits": pool["waits"] - pool_before["waits"],
+            "pool_wait_seconds": pool["wait_seconds"] - pool_before["wait_seconds"],
+            "locking_statements": _locking_statements(),
+        }
+
+    # ---------- scheduling ----------
+
+    def _dispatch(self, arrivals, names, weights, start, end):
+        rng = random.Random(f"{self.seed}:{self.tag}:arrivals")
+        at = start
+        while True:
+            at += rng.expovariate(self.rate)
+            if at >= end:
+                break
+            delay = at - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            arrivals.put((rng.choices(names, weights)[0], at))
+        for _ in range(self.workers):
+            arrivals.put(None)
+
+    def _serve(self, number, arrivals, end):
+        rng = random.Random(f"{self.seed}:{self.tag}:{number}")
+        while True:
+            item = arrivals.get()
+            if item is None:
+                return
+            name, arrived = item
+            if time.perf_counter() > end + DRAIN_GRACE:
+                with self._lock:
+                    self._dropped += 1
+                continue
+            self._perform(name, rng, arrived)
+
+    def _loop(self, number, names, weights, end):
+        rng = random.Random(f"{self.seed}:{self.tag}:{number}")
+        while time.perf_counter() < end:
+            self._perform(rng.choices(names, weights)[0], rng, None)
+
+    def _perform(self, name, rng, arrived):
+        started = time.perf_counter()
+        try:
+            outcome = getattr(self, f"op_{name}")(rng)
+        except Exception as e:
+            outcome = "error"
+            self._error(name, f"{type(e).__name__}: {e}")
+        finished = time.perf_counter()
+        with self._lock:
+            samples = self._samples[name]
+            samples["service"].append(finished - started)
+            samples["latency"].append(finished - (arrived if arrived is not None else started))
+            samples["outcomes"][outcome] = samples["outcomes"].get(outcome, 0) + 1
+
+    def _error(self, name, message):
+        with self._lock:
+            if len(self._errors) < ERRORS_KEPT:
+                self._errors.append(f"{name}: {message}")
+
+    # ---------- operations ----------
+
+    def op_checkout(self, rng):
+        in_stock = [medicine_id for medicine_id, total in stock_levels.totals().items() if total >= 3]
+        if not in_stock:
+            return "rejected"
+        basket = [(medicine_id, rng.randint(1, 2))
+                  for medicine_id in rng.sample(in_stock, min(rng.randint(1, 3), len(in_stock)))]
+        try:
+            self.prescriptions.checkout(basket)
+        except CheckoutError:
+            return "rejected"       # sold out between the cache read and the locked check
+        return "ok"
+
+    def op_search(self, rng):
+        name = rng.choice(self._medicines)["name"]
+        term = name[:rng.randint(3, 6)]
+        if rng.random() < 0.5:
+            Medicine.search_medicines(term)
+        else:
+            results = self.inventory.search_inventory(term)
+            if isinstance(results, dict):
+                self._error("search", results["message"])
+                return "error"
+        return "ok"
+
+    def op_receipt(self, rng):
+        with self._lock:
+            self._receipts += 1
+            number = self._receipts
+        expiry = date.today() + timedelta(days=rng.randint(180, 720))
+        result = self.inventory.add_inventory_item(
+            rng.choice(self._medicines)["medicine_id"], rng.choice(self._supplier_ids), rng.randint(20, 200),
+            f"LT-{self.tag}-{number}", expiry.strftime("%Y-%m-%d"), f"Shelf {rng.randint(1, 40)}"
+        )
+        if not result["success"]:
+            self._error("receipt", result["message"])
+            return "error"
+        return "ok"
+
+    def op_report(self, rng):
+        report = rng.randrange(4)
+        if report == 0:
+            result = self.inventory.get_low_stock_items(10)
+        elif report == 1:
+            result = self.inventory.get_expiring_soon(30)
+        elif report == 2:
+            result = self.suppliers.get_top_suppliers(10)
+        else:
+            result = self.prescriptions.get_prescriptions_by_date(date.today(), page_size=50)
+        if isinstance(result, dict) and "error" in result:
+            self._error("report", result["error"])
+            return "error"
+        return "ok"
+
+
+def _locking_statements():
+    """Calls and time of the statements that take row locks (SELECT ... FOR UPDATE).
+
+    Their latency is dominated by waiting for the locks; on SQLite it is the
+    wait for the database write lock.
+    """
+    calls, total_ms = 0, 0.0
+    for row in query_stats.snapshot():
+        if row["fingerprint"].endswith("for update"):
+            calls += row["calls"]
+            total_ms += row["total_ms"]
+    return {"calls": calls, "total_ms": total_ms}
+
+
+def _innodb_lock_status():
+    """Server-wide InnoDB row lock counters (MySQL only), or None"""
+    if get_backend().name != "mysql":
+        return None
+    with transaction() as (conn, cursor):
+        cursor.execute("SHOW GLOBAL STATUS LIKE 'Innodb_row_lock_%'")
+        return {name: int(value) for name, value in cursor.fetchall()}
+
+
+def _run_in_process(options, sqlite_path):
+    """Entry point of a worker process (spawned, so it opens its own pool)"""
+    if sqlite_path:
+        database.configure(backend="sqlite", sqlite_path=sqlite_path)
+    return LoadGenerator(**options).run()
+
+
+def build_report(runs, mix, rate, duration, workers, processes, seed):
+    """Merge the raw results of one or more generators into the report dict"""
+    elapsed = max(run["elapsed"] for run in runs)
+    operations = {}
+    completed = 0
+    for name in mix:
+        latency, service, outcomes = [], [], {}
+        for run in runs:
+            samples = run["operations"][name]
+            latency += samples["latency"]
+            service += samples["service"]
+            for outcome, count in samples["outcomes"].items():
+                outcomes[outcome] = outcomes.get(outcome, 0) + count
+        completed += len(latency)
+        operations[name] = {
+            "count": len(latency),
+            "throughput": len(latency) / elapsed if elapsed else 0.0,
+            "outcomes": outcomes,
+            "latency_ms": summarize(latency),
+            "service_ms": summarize(service),
+        }
+    return {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "backend": get_backend().name,
+        "python": platform.python_version(),
+        "mix": mix,
+        "offered_rate": rate,
+        "duration": duration,
+        "workers": workers,
+        "processes": processes,
+        "seed": seed,
+        "elapsed": elapsed,
+        "completed": completed,
+        "throughput": completed / elapsed if elapsed else 0.0,
+        "dropped": sum(run["dropped"] for run in runs),
+        "operations": operations,
+        "deadlock_retries": sum(run["retried"] for run in runs),
+        "gave_up": sum(run["gave_up"] for run in runs),
+        "pool_waits": sum(run["pool_waits"] for run in runs),
+        "pool_wait_seconds": sum(run["pool_wait_seconds"] for run in runs),
+        "locking_statements": {
+            "calls": sum(run["locking_statements"]["calls"] for run in runs),
+            "total_ms": sum(run["locking_statements"]["total_ms"] for run in runs),
+        },
+        "errors": [error for run in runs for error in run["errors"]][:ERRORS_KEPT],
+    }
+
+
+def print_report(report):
+    print(f"{'Operation':<12}{'count':>8}{'ok':>8}{'rejected':>10}{'errors':>8}{'ops/s':>9}"
+          f"{'p50':>9}{'p95':>9}{'p99':>9}  (latency ms)")
+    for name, op in report["operations"].items():
+        outcomes = op["outcomes"]
+        latency = op["latency_ms"]
+        if op["count"]:
+            timings = f"{latency['p50']:>9.2f}{latency['p95']:>9.2f}{latency['p99']:>9.2f}"
+        else:
+            timings = f"{'-':>9}{'-':>9}{'-':>9}"
+        print(f"{name:<12}{op['count']:>8}{outcomes.get('ok', 0):>8}{outcomes.get('rejected', 0):>10}"
+              f"{outcomes.get('error', 0):>8}{op['throughput']:>9.1f}{timings}")
+    offered = f"{report['offered_rate']}/s offered" if report["offered_rate"] else "closed loop"
+    print(f"Throughput {report['throughput']:.1f} ops/s ({offered}), {report['completed']} operations "
+          f"in {report['elapsed']:.1f}s on {report['processes']} x {report['workers']} terminals"
+          + (f", {report['dropped']} arrivals dropped" if report["dropped"] else ""))
+    locking = report["locking_statements"]
+    print(f"Lock waits: {locking['total_ms']:.0f} ms in {locking['calls']} locking reads (SELECT ... FOR UPDATE)"
+          + (f"; InnoDB {report['innodb_row_lock_waits']} row lock waits, "
+             f"{report['innodb_row_lock_ms']} ms" if "innodb_row_lock_waits" in report else ""))
+    print(f"Connection pool waits: {report['pool_waits']} ({report['pool_wait_seconds']:.2f}s)")
+    print(f"Deadlock/lock-timeout retries: {report['deadlock_retries']} (gave up: {report['gave_up']})")
+    for error in report["errors"]:
+        print(f"ERROR  {error}")
+
+
+def main(argv=None):
+    """python loadtest.py [--sqlite PATH] [--mix checkout=50,...] [--rate N] [--duration S] ..."""
+    parser = argparse.ArgumentParser(description="Simulate several busy pharmacy terminals")
+    add_database_arguments(parser)
+    parser.add_argument("--mix", type=parse_mix, default=dict(DEFAULT_MIX),
+                        help="operation weights, e.g. checkout=50,search=30,receipt=10,report=10")
+    parser.add_argument("--rate", type=float, default=DEFAULT_RATE,
+                        help="arrivals per second over all terminals (0 = closed loop)")
+    parser.add_argument("--duration", type=float, default=DEFAULT_DURATION, help="seconds")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="terminal threads per process")
+    parser.add_argument("--processes", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default="loadtest_results.json")
+    args = parser.parse_args(argv)
+    configure_database(args)
+
+    innodb_before = _innodb_lock_status()
+    if args.processes > 1:
+        per_process = [dict(mix=args.mix, rate=args.rate / args.processes, duration=args.duration,
+                            workers=args.workers, seed=args.seed, tag=str(n)) for n in range(args.processes)]
+        with multiprocessing.get_context("spawn").Pool(args.processes) as processes:
+            runs = processes.starmap(_run_in_process, [(options, args.sqlite) for options in per_process])
+    else:
+        runs = [LoadGenerator(args.mix, args.rate, args.duration, args.workers, args.seed).run()]
+    report = build_report(runs, args.mix, args.rate, args.duration, args.workers, args.processes, args.seed)
+    innodb_after = _innodb_lock_status()
+    if innodb_before is not None:
+        report["innodb_row_lock_waits"] = innodb_after["Innodb_row_lock_waits"] - innodb_before["Innodb_row_lock_waits"]
+        report["innodb_row_lock_ms"] = innodb_after["Innodb_row_lock_time"] - innodb_before["Innodb_row_lock_time"]
+
+    with open(args.output, "w", encoding="utf-8") as handle:
+        json.dump(report, handle, indent=2)
+    print_report(report)
+    print(f"Results written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
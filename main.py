@@ -7,6 +7,10 @@ import getpass
 import re
 from datetime import datetime
 from predictor import MedicineEffectivenessPredictor
+from stock import stock_levels
+from receiving import import_delivery
+from price_list import import_price_list
+from instrumentation import query_stats
 
 def display_title():
     print("\n" + "="*50)
@@ -48,6 +52,7 @@ def main_menu(user_role):
     if user_role == "Admin":
         print("5. User Management")
         print("6. Medicine Effectiveness Prediction")
+        print("7. Query Statistics")
     print("0. Exit")
     
     return input("\nSelect an option: ")
@@ -62,6 +67,9 @@ def inventory_menu():
     print("4. View Expiring Soon")
     print("5. Transfer Inventory")
     print("6. Generate Inventory Report")
+    print("7. Search Inventory")
+    print("8. Reconcile Stock Totals")
+    print("9. Import Delivery File")
     print("0. Return to Main Menu")
     return input("\nSelect an option: ")
 
@@ -77,6 +85,7 @@ def medicine_menu():
     print("6. View Expired Medicines")
     print("7. View Low Stock Medicines")
     print("8. View Nearly Expiring Medicines")
+    print("9. Import Catalog / Price List")
     print("0. Return to Main Menu")
     return input("\nSelect an option: ")
 
@@ -152,22 +161,23 @@ def handle_inventory():
         elif choice == '3':  # View Low Stock
             threshold = input("Enter threshold (default 10): ")
             threshold = int(threshold) if threshold.isdigit() else 10
-            items = inventory.get_low_stock_items(threshold)
-            if isinstance(items, list):
+            items = inventory.stream_low_stock_items(threshold)
+            try:
                 print("\nLow Stock Items:")
                 print("-" * 60)
                 print(f"{'ID':<8}{'Medicine':<20}{'Quantity':<12}{'Location':<20}")
                 print("-" * 60)
                 for item in items:
                     print(f"{item['inventory_id']:<8}{item['medicine_name']:<20}{item['current_quantity']:<12}{item['location']:<20}")
-            else:
-                print(items.get("error", "Error fetching low stock items"))
+                print(f"{items.summary['batches']} batch(es), {items.summary['total_quantity']} unit(s)")
+            except Exception as e:
+                print(f"Error fetching low stock items: {e}")
                 
         elif choice == '4':  # View Expiring Soon
             days = input("Enter days threshold (default 30): ")
             days = int(days) if days.isdigit() else 30
-            items = inventory.get_expiring_soon(days)
-            if isinstance(items, list):
+            items = inventory.stream_expiring_soon(days)
+            try:
                 print("\nItems Expiring Soon:")
                 print("-" * 80)
                 print(f"{'ID':<8}{'Medicine':<20}{'Quantity':<12}{'Expiry Date':<15}{'Days Left':<12}{'Location':<15}")
@@ -176,8 +186,9 @@ def handle_inventory():
                     print(f"{item['inventory_id']:<8}{item['medicine_name']:<20}{item['current_quantity']:<12}"
                           f"{item['expiry_date'].strftime('%Y-%m-%d') if item['expiry_date'] else 'N/A':<15}"
                           f"{item['days_until_expiry']:<12}{item['location']:<15}")
-            else:
-                print(items.get("error", "Error fetching expiring items"))
+                print(f"{items.summary['batches']} batch(es), {items.summary['total_quantity']} unit(s)")
+            except Exception as e:
+                print(f"Error fetching expiring items: {e}")
                 
         elif choice == '5':  # Transfer Inventory
             try:
@@ -190,23 +201,23 @@ def handle_inventory():
                 print("Invalid input. Please enter valid numbers.")
                 
         elif choice == '6':  # Generate Report
-            report = inventory.generate_inventory_report()
-            if "report" in report:
+            report = inventory.stream_inventory_report()
+            try:
                 print("\nInventory Report Summary:")
                 print("-" * 80)
                 print(f"{'Medicine':<25}{'Total Qty':<12}{'Batches':<10}{'Earliest Expiry':<20}{'Locations':<20}")
                 print("-" * 80)
-                for item in report["report"]:
+                for item in report:
                     print(f"{item['medicine_name']:<25}{item['total_quantity']:<12}{item['batch_count']:<10}"
                           f"{item['earliest_expiry'].strftime('%Y-%m-%d') if item['earliest_expiry'] else 'N/A':<20}"
                           f"{item['locations']:<20}")
                 print("-" * 80)
                 print(f"\nSummary Statistics:")
-                print(f"Total Items: {report['summary']['total_items']}")
-                print(f"Unique Medicines: {report['summary']['unique_medicines']}")
-                print(f"Items Expiring Soon (≤30 days): {report['summary']['items_expiring_soon']}")
-            else:
-                print(report.get("error", "Error generating report"))
+                print(f"Total Items: {report.summary['total_items']}")
+                print(f"Unique Medicines: {report.summary['unique_medicines']}")
+                print(f"Items Expiring Soon (≤30 days): {report.summary['items_expiring_soon']}")
+            except Exception as e:
+                print(f"Error generating report: {e}")
                 
         elif choice == '7':  # Search Inventory
             search_term = input("Enter search term (medicine name, batch, or location): ")
@@ -223,6 +234,27 @@ def handle_inventory():
             else:
                 print(results.get("message", "No results found"))
                 
+        elif choice == '8':  # Reconcile Stock Totals
+            mismatches = stock_levels.reconcile()
+            if not mismatches:
+                print("\nStock totals match the inventory batches.")
+            else:
+                print(f"\n{'Medicine ID':<14}{'Recorded':<12}{'Actual':<12}")
+                print("-" * 40)
+                for item in mismatches:
+                    print(f"{item['medicine_id']:<14}{str(item['recorded']):<12}{str(item['actual']):<12}")
+                if input("\nFix these totals? (y/n): ").lower() == 'y':
+                    stock_levels.reconcile(fix=True)
+                    print("Stock totals repaired.")
+                
+        elif choice == '9':  # Import Delivery File
+            path = input("Delivery file (.csv or .xlsx): ").strip()
+            strict = input("Import nothing if any line is invalid? (y/n): ").lower() == 'y'
+            result = import_delivery(path, skip_invalid=not strict)
+            for line, message in result["errors"]:
+                print(f"Line {line}: {message}")
+            print(result["message"])
+                
         elif choice == '0':
             break
             
@@ -292,6 +324,18 @@ def handle_medicines():
             days = int(days) if days.isdigit() else 30
             Medicine.get_nearly_expiring_medicines(days)
             
+        elif choice == '9':  # Import Catalog / Price List
+            path = input("Catalog or price list file (.csv or .xlsx): ").strip()
+            preview = import_price_list(path, dry_run=True)
+            for line, message in preview["errors"]:
+                print(f"Line {line}: {message}")
+            for name, old, new in preview["price_changes"]:
+                print(f"{name}: {old:.2f} -> {new:.2f}")
+            print(preview["message"])
+            if preview["success"] and (preview["inserted"] or preview["updated"]) \
+                    and input("\nApply these changes? (y/n): ").lower() == 'y':
+                print(import_price_list(path)["message"])
+            
         elif choice == '0':
             break
             
@@ -612,6 +656,13 @@ def main():
             effectiveness = medicine_predictor.predict_effectiveness(medicine_name, condition)
             print(f"\nEstimated Effectiveness: {round(effectiveness * 100, 2)}%")
             input("\nPress Enter to continue...")
+        elif choice == '7' and current_user["role"] == "Admin":  # Query statistics
+            print("\n" + query_stats.report())
+            slow = query_stats.slow_queries()
+            print(f"\n{len(slow)} slow statement(s) over {query_stats.slow_ms:.0f} ms logged")
+            for entry in slow[-5:]:
+                print(f"  {entry['elapsed_ms']:.1f} ms  {entry['caller']}\n    {entry['fingerprint'][:100]}")
+            input("\nPress Enter to continue...")
 
         elif choice == '0':
             print("\nGoodbye!")
@@ -1,5 +1,19 @@
 from database import get_db_connection
-from datetime import date
+from datetime import date, timedelta
+from sequences import next_id
+from catalog import catalog, CATALOG_COLUMNS
+from stock import stock_levels
+from search import search_index
+from paging import DEFAULT_PAGE_SIZE, fetch_keyset_page
+from streaming import ReportStream, batch_summary, count_batch
+from prepared import statements
+
+UPDATE_MEDICINE = statements.register("update_medicine", """
+    UPDATE medicines
+    SET price=%s, category=%s, description=%s, dosage=%s, requires_prescription=%s
+    WHERE name=%s""")
+DELETE_MEDICINE = statements.register("delete_medicine", "DELETE FROM medicines WHERE name=%s")
+LOCK_MEDICINE = statements.register("lock_medicine", "SELECT medicine_id FROM medicines WHERE name=%s FOR UPDATE")
 
 class Medicine:
     def __init__(self, name, manufacturer, price, category, description=None, dosage=None, requires_prescription=False):
@@ -22,28 +36,27 @@ class Medicine:
     
     def add_in_db(self):
         """Stores medicine in the database with an auto-assigned ID, preventing duplicates."""
-
+        conn = None
+        cursor = None
         try:
-            conn = get_db_connection()
-            cursor = conn.cursor(dictionary=True)
-
             # Check if the medicine already exists
-            cursor.execute("SELECT * FROM medicines WHERE name = %s", (self.__name,))
-            if cursor.fetchone():
+            if catalog.id_for_name(self.__name) is not None:
                 print(f"Error: Medicine '{self.__name}' already exists in the database!")
                 return
         
-            # Get the next medicine_id
-            cursor.execute("SELECT MAX(medicine_id) AS max_id FROM medicines")
-            result = cursor.fetchone()
-            next_id = 1 if result["max_id"] is None else result["max_id"] + 1
+            # Get the next medicine_id before borrowing a connection: a fresh
+            # block is fetched on a pooled connection of its own
+            medicine_id = next_id("medicines")
+
+            conn = get_db_connection()
+            cursor = conn.cursor(dictionary=True)
 
             # Insert new medicine record
             query = """INSERT INTO medicines 
                       (medicine_id, name, manufacturer, price, category, description, dosage, requires_prescription) 
                       VALUES (%s, %s, %s, %s, %s, %s, %s, %s)"""
             values = (
-                next_id, 
+                medicine_id, 
                 self.__name, 
                 self.__manufacturer, 
                 self.__price, 
@@ -53,32 +66,36 @@ class Medicine:
                 self.__requires_prescription
             )
             cursor.execute(query, values)
+            version = catalog.bump_version(cursor)
             conn.commit()
             print("Medicine stored in the database successfully!")
 
         except Exception as e:
             print("Error adding medicine:", e)
+            return
 
         finally:
-            cursor.close()
-            conn.close()
+            if cursor:
+                cursor.close()
+            if conn:
+                conn.close()
+
+        # Refresh the cache once the connection is back in the pool
+        catalog.after_write(version, medicine_id)
 
     @staticmethod
-    def read_all_medicines():
-        """Retrieves and displays all medicines from the database with their current stock."""
+    def read_all_medicines(page_size=None, page_token=None):
+        """Retrieves and displays all medicines from the catalog with their current stock.
+
+        With ``page_size`` nothing is printed: one page is returned as (rows, next_token).
+        """
+        if page_size is not None:
+            return Medicine.read_medicines_page(page_token, page_size)
         try:
-            conn = get_db_connection()
-            cursor = conn.cursor(dictionary=True)
-            
-            # Get medicines with their total current stock
-            query = """
-                SELECT m.*, COALESCE(SUM(i.current_quantity), 0) AS total_stock
-                FROM medicines m
-                LEFT JOIN inventory i ON m.medicine_id = i.medicine_id
-                GROUP BY m.medicine_id
-            """
-            cursor.execute(query)
-            medicines = cursor.fetchall()
+            # Catalog rows plus the maintained per-medicine totals
+            totals = stock_levels.totals()
+            medicines = [dict(medicine, total_stock=totals.get(medicine['medicine_id'], 0))
+                         for medicine in catalog.all()]
 
             if not medicines:
                 print("No medicines found in the database.")
@@ -97,27 +114,17 @@ class Medicine:
         except Exception as e:
             print("Error reading medicines:", e)
 
-        finally:
-            cursor.close()
-            conn.close()
-
     def update_medicine(self, new_price=None, new_category=None, new_description=None, new_dosage=None, new_prescription=None):
         """Updates medicine details in the database."""
+        # Get current values if new ones aren't provided
+        current = Medicine.get_medicine_by_name(self.__name)
+        if not current:
+            print(f"Medicine '{self.__name}' not found in database!")
+            return
+
+        conn = get_db_connection()
+        cursor = conn.cursor()
         try:
-            conn = get_db_connection()
-            cursor = conn.cursor()
-
-            # Get current values if new ones aren't provided
-            current = Medicine.get_medicine_by_name(self.__name)
-            if not current:
-                print(f"Medicine '{self.__name}' not found in database!")
-                return
-
-            query = """
-                UPDATE medicines 
-                SET price=%s, category=%s, description=%s, dosage=%s, requires_prescription=%s
-                WHERE name=%s
-            """
             values = (
                 new_price if new_price is not None else current['price'],
                 new_category if new_category is not None else current['category'],
@@ -126,43 +133,54 @@ class Medicine:
                 new_prescription if new_prescription is not None else current['requires_prescription'],
                 self.__name
             )
-            cursor.execute(query, values)
+            statements.run(cursor, UPDATE_MEDICINE, values)
+            version = catalog.bump_version(cursor)
             conn.commit()
             print("Medicine details updated successfully!")
 
         except Exception as e:
             print("Error updating medicine:", e)
+            return
 
         finally:
             cursor.close()
             conn.close()
 
+        catalog.after_write(version, current['medicine_id'])
+
     def delete_medicine(self):
         """Deletes the medicine from the database after checking inventory."""
+        # First check if medicine exists in inventory
+        medicine_id = catalog.id_for_name(self.__name)
+        if medicine_id is not None and stock_levels.get(medicine_id) > 0:
+            print(f"Cannot delete medicine '{self.__name}' - it still has inventory stock!")
+            return
+
+        conn = get_db_connection()
+        cursor = conn.cursor(dictionary=True)
         try:
-            conn = get_db_connection()
-            cursor = conn.cursor(dictionary=True)
-
-            # First check if medicine exists in inventory
-            cursor.execute("SELECT SUM(current_quantity) AS total FROM inventory WHERE medicine_id = "
-                         "(SELECT medicine_id FROM medicines WHERE name = %s)", (self.__name,))
-            result = cursor.fetchone()
-            
-            if result['total'] and result['total'] > 0:
-                print(f"Cannot delete medicine '{self.__name}' - it still has inventory stock!")
+            # The cache may not know the name yet: take the ID from the row itself
+            row = statements.fetchone(cursor, LOCK_MEDICINE, (self.__name,))
+            if row is None:
+                print(f"Medicine '{self.__name}' not found in the database.")
                 return
-
-            cursor.execute("DELETE FROM medicines WHERE name=%s", (self.__name,))
+            medicine_id = row[0]
+            statements.run(cursor, DELETE_MEDICINE, (self.__name,))
+            stock_levels.forget(cursor, medicine_id)
+            version = catalog.bump_version(cursor)
             conn.commit()
             print("Medicine deleted successfully!")
 
         except Exception as e:
             print("Error deleting medicine:", e)
+            return
 
         finally:
             cursor.close()
             conn.close()
 
+        catalog.after_write(version, medicine_id)
+
     @staticmethod
     def get_expired_medicines():
         """Fetches and displays expired medicines from inventory."""
@@ -202,6 +220,19 @@ class Medicine:
             cursor.close()
             conn.close()
 
+    @staticmethod
+    def stream_expired_medicines():
+        """Streaming get_expired_medicines(): a ReportStream with a batch summary, nothing printed"""
+        return ReportStream(
+            """SELECT m.medicine_id, m.name, m.manufacturer, m.price,
+                      i.batch_number, i.current_quantity, i.expiry_date, i.location
+               FROM medicines m
+               JOIN inventory i ON m.medicine_id = i.medicine_id
+               WHERE i.expiry_date < %s AND i.current_quantity > 0
+               ORDER BY i.expiry_date""",
+            (date.today(),), accumulate=count_batch, summary=batch_summary()
+        )
+
     def display(self):
         """Displays medicine details."""
         print('Medicine:', self.__name)
@@ -214,59 +245,42 @@ class Medicine:
 
     @staticmethod
     def get_medicine_by_name(name):
-        """Fetches a medicine from the database by name."""
+        """Fetches a medicine from the catalog cache by name."""
         try:
-            conn = get_db_connection()
-            cursor = conn.cursor(dictionary=True)
-            cursor.execute("SELECT * FROM medicines WHERE name = %s", (name,))
-            medicine = cursor.fetchone()
+            medicine = catalog.get_by_name(name)
             if not medicine:
                print(f"Medicine '{name}' not found in the database.")
             return medicine
         except Exception as e:
             print("Error fetching medicine:", e)
             return None
-        finally:
-            cursor.close()
-            conn.close()
 
     @staticmethod
     def get_id_by_name(name):
-        """Fetches the medicine_id from the database by name."""
+        """Fetches the medicine_id from the catalog cache by name."""
         try:
-            conn = get_db_connection()
-            cursor = conn.cursor(dictionary=True)
-            cursor.execute("SELECT medicine_id FROM medicines WHERE name = %s", (name,))
-            medicine = cursor.fetchone()
-            if not medicine:
+            medicine_id = catalog.id_for_name(name)
+            if medicine_id is None:
                 print(f"Medicine '{name}' not found in the database.")
-                return None
-            return medicine['medicine_id']
+            return medicine_id
         except Exception as e:
             print("Error fetching medicine ID:", e)
             return None
-        finally:
-            cursor.close()
-            conn.close()
 
     @staticmethod
     def get_low_stock_medicines(threshold=10):
         """Returns medicines with total stock below threshold"""
         try:
-            conn = get_db_connection()
-            cursor = conn.cursor(dictionary=True)
-            
-            query = """
-                SELECT m.medicine_id, m.name, m.manufacturer, 
-                       SUM(i.current_quantity) AS total_stock
-                FROM medicines m
-                JOIN inventory i ON m.medicine_id = i.medicine_id
-                GROUP BY m.medicine_id
-                HAVING total_stock < %s
-                ORDER BY total_stock ASC
-            """
-            cursor.execute(query, (threshold,))
-            low_stock = cursor.fetchall()
+            low_stock = []
+            for medicine_id, total_stock in stock_levels.below(threshold):
+                medicine = catalog.get_by_id(medicine_id)
+                if medicine:
+                    low_stock.append({
+                        'medicine_id': medicine_id,
+                        'name': medicine['name'],
+                        'manufacturer': medicine['manufacturer'],
+                        'total_stock': total_stock
+                    })
             
             if not low_stock:
                 print(f"No medicines below {threshold} units.")
@@ -283,9 +297,6 @@ class Medicine:
             
         except Exception as e:
             print("Error checking low stock:", e)
-        finally:
-            cursor.close()
-            conn.close()
 
     @staticmethod
     def get_nearly_expiring_medicines(days=30):
@@ -294,17 +305,19 @@ class Medicine:
             conn = get_db_connection()
             cursor = conn.cursor(dictionary=True)
             
+            today = date.today()
             query = """
-                SELECT m.name, i.batch_number, i.expiry_date, 
-                       i.current_quantity, DATEDIFF(i.expiry_date, CURDATE()) AS days_left
+                SELECT m.name, i.batch_number, i.expiry_date, i.current_quantity
                 FROM inventory i
                 JOIN medicines m ON i.medicine_id = m.medicine_id
-                WHERE i.expiry_date BETWEEN CURDATE() AND DATE_ADD(CURDATE(), INTERVAL %s DAY)
+                WHERE i.expiry_date BETWEEN %s AND %s
                 AND i.current_quantity > 0
                 ORDER BY i.expiry_date ASC
             """
-            cursor.execute(query, (days,))
+            cursor.execute(query, (today, today + timedelta(days=days)))
             expiring = cursor.fetchall()
+            for item in expiring:
+                item['days_left'] = (item['expiry_date'] - today).days
             
             if not expiring:
                 print(f"No medicines expiring within {days} days.")
@@ -326,23 +339,24 @@ class Medicine:
             cursor.close()
             conn.close()
 
+    @staticmethod
+    def read_medicines_page(page_token=None, page_size=DEFAULT_PAGE_SIZE, backward=False):
+        """One page of the catalog by ID with current stock; returns (rows, next_token)"""
+        rows, next_token = fetch_keyset_page(
+            f"SELECT {CATALOG_COLUMNS} FROM medicines",
+            [("medicine_id", "medicine_id")],
+            page_token=page_token, page_size=page_size, backward=backward
+        )
+        for row in rows:
+            row['requires_prescription'] = bool(row['requires_prescription'])
+            row['total_stock'] = stock_levels.get(row['medicine_id'])
+        return rows, next_token
+
     @staticmethod
     def search_medicines(search_term):
-        """Searches by name, manufacturer, or category"""
+        """Searches by name, manufacturer, or category (ranked, typo-tolerant)"""
         try:
-            conn = get_db_connection()
-            cursor = conn.cursor(dictionary=True)
-            
-            query = """
-                SELECT m.*, COALESCE(SUM(i.current_quantity), 0) AS stock
-                FROM medicines m
-                LEFT JOIN inventory i ON m.medicine_id = i.medicine_id
-                WHERE m.name LIKE %s OR m.manufacturer LIKE %s OR m.category LIKE %s
-                GROUP BY m.medicine_id
-            """
-            param = f"%{search_term}%"
-            cursor.execute(query, (param, param, param))
-            results = cursor.fetchall()
+            results = search_index.search_medicines(search_term)
             
             if not results:
                 print("No matching medicines found.")
@@ -360,34 +374,14 @@ class Medicine:
             
         except Exception as e:
             print("Search error:", e)
-        finally:
-            cursor.close()
-            conn.close()
 
     @staticmethod
     def get_medicine_by_id(medicine_id):
-        """Get medicine details by ID from the database"""
-        conn = None
-        cursor = None
+        """Get medicine details by ID from the catalog cache"""
         try:
-            conn = get_db_connection()
-            cursor = conn.cursor(dictionary=True)
-        
-            query = """
-            SELECT 
-            medicine_id,
-            name,
-            manufacturer,
-            price,
-            category,
-            description,
-            dosage,
-            requires_prescription
-            FROM medicines 
-            WHERE medicine_id = %s
-            """
-            cursor.execute(query, (medicine_id,))
-            medicine = cursor.fetchone()
+            medicine = catalog.get_by_id(medicine_id)
+            if not medicine:
+                return None
         
             return Medicine(
             name=medicine['name'],
@@ -402,8 +396,3 @@ class Medicine:
         except Exception as e:
             print(f"Error fetching medicine by ID: {str(e)}")
             return None
-        finally:
-            if cursor:
-               cursor.close()
-            if conn and conn.is_connected():
-               conn.close()
\ No newline at end of file
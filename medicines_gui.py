@@ -1,8 +1,13 @@
 # medicines_gui.py
 import customtkinter
-from tkinter import messagebox, ttk
+from tkinter import messagebox, ttk, filedialog
 from theme import setup_theme
 from medicines import Medicine
+from background import BackgroundLoader
+from paged_view import PagedTreeview
+from paging import cursor_for
+from tree_sync import KeyedTreeview
+from price_list import import_price_list
 from datetime import datetime
 
 
@@ -26,6 +31,7 @@ class MedicinesWindow:
         self.window = customtkinter.CTk()
         self.window.title("Pharmacy Management System - Medicines")
         self.window.geometry("1400x900")
+        self.loader = BackgroundLoader(self.window)
         
         # Configure grid layout
         self.window.grid_rowconfigure(0, weight=1)
@@ -106,6 +112,14 @@ class MedicinesWindow:
         )
         delete_button.pack(side="left", padx=5)
         
+        import_button = customtkinter.CTkButton(
+            action_frame,
+            text="📥 Import Price List",
+            command=self.import_price_list_file,
+            **button_style
+        )
+        import_button.pack(side="left", padx=5)
+        
         # Reports frame with improved layout
         reports_frame = customtkinter.CTkFrame(
             main_frame, 
@@ -234,6 +248,17 @@ class MedicinesWindow:
         scrollbar.pack(side="right", fill="y")
         self.tree.configure(yscrollcommand=scrollbar.set)
         
+        # Full list is a virtual list: pages of the catalog are loaded as you scroll
+        # Refreshes diff rows by medicine ID instead of rebuilding the tree
+        self.rows = KeyedTreeview(self.tree, lambda med: med["medicine_id"], self.medicine_row_values)
+        self.pager = PagedTreeview(
+            self.rows, scrollbar, self.loader, "medicines",
+            fetch_page=Medicine.read_medicines_page,
+            row_token=lambda med: cursor_for(med, ("medicine_id",)),
+            on_empty=lambda: messagebox.showinfo("Info", "No medicines found in database"),
+            on_error=lambda e: messagebox.showerror("Error", f"Failed to load medicines: {str(e)}")
+        )
+        
         # Configure columns with improved widths
         self.tree["columns"] = ("id", "name", "manufacturer", "price", "category", "prescription", "stock")
         self.tree.column("#0", width=0, stretch=False)
@@ -258,59 +283,98 @@ class MedicinesWindow:
         self.tree.bind("<Double-1>", self.show_medicine_details)
     
     def load_medicines_list(self):
-        """Load all medicines into the treeview"""
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-            
-        try:
-            medicines = Medicine.read_all_medicines()
-            if not medicines:
-                messagebox.showinfo("Info", "No medicines found in database")
-                return
-                
-            for med in medicines:
-                self.tree.insert("", "end", values=(
-                    med["medicine_id"],
-                    med["name"],
-                    med["manufacturer"],
-                    f"{med['price']:.2f}",
-                    med["category"],
-                    "Yes" if med["requires_prescription"] else "No",
-                    med.get("total_stock", "N/A")
-                ))
-                
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to load medicines: {str(e)}")
+        """Show the catalog by ID; further pages load on scroll"""
+        self.pager.reload()
+    
+    @staticmethod
+    def medicine_row_values(med):
+        """Treeview values for one medicine row"""
+        return (
+            med["medicine_id"],
+            med["name"],
+            med["manufacturer"],
+            f"{med['price']:.2f}",
+            med["category"],
+            "Yes" if med["requires_prescription"] else "No",
+            med.get("total_stock", med.get("stock", "N/A"))
+        )
     
     def search_medicines(self, search_term):
         """Search medicines by name, manufacturer or category"""
         if not search_term.strip():
             self.load_medicines_list()
             return
-            
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-            
+        
+        # Same key as the full list: a new search supersedes a running load
+        self.loader.submit(
+            "medicines", Medicine.search_medicines, search_term,
+            on_done=self.show_search_results,
+            on_error=lambda e: messagebox.showerror("Error", f"Search failed: {str(e)}")
+        )
+    
+    def show_search_results(self, results):
+        """Fill the treeview with medicine search results"""
+        self.pager.suspend()
         try:
-            results = Medicine.search_medicines(search_term)
+            self.rows.sync(results or [])
             if not results:
                 messagebox.showinfo("Info", "No matching medicines found")
-                return
-                
-            for med in results:
-                self.tree.insert("", "end", values=(
-                    med["medicine_id"],
-                    med["name"],
-                    med["manufacturer"],
-                    f"{med['price']:.2f}",
-                    med["category"],
-                    "Yes" if med["requires_prescription"] else "No",
-                    med.get("stock", "N/A")
-                ))
                 
         except Exception as e:
             messagebox.showerror("Error", f"Search failed: {str(e)}")
     
+    def import_price_list_file(self):
+        """Preview a catalog/price-list file, then apply it on confirmation"""
+        path = filedialog.askopenfilename(
+            title="Select price list",
+            filetypes=[("Price lists", "*.csv *.xlsx"), ("All files", "*.*")]
+        )
+        if not path:
+            return
+        self.loader.submit(
+            "import", import_price_list, path, dry_run=True,
+            on_done=lambda preview: self.confirm_price_list(path, preview),
+            on_error=lambda e: messagebox.showerror("Error", f"Import failed: {str(e)}")
+        )
+    
+    def confirm_price_list(self, path, preview):
+        """Show what a price list would change and apply it if confirmed"""
+        if not preview["success"]:
+            messagebox.showerror("Import Failed", preview["message"])
+            return
+        if not preview["inserted"] and not preview["updated"]:
+            messagebox.showinfo("Price List", f"Nothing to change.\n\n{self.describe_import(preview)}")
+            return
+        if not messagebox.askyesno("Apply Price List", f"{self.describe_import(preview)}\n\nApply these changes?"):
+            return
+        self.loader.submit(
+            "import", import_price_list, path,
+            on_done=self.show_price_list_result,
+            on_error=lambda e: messagebox.showerror("Error", f"Import failed: {str(e)}")
+        )
+    
+    def show_price_list_result(self, result):
+        """Report an applied price list and refresh the list"""
+        if result["success"]:
+            messagebox.showinfo("Price List Imported", self.describe_import(result))
+            self.load_medicines_list()
+        else:
+            messagebox.showerror("Import Failed", result["message"])
+    
+    @staticmethod
+    def describe_import(result, limit=10):
+        """Summary text: counts, first price changes and first errors"""
+        lines = [result["message"]]
+        for name, old, new in result["price_changes"][:limit]:
+            lines.append(f"  {name}: Rs {old:.2f} -> Rs {new:.2f}")
+        if len(result["price_changes"]) > limit:
+            lines.append(f"  ... and {len(result['price_changes']) - limit} more price change(s)")
+        for line, error in result["errors"][:limit]:
+            lines.append(f"Line {line}: {error}")
+        if len(result["errors"]) > limit:
+            lines.append(f"... and {len(result['errors']) - limit} more error(s)")
+        return "\n".join(lines)
+    
     def clear_search(self):
         """Clear search results and show all medicines"""
         self.search_entry.delete(0, "end")
@@ -0,0 +1,313 @@
+# migrations.py
+import re
+import sys
+from datetime import datetime
+
+from backends import SQLITE_SCHEMA
+
+# Core tables for the MySQL server (SQLite uses backends.SQLITE_SCHEMA)
+MYSQL_SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS medicines (
+        medicine_id INT PRIMARY KEY,
+        name VARCHAR(100) NOT NULL UNIQUE,
+        manufacturer VARCHAR(100),
+        price DECIMAL(10,2) NOT NULL,
+        category VARCHAR(50),
+        description TEXT,
+        dosage VARCHAR(100),
+        requires_prescription BOOLEAN NOT NULL DEFAULT FALSE
+    )""",
+    """CREATE TABLE IF NOT EXISTS suppliers (
+        supplier_id INT PRIMARY KEY,
+        name VARCHAR(100) NOT NULL,
+        phone VARCHAR(20) UNIQUE,
+        email VARCHAR(100) UNIQUE,
+        address TEXT
+    )""",
+    """CREATE TABLE IF NOT EXISTS inventory (
+        inventory_id INT PRIMARY KEY,
+        medicine_id INT NOT NULL,
+        supplier_id INT,
+        quantity_added INT NOT NULL,
+        date_added TIMESTAMP NULL,
+        batch_number VARCHAR(50),
+        expiry_date DATE,
+        current_quantity INT NOT NULL,
+        location VARCHAR(100),
+        FOREIGN KEY (medicine_id) REFERENCES medicines(medicine_id),
+        FOREIGN KEY (supplier_id) REFERENCES suppliers(supplier_id)
+    )""",
+    """CREATE TABLE IF NOT EXISTS prescriptions (
+        prescription_id INT PRIMARY KEY,
+        date DATE NOT NULL,
+        total_amount DECIMAL(10,2) NOT NULL DEFAULT 0
+    )""",
+    """CREATE TABLE IF NOT EXISTS prescription_medicines (
+        prescription_id INT NOT NULL,
+        medicine_id INT NOT NULL,
+        quantity_bought INT NOT NULL,
+        total_price DECIMAL(10,2) NOT NULL,
+        PRIMARY KEY (prescription_id, medicine_id),
+        FOREIGN KEY (prescription_id) REFERENCES prescriptions(prescription_id),
+        FOREIGN KEY (medicine_id) REFERENCES medicines(medicine_id)
+    )""",
+    """CREATE TABLE IF NOT EXISTS users (
+        user_id INT PRIMARY KEY,
+        name VARCHAR(100) NOT NULL,
+        email VARCHAR(100) NOT NULL UNIQUE,
+        phone VARCHAR(20) UNIQUE,
+        role VARCHAR(20) NOT NULL,
+        password VARCHAR(255) NOT NULL
+    )""",
+)
+
+# (table, index name, columns) for the hot access paths; an index is only
+# created when no existing index already starts with the same columns
+HOT_PATH_INDEXES = (
+    # FIFO batch pick: WHERE medicine_id IN (...) AND current_quantity > 0
+    # ORDER BY medicine_id, expiry_date, date_added, inventory_id (covering)
+    ("inventory", "idx_inventory_fifo",
+     ("medicine_id", "expiry_date", "date_added", "inventory_id", "current_quantity")),
+    # Expiry reports and the inventory screen's keyset paging
+    ("inventory", "idx_inventory_expiry", ("expiry_date", "inventory_id")),
+    # Supplier inventory: WHERE supplier_id = ? ORDER BY expiry_date
+    ("inventory", "idx_inventory_supplier", ("supplier_id", "expiry_date")),
+    # Every name -> id lookup (normally already covered by the UNIQUE key)
+    ("medicines", "idx_medicines_name", ("name",)),
+    # Prescription search tab: by date, by amount range (keyset order)
+    ("prescriptions", "idx_prescriptions_date", ("date", "prescription_id")),
+    ("prescriptions", "idx_prescriptions_amount", ("total_amount", "prescription_id")),
+    # Line items of one prescription (normally the primary key's prefix)
+    ("prescription_medicines", "idx_prescription_medicines_prescription", ("prescription_id",)),
+)
+
+
+def _values(row):
+    return tuple(row.values()) if isinstance(row, dict) else tuple(row)
+
+
+def _index_prefixes(cursor, backend, table):
+    """Column lists of the table's existing indexes (primary key included)"""
+    indexes = {}
+    if backend.name == "sqlite":
+        cursor.execute(f"PRAGMA index_list({table})")
+        names = [_values(row)[1] for row in cursor.fetchall()]
+        for name in names:
+            cursor.execute(f"PRAGMA index_info({name})")
+            indexes[name] = [_values(row)[2] for row in sorted(cursor.fetchall(), key=lambda r: _values(r)[0])]
+        cursor.execute(f"PRAGMA table_info({table})")
+        primary = sorted((_values(row)[5], _values(row)[1]) for row in cursor.fetchall() if _values(row)[5])
+        if primary:
+            indexes["PRIMARY"] = [name for _, name in primary]
+    else:
+        cursor.execute(
+            """SELECT index_name, column_name FROM information_schema.statistics
+               WHERE table_schema = DATABASE() AND table_name = %s
+               ORDER BY index_name, seq_in_index""",
+            (table,)
+        )
+        for name, column in (_values(row) for row in cursor.fetchall()):
+            indexes.setdefault(name, []).append(column)
+    return [[column.lower() for column in columns] for columns in indexes.values()]
+
+
+def create_index(cursor, backend, table, name, columns):
+    """Create an index unless an existing one already starts with ``columns``.
+
+    Returns True if an index was created.
+    """
+    wanted = [column.lower() for column in columns]
+    for existing in _index_prefixes(cursor, backend, table):
+        if existing[:len(wanted)] == wanted:
+            return False
+    cursor.execute(f"CREATE INDEX {name} ON {table} ({', '.join(columns)})")
+    return True
+
+
+def _column_names(cursor, backend, table):
+    if backend.name == "sqlite":
+        cursor.execute(f"PRAGMA table_info({table})")
+        return {_values(row)[1].lower() for row in cursor.fetchall()}
+    cursor.execute(
+        """SELECT column_name FROM information_schema.columns
+           WHERE table_schema = DATABASE() AND table_name = %s""",
+        (table,)
+    )
+    return {_values(row)[0].lower() for row in cursor.fetchall()}
+
+
+def add_column(cursor, backend, table, column, definition):
+    """Add a column unless the table already has it; returns True if it was added"""
+    if column.lower() in _column_names(cursor, backend, table):
+        return False
+    cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+    return True
+
+
+def _core_tables(cursor, backend):
+    if backend.name == "sqlite":
+        statements = [statement.strip() for statement in SQLITE_SCHEMA.split(";") if statement.strip()]
+    else:
+        statements = MYSQL_SCHEMA
+    for statement in statements:
+        cursor.execute(statement)
+
+
+def _hot_path_indexes(cursor, backend):
+    for table, name, columns in HOT_PATH_INDEXES:
+        create_index(cursor, backend, table, name, columns)
+
+
+# Tables whose rows carry a version for optimistic edits: every write to a
+# row bumps it, and an edit based on an older read is refused
+VERSIONED_TABLES = ("inventory", "prescriptions")
+
+
+def _row_versions(cursor, backend):
+    for table in VERSIONED_TABLES:
+        add_column(cursor, backend, table, "row_version", "INT NOT NULL DEFAULT 0")
+
+
+def _prescription_batches(cursor, backend):
+    # Which batches each prescription line's units were dispensed from. No
+    # foreign key to inventory: an emptied batch can still be deleted
+    cursor.execute(
+        """CREATE TABLE IF NOT EXISTS prescription_batches (
+            prescription_id INT NOT NULL,
+            medicine_id INT NOT NULL,
+            inventory_id INT NOT NULL,
+            quantity INT NOT NULL,
+            PRIMARY KEY (prescription_id, medicine_id, inventory_id)
+        )"""
+    )
+
+
+# (version, description, step(cursor, backend)), applied in order. Append
+# new steps; never edit or renumber one that has shipped.
+MIGRATIONS = (
+    (1, "core tables", _core_tables),
+    (2, "indexes for the hot query predicates", _hot_path_indexes),
+    (3, "row versions for optimistic edits", _row_versions),
+    (4, "batches dispensed per prescription line", _prescription_batches),
+)
+
+
+def schema_version(cursor):
+    """Highest applied migration (0 for a new database)"""
+    cursor.execute(
+        """CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INT PRIMARY KEY,
+            description VARCHAR(200) NOT NULL,
+            applied_at TIMESTAMP NOT NULL
+        )"""
+    )
+    cursor.execute("SELECT MAX(version) FROM schema_migrations")
+    return _values(cursor.fetchone())[0] or 0
+
+
+def apply_migrations(cursor, backend, target=None):
+    """Bring the schema up to ``target`` (the latest by default).
+
+    Runs on the caller's cursor; database.py calls it before the helper
+    table hooks. Returns the versions that were applied.
+    """
+    current = schema_version(cursor)
+    applied = []
+    for version, description, step in MIGRATIONS:
+        if version <= current or (target is not None and version > target):
+            continue
+        step(cursor, backend)
+        try:
+            cursor.execute(
+                "INSERT INTO schema_migrations (version, description, applied_at) VALUES (%s, %s, %s)",
+                (version, description, datetime.now())
+            )
+        except backend.errors as db_error:
+            if not backend.is_duplicate_key(db_error):
+                raise
+            # Another terminal applied the same (idempotent) step at the same time
+        applied.append(version)
+    return applied
+
+
+# ---------- plan self-check ----------
+
+# The statements behind the hot paths, with representative parameters
+HOT_QUERIES = (
+    ("FIFO batch pick",
+     """SELECT inventory_id, medicine_id, current_quantity FROM inventory
+        WHERE medicine_id IN (%s, %s) AND current_quantity > 0
+        ORDER BY medicine_id, expiry_date, date_added, inventory_id""", (1, 2)),
+    ("expiry report",
+     """SELECT i.*, m.name AS medicine_name FROM inventory i
+        JOIN medicines m ON i.medicine_id = m.medicine_id
+        WHERE i.expiry_date BETWEEN %s AND %s ORDER BY i.expiry_date""", ("2030-01-01", "2030-02-01")),
+    ("inventory page",
+     """SELECT i.inventory_id FROM inventory i
+        WHERE i.expiry_date > %s OR (i.expiry_date = %s AND i.inventory_id > %s)
+        ORDER BY i.expiry_date, i.inventory_id LIMIT 201""", ("2030-01-01", "2030-01-01", 0)),
+    ("supplier inventory",
+     """SELECT i.inventory_id, m.name, i.expiry_date FROM inventory i
+        JOIN medicines m ON i.medicine_id = m.medicine_id
+        WHERE i.supplier_id = %s AND i.current_quantity > 0
+        ORDER BY i.expiry_date, m.name""", (1,)),
+    ("medicine name lookup", "SELECT medicine_id FROM medicines WHERE name = %s", ("Panadol",)),
+    ("prescriptions by date",
+     "SELECT * FROM prescriptions WHERE date = %s ORDER BY prescription_id", ("2030-01-01",)),
+    ("prescriptions by amount",
+     """SELECT * FROM prescriptions WHERE total_amount BETWEEN %s AND %s
+        ORDER BY total_amount, prescription_id""", (10, 20)),
+    ("prescription lines",
+     """SELECT m.name, pm.quantity_bought, pm.total_price FROM prescription_medicines pm
+        JOIN medicines m ON pm.medicine_id = m.medicine_id
+        WHERE pm.prescription_id = %s""", (1,)),
+)
+
+_SQLITE_FULL_SCAN = re.compile(r"^SCAN (\w+)$")
+
+
+def full_scans(plan_rows, backend):
+    """Tables a plan reads in full (no index), from EXPLAIN output rows"""
+    scans = []
+    for row in plan_rows:
+        if backend.name == "sqlite":
+            detail = row["detail"] if isinstance(row, dict) else _values(row)[-1]
+            match = _SQLITE_FULL_SCAN.match(detail.replace("TABLE ", ""))
+            if match:
+                scans.append(match.group(1))
+        elif (row.get("type") or "").upper() == "ALL":
+            scans.append(row.get("table"))
+    return scans
+
+
+def check_plans(explain, backend):
+    """EXPLAIN every hot query; returns [(name, tables scanned in full)] for the failures"""
+    failures = []
+    for name, query, params in HOT_QUERIES:
+        scans = full_scans(explain(query, params), backend)
+        if scans:
+            failures.append((name, scans))
+    return failures
+
+
+def main(argv=None):
+    """python migrations.py [--check]: apply pending migrations, optionally check the plans"""
+    import database
+
+    args = argv if argv is not None else sys.argv[1:]
+    database.get_pool()     # applies any pending migrations
+    backend = database.get_backend()
+    with database.transaction() as (conn, cursor):
+        print(f"Schema version {schema_version(cursor)} ({backend.name})")
+    if "--check" not in args:
+        return 0
+
+    failures = check_plans(database.explain, backend)
+    for name, scans in failures:
+        print(f"FULL SCAN  {name}: {', '.join(str(table) for table in scans)}")
+    print(f"{len(HOT_QUERIES) - len(failures)}/{len(HOT_QUERIES)} hot queries use an index")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,151 @@
+# paged_view.py
+from collections import deque
+
+from paging import DEFAULT_PAGE_SIZE
+
+MAX_PAGES = 3           # pages kept in the widget at once
+PREFETCH_MARGIN = 0.1   # load the next page when the view is this close to an end
+
+
+class _Page:
+    __slots__ = ("first", "last", "items")
+
+    def __init__(self, first, last, items):
+        self.first = first      # token seeking before the page (for backward loads)
+        self.last = last        # token seeking past the page (for forward loads)
+        self.items = items      # Treeview item ids, in display order
+
+
+class PagedTreeview:
+    """Virtual list mode for a ttk.Treeview over a keyset-paginated query.
+
+    ``fetch_page(page_token, page_size, backward)`` returns ``(rows, next_token)``
+    and runs on the screen's BackgroundLoader under ``key``. At most
+    ``max_pages`` pages are materialized: scrolling near the bottom appends
+    the next page and drops the top one, scrolling near the top does the
+    reverse. Opening a screen therefore costs one page of rows whatever the
+    size of the table. Rows are written through ``view`` (a KeyedTreeview),
+    so reload() re-reads the pages on screen and only changed rows are
+    touched. Loading something else under the same key (e.g. a search)
+    supersedes a pending page; call suspend() before showing rows that did
+    not come from this pager.
+    """
+
+    def __init__(self, view, scrollbar, loader, key, fetch_page, row_token,
+                 page_size=DEFAULT_PAGE_SIZE, max_pages=MAX_PAGES, on_empty=None, on_error=None):
+        self.view = view
+        self.tree = view.tree
+        self.scrollbar = scrollbar
+        self.loader = loader
+        self.key = key
+        self.fetch_page = fetch_page
+        self.row_token = row_token
+        self.page_size = page_size
+        self.max_pages = max(2, max_pages)
+        self.on_empty = on_empty
+        self.on_error = on_error
+        self.active = False
+        self._pages = deque()
+        self._at_start = True
+        self._at_end = True
+        self.tree.configure(yscrollcommand=self._on_scroll)
+
+    def reload(self):
+        """Re-read the pages on screen (or the first page) and resume paging"""
+        if self.active and self._pages:
+            first, at_start, count = self._pages[0].first, self._at_start, self.page_size * len(self._pages)
+        else:
+            first, at_start, count = None, True, self.page_size
+        self.active = True
+        self.loader.submit(self.key, self._fetch_window, first, at_start, count,
+                           on_done=self._show_window, on_error=self.on_error)
+
+    def suspend(self):
+        """Stop paging while the tree shows other rows; reload() resumes"""
+        self.active = False
+        self._pages.clear()
+
+    def _fetch_window(self, first, at_start, count):
+        """Worker side of reload(): the rows from the top of the window on"""
+        start = None
+        if not at_start:
+            # The window starts at a row; find the token just before it
+            before, _ = self.fetch_page(first, 1, True)
+            start = self.row_token(before[0]) if before else None
+        rows, next_token = self.fetch_page(start, count, False)
+        return rows, next_token, start is None
+
+    def _show_window(self, result):
+        rows, next_token, at_start = result
+        self._pages.clear()
+        self._at_start = at_start
+        self._at_end = next_token is None
+        self.view.sync(rows)
+        if not rows:
+            if self.on_empty:
+                self.on_empty()
+            return
+        for offset in range(0, len(rows), self.page_size):
+            chunk = rows[offset:offset + self.page_size]
+            self._pages.append(_Page(self.row_token(chunk[0]), self.row_token(chunk[-1]),
+                                     [str(self.view.row_key(row)) for row in chunk]))
+
+    def _make_page(self, rows, index):
+        items = self.view.insert(rows, index)
+        return _Page(self.row_token(rows[0]), self.row_token(rows[-1]), items)
+
+    def _drop(self, page):
+        kept = {item for other in self._pages for item in other.items}
+        self.view.remove([item for item in page.items if item not in kept])
+
+    # ---------- scrolling ----------
+
+    def _on_scroll(self, first, last):
+        self.scrollbar.set(first, last)
+        if not self.active or not self._pages or self.loader.busy(self.key):
+            return
+        first, last = float(first), float(last)
+        if last >= 1.0 - PREFETCH_MARGIN and not self._at_end:
+            self.loader.submit(self.key, self.fetch_page, self._pages[-1].last, self.page_size, False,
+                               on_done=self._append, on_error=self.on_error)
+        elif first <= PREFETCH_MARGIN and not self._at_start:
+            self.loader.submit(self.key, self.fetch_page, self._pages[0].first, self.page_size, True,
+                               on_done=self._prepend, on_error=self.on_error)
+
+    def _append(self, result):
+        rows, next_token = result
+        self._at_end = next_token is None
+        if not rows or not self.active:
+            return
+        anchor = self._top_item()
+        self._pages.append(self._make_page(rows, "end"))
+        if len(self._pages) > self.max_pages:
+            self._drop(self._pages.popleft())
+            self._at_start = False
+        self._keep_on_top(anchor)
+
+    def _prepend(self, result):
+        rows, next_token = result
+        self._at_start = next_token is None
+        if not rows or not self.active:
+            return
+        anchor = self._top_item()
+        self._pages.appendleft(self._make_page(rows, 0))
+        if len(self._pages) > self.max_pages:
+            self._drop(self._pages.pop())
+            self._at_end = False
+        self._keep_on_top(anchor)
+
+    def _top_item(self):
+        children = self.tree.get_children()
+        if not children:
+            return None
+        index = int(round(float(self.tree.yview()[0]) * len(children)))
+        return children[min(index, len(children) - 1)]
+
+    def _keep_on_top(self, item):
+        """Scroll so that ``item`` stays the first visible row after pages moved"""
+        if item is None or not self.tree.exists(item):
+            return
+        children = self.tree.get_children()
+        self.tree.yview_moveto(self.tree.index(item) / len(children))
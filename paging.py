@@ -0,0 +1,147 @@
+# paging.py
+import base64
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+from database import get_db_connection
+
+DEFAULT_PAGE_SIZE = 200
+
+
+class InvalidCursor(ValueError):
+    """A page cursor that was not produced by encode_cursor()"""
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {"t": value.isoformat()}
+    if isinstance(value, date):
+        return {"d": value.isoformat()}
+    if isinstance(value, Decimal):
+        return {"n": str(value)}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict):
+        if "t" in value:
+            return datetime.fromisoformat(value["t"])
+        if "d" in value:
+            return date.fromisoformat(value["d"])
+        if "n" in value:
+            return Decimal(value["n"])
+        raise InvalidCursor("Unknown value in page cursor")
+    return value
+
+
+def encode_cursor(values):
+    """Opaque token for the sort-key values of the last row of a page"""
+    payload = json.dumps([_encode_value(value) for value in values], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(token):
+    """Sort-key values stored in a token made by encode_cursor()"""
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor(f"Malformed page cursor: {e}")
+    if not isinstance(values, list):
+        raise InvalidCursor("Malformed page cursor")
+    return [_decode_value(value) for value in values]
+
+
+def cursor_for(row, keys):
+    """Cursor that seeks past ``row`` (keys are the row's sort-key fields)"""
+    return encode_cursor([row[key] for key in keys])
+
+
+def _compare(column, op, value):
+    # Both backends sort NULL first in ascending order
+    if value is None:
+        if op == "=":
+            return f"{column} IS NULL", []
+        if op == ">":
+            return f"{column} IS NOT NULL", []
+        return "1 = 0", []
+    if op == "<":
+        return f"({column} < %s OR {column} IS NULL)", [value]
+    return f"{column} {op} %s", [value]
+
+
+def seek_condition(columns, values, backward=False):
+    """WHERE fragment for "(columns) > (values)" (or "<" going backward).
+
+    Written as an OR of prefixes rather than a row-value comparison so that
+    MySQL and SQLite can both use an index on the columns.
+    """
+    op = "<" if backward else ">"
+    clauses = []
+    params = []
+    for position, column in enumerate(columns):
+        parts = []
+        for earlier, value in zip(columns[:position], values[:position]):
+            sql, args = _compare(earlier, "=", value)
+            parts.append(sql)
+            params.extend(args)
+        sql, args = _compare(column, op, values[position])
+        parts.append(sql)
+        params.extend(args)
+        clauses.append("(" + " AND ".join(parts) + ")")
+    return "(" + " OR ".join(clauses) + ")", params
+
+
+def keyset_page(cursor, select, order, where=(), params=(), page_token=None,
+                page_size=DEFAULT_PAGE_SIZE, backward=False, group_by=None):
+    """Fetch one page of a query with seek-based pagination.
+
+    ``select`` is the SELECT ... FROM ... part, ``order`` a sequence of
+    (sql column, row key) pairs that is unique per row, ``where`` extra
+    conditions with their ``params``. Grouped queries must order by the
+    grouping key (the seek runs before grouping, on the index).
+    Returns (rows, next_token); the token is None on the last page.
+    Going ``backward`` from ``page_token`` returns the rows just before
+    it, still in ascending order, and a token for the page before those.
+    """
+    conditions = list(where)
+    args = list(params)
+    if page_token is not None:
+        values = decode_cursor(page_token)
+        if len(values) != len(order):
+            raise InvalidCursor("Page cursor does not match this listing")
+        sql, seek_args = seek_condition([column for column, _ in order], values, backward)
+        conditions.append(sql)
+        args.extend(seek_args)
+
+    direction = " DESC" if backward else ""
+    query = select
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    if group_by:
+        query += " GROUP BY " + group_by
+    query += " ORDER BY " + ", ".join(column + direction for column, _ in order)
+    query += " LIMIT %s"
+    args.append(page_size + 1)
+
+    cursor.execute(query, tuple(args))
+    rows = cursor.fetchall()
+    more = len(rows) > page_size
+    rows = rows[:page_size]
+    keys = [key for _, key in order]
+    if backward:
+        rows.reverse()
+        return rows, (cursor_for(rows[0], keys) if more else None)
+    return rows, (cursor_for(rows[-1], keys) if more else None)
+
+
+def fetch_keyset_page(select, order, **options):
+    """keyset_page() on a connection borrowed from the pool"""
+    conn = get_db_connection()
+    cursor = conn.cursor(dictionary=True)
+    try:
+        return keyset_page(cursor, select, order, **options)
+    finally:
+        cursor.close()
+        conn.close()
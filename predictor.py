@@ -1,11 +1,28 @@
-from database import get_db_connection
+import threading
+
+from catalog import catalog
+from predictor_rules import rule_store, np
+
 
 class MedicineEffectivenessPredictor:
-    def __init__(self):
-        # Initialize the connection here
-        self.conn = get_db_connection()
-        # Create the cursor after getting the connection
-        self.cur = self.conn.cursor()
+    """Scores medicines against conditions using the cached medicine catalog.
+
+    Scores come from the compiled rule tables of ``rule_store`` (hot
+    reloaded when the stored rules change) unless fixed ``tables`` are given.
+    """
+
+    def __init__(self, tables=None):
+        self._fixed_tables = tables
+        self._lock = threading.Lock()
+        self._catalog_version = None
+        self._arrays_tables = None  # tables the category columns were computed with
+        self._medicines = []        # catalog rows, in the order of the arrays below
+        self._columns = []          # category column per medicine
+        self._column_array = None   # the same as a NumPy index array
+
+    @property
+    def tables(self):
+        return self._fixed_tables or rule_store.tables()
 
     def predict_effectiveness(self, medicine_name, condition):
         """
@@ -13,78 +30,98 @@ class MedicineEffectivenessPredictor:
         condition mappings and medicine category adjustments.
         """
         # Step 1: Fetch medicine details
-        self.cur.execute("SELECT medicine_id, name, category, description FROM medicines WHERE name = %s", (medicine_name,))
-        med = self.cur.fetchone()
-    
+        med = catalog.get_by_name(medicine_name)
+
         if not med:
            print("\n[!] Medicine not found.")
            return 0.0
 
-        medicine_id, medicine_name, category, description = med
+        medicine_name, category = med['name'], med['category']
         print(f"\n[INFO] Medicine: {medicine_name}, Category: {category}")
 
-        # Step 2: Base effectiveness
-        base_effectiveness = 0.85
-
-        # Step 3: Condition mappings
-        condition_effectiveness_map = {
-        "fever": 0.90,
-        "infection": 0.80,
-        "headache": 0.85,
-        "cough": 0.75,
-        "cold": 0.70,
-        "asthma": 0.65,
-        "diabetes": 0.88,
-        "acidity": 0.78,
-        "pain": 0.83,
-        "inflammation": 0.79,
-        "weakness": 0.72,
-        "digestion": 0.76
-        }
-        condition_prob = condition_effectiveness_map.get(condition.lower(), 0.70)
+        tables = self.tables
+
+        # Step 2: Condition base probability
+        condition_prob = tables.probability(condition)
         print(f"[INFO] Condition '{condition}' → base probability: {condition_prob}")
 
-        # Step 4: Relevance mapping (condition → valid categories)
-        condition_category_map = {
-        "diabetes": ["diabetes"],
-        "headache": ["painkiller"],
-        "fever": ["painkiller", "antibiotic"],
-        "infection": ["antibiotic"],
-        "cough": ["respiratory", "antibiotic"],
-        "cold": ["respiratory"],
-        "asthma": ["respiratory"],
-        "acidity": ["digestive", "antacid"],
-        "pain": ["painkiller"],
-        "digestion": ["digestive"],
-        "weakness": ["vitamin supplement"],
-        "inflammation": ["painkiller", "antibiotic"]
-        }
-
-        # Step 5: Category effectiveness map
-        category_effectiveness_map = {
-        "painkiller": 0.05,
-        "antibiotic": 0.10,
-        "respiratory": 0.07,
-        "digestive": 0.04,
-        "vitamin supplement": 0.06,
-        "diabetes": 0.06,
-        "antiviral": 0.08,
-        "antifungal": 0.06,
-        "antacid": 0.03,
-        "immunity booster": 0.05,
-        "combination": 0.03
-        }
-
-        # Normalize
-        category_key = category.lower()
-        is_relevant = category_key in condition_category_map.get(condition.lower(), [])
-
-        # If relevant, apply full adjustment, otherwise reduce effectiveness drastically
-        if is_relevant:
-            adjustment = category_effectiveness_map.get(category_key, 0.02)
-            base_effectiveness += adjustment
-            print(f"[INFO] Relevant category! Adjustment: +{adjustment}")
-            return base_effectiveness
+        # Step 3: Relevant categories get the category adjustment, others a very low score
+        effectiveness = tables.score(category, condition)
+        if tables.is_relevant(category, condition):
+            print(f"[INFO] Relevant category! Adjustment: +{effectiveness - tables.base:.2f}")
         else:
             print(f"[INFO] Irrelevant category for condition '{condition}'. Reducing effectiveness.")
-            return 0.1  # Effectiveness very low due to mismatch
\ No newline at end of file
+        return effectiveness
+
+    # ---------- batch scoring ----------
+
+    def score_matrix(self, conditions=None):
+        """Score every catalog medicine against each condition in one pass.
+
+        Returns (medicines, conditions, scores) where scores[i][j] is the
+        score of medicines[i] for conditions[j] (a NumPy array when NumPy is
+        installed, else a list of lists). All known conditions by default.
+        """
+        tables = self.tables
+        if conditions is None:
+            conditions = list(tables.conditions)
+        elif isinstance(conditions, str):
+            conditions = [conditions]
+        medicines, columns, column_array = self._catalog_arrays(tables)
+        rows = [tables.condition_row(condition) for condition in conditions]
+
+        if column_array is not None:
+            # Gather (condition rows) x (medicine columns), then transpose
+            scores = tables.matrix[np.ix_(rows, column_array)].T
+        else:
+            scores = [[tables.rows[row][column] for row in rows] for column in columns]
+        return medicines, conditions, scores
+
+    def score_all(self, condition):
+        """{medicine_id: score} for every catalog medicine"""
+        medicines, _, scores = self.score_matrix([condition])
+        return {medicine['medicine_id']: float(row[0]) for medicine, row in zip(medicines, scores)}
+
+    def top_k(self, condition, k=5, exclude=None):
+        """The k best-scoring medicines for a condition as (medicine row, score), best first.
+
+        Only medicines whose category is relevant to the condition are
+        returned; ``exclude`` is a collection of medicine IDs to leave out
+        (e.g. the out-of-stock medicine being replaced).
+        """
+        mismatch = self.tables.mismatch
+        medicines, _, scores = self.score_matrix([condition])
+        exclude = set(exclude or ())
+        if np is not None and len(medicines):
+            column = scores[:, 0]
+            candidates = np.flatnonzero(column != mismatch)
+            # Highest score first, ties broken by catalog order (medicine ID)
+            order = candidates[np.lexsort((candidates, -column[candidates]))]
+            ranked = [(int(i), float(column[i])) for i in order]
+        else:
+            ranked = sorted(((i, row[0]) for i, row in enumerate(scores) if row[0] != mismatch),
+                            key=lambda item: (-item[1], item[0]))
+
+        best = []
+        for i, score in ranked:
+            if medicines[i]['medicine_id'] in exclude:
+                continue
+            best.append((dict(medicines[i]), score))
+            if len(best) == k:
+                break
+        return best
+
+    def _catalog_arrays(self, tables):
+        """Catalog rows and their category columns, rebuilt when the catalog or rules change"""
+        catalog.refresh()
+        with self._lock:
+            if (self._catalog_version is None or self._catalog_version != catalog.version
+                    or self._arrays_tables is not tables):
+                medicines = catalog.all()
+                columns = [tables.category_column(medicine['category']) for medicine in medicines]
+                self._medicines = medicines
+                self._columns = columns
+                self._column_array = np.array(columns, dtype=np.intp) if np is not None else None
+                self._catalog_version = catalog.version
+                self._arrays_tables = tables
+            return self._medicines, self._columns, self._column_array
@@ -0,0 +1,288 @@
+# predictor_rules.py
+import json
+import sys
+import threading
+import time
+
+from database import get_db_connection, register_schema
+from catalog import bump_version, read_version
+
+try:
+    import numpy as np
+except ImportError:     # optional: batch scoring falls back to plain Python
+    np = None
+
+# How often (seconds) a terminal asks the database whether the rules changed
+RULES_CHECK_INTERVAL = 5.0
+RULES_VERSION_KEY = "predictor_rules"
+
+DEFAULT_SETTINGS = {
+    "base_effectiveness": 0.85,
+    "mismatch_effectiveness": 0.1,      # category not relevant to the condition
+    "default_condition_probability": 0.70,
+    "default_category_adjustment": 0.02,
+}
+
+DEFAULT_CONDITION_EFFECTIVENESS = {
+    "fever": 0.90,
+    "infection": 0.80,
+    "headache": 0.85,
+    "cough": 0.75,
+    "cold": 0.70,
+    "asthma": 0.65,
+    "diabetes": 0.88,
+    "acidity": 0.78,
+    "pain": 0.83,
+    "inflammation": 0.79,
+    "weakness": 0.72,
+    "digestion": 0.76
+}
+
+# Relevance mapping (condition -> valid categories)
+DEFAULT_CONDITION_CATEGORIES = {
+    "diabetes": ["diabetes"],
+    "headache": ["painkiller"],
+    "fever": ["painkiller", "antibiotic"],
+    "infection": ["antibiotic"],
+    "cough": ["respiratory", "antibiotic"],
+    "cold": ["respiratory"],
+    "asthma": ["respiratory"],
+    "acidity": ["digestive", "antacid"],
+    "pain": ["painkiller"],
+    "digestion": ["digestive"],
+    "weakness": ["vitamin supplement"],
+    "inflammation": ["painkiller", "antibiotic"]
+}
+
+# Category effectiveness adjustments
+DEFAULT_CATEGORY_ADJUSTMENTS = {
+    "painkiller": 0.05,
+    "antibiotic": 0.10,
+    "respiratory": 0.07,
+    "digestive": 0.04,
+    "vitamin supplement": 0.06,
+    "diabetes": 0.06,
+    "antiviral": 0.08,
+    "antifungal": 0.06,
+    "antacid": 0.03,
+    "immunity booster": 0.05,
+    "combination": 0.03
+}
+
+
+def default_rules():
+    """The built-in rule set, in the import/export layout"""
+    return {
+        "settings": dict(DEFAULT_SETTINGS),
+        "condition_effectiveness": dict(DEFAULT_CONDITION_EFFECTIVENESS),
+        "condition_categories": {k: list(v) for k, v in DEFAULT_CONDITION_CATEGORIES.items()},
+        "category_adjustments": dict(DEFAULT_CATEGORY_ADJUSTMENTS),
+    }
+
+
+def _key(name):
+    return sys.intern(str(name).strip().lower())
+
+
+class ScoringTables:
+    """Condition x category score matrix compiled from a rule set.
+
+    Row i is condition ``conditions[i]``; the extra last row is used for
+    unknown conditions. Column j is category ``categories[j]``; the extra
+    last column is used for categories the rules do not mention. A score is
+    the base effectiveness plus the category adjustment when the category is
+    relevant to the condition, the mismatch effectiveness otherwise.
+    Names are interned and the tables never change after construction, so
+    a lookup allocates nothing unless the name needs normalizing.
+    """
+
+    def __init__(self, rules=None):
+        rules = rules or default_rules()
+        settings = dict(DEFAULT_SETTINGS, **rules.get("settings", {}))
+        self.base = float(settings["base_effectiveness"])
+        self.mismatch = float(settings["mismatch_effectiveness"])
+        self.default_probability = float(settings["default_condition_probability"])
+        default_adjustment = float(settings["default_category_adjustment"])
+
+        probabilities = {_key(k): float(v) for k, v in rules.get("condition_effectiveness", {}).items()}
+        relevance = {_key(k): {_key(c) for c in v} for k, v in rules.get("condition_categories", {}).items()}
+        adjustments = {_key(k): float(v) for k, v in rules.get("category_adjustments", {}).items()}
+
+        self.conditions = tuple(sorted(set(probabilities) | set(relevance)))
+        self.categories = tuple(sorted(set(adjustments) | {c for cats in relevance.values() for c in cats}))
+        self.condition_index = {name: i for i, name in enumerate(self.conditions)}
+        self.category_index = {name: j for j, name in enumerate(self.categories)}
+        self.unknown_condition = len(self.conditions)
+        self.unknown_category = len(self.categories)
+        self.probabilities = tuple(probabilities.get(name, self.default_probability)
+                                   for name in self.conditions) + (self.default_probability,)
+
+        rows = []
+        self.relevant = tuple(tuple(sorted(relevance.get(condition, ())))
+                              for condition in self.conditions + (None,))
+        for condition in self.conditions + (None,):
+            relevant = relevance.get(condition, ())
+            rows.append(tuple(
+                self.base + adjustments.get(category, default_adjustment)
+                if category in relevant else self.mismatch
+                for category in self.categories
+            ) + (self.mismatch,))
+        self.rows = tuple(rows)
+        self.matrix = np.array(rows, dtype=np.float64) if np is not None else None
+
+    def condition_row(self, condition):
+        row = self.condition_index.get(condition)
+        if row is None:
+            row = self.condition_index.get((condition or "").strip().lower(), self.unknown_condition)
+        return row
+
+    def category_column(self, category):
+        column = self.category_index.get(category)
+        if column is None:
+            column = self.category_index.get((category or "").strip().lower(), self.unknown_category)
+        return column
+
+    def score(self, category, condition):
+        return self.rows[self.condition_row(condition)][self.category_column(category)]
+
+    def is_relevant(self, category, condition):
+        return self.score(category, condition) != self.mismatch
+
+    def relevant_categories(self, condition):
+        """The (normalized) categories the rules consider relevant to a condition"""
+        return self.relevant[self.condition_row(condition)]
+
+    def probability(self, condition):
+        return self.probabilities[self.condition_row(condition)]
+
+
+class RuleStore:
+    """Predictor rules kept in the ``predictor_rules`` table.
+
+    The table is seeded with the built-in rules. It is read once and
+    compiled into ScoringTables; a version stamp is checked at most every
+    RULES_CHECK_INTERVAL seconds and the tables are rebuilt and swapped in
+    when another terminal (or an import) changed the rules, so they can be
+    tuned without a redeploy.
+    """
+
+    def __init__(self, check_interval=RULES_CHECK_INTERVAL):
+        self.check_interval = check_interval
+        self._tables = None
+        self._version = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def tables(self):
+        """The current compiled ScoringTables"""
+        now = time.monotonic()
+        if self._tables is not None and now - self._checked_at < self.check_interval:
+            return self._tables
+        with self._lock:
+            if self._tables is None or now - self._checked_at >= self.check_interval:
+                version = read_version(RULES_VERSION_KEY)
+                if self._tables is None or version != self._version:
+                    self._tables = ScoringTables(self.load())
+                    self._version = version
+                self._checked_at = now
+            return self._tables
+
+    def invalidate(self):
+        """Re-check the rules on the next lookup"""
+        with self._lock:
+            self._checked_at = 0.0
+
+    def load(self):
+        """The stored rules in the import/export layout"""
+        rules = {"settings": {}, "condition_effectiveness": {},
+                 "condition_categories": {}, "category_adjustments": {}}
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT rule_type, rule_key, rule_value, weight FROM predictor_rules "
+                           "ORDER BY rule_type, rule_key, rule_value")
+            for rule_type, key, value, weight in cursor.fetchall():
+                if rule_type == "setting":
+                    rules["settings"][key] = float(weight)
+                elif rule_type == "condition":
+                    rules["condition_effectiveness"][key] = float(weight)
+                elif rule_type == "relevance":
+                    rules["condition_categories"].setdefault(key, []).append(value)
+                elif rule_type == "category":
+                    rules["category_adjustments"][key] = float(weight)
+            return rules
+        finally:
+            cursor.close()
+            conn.close()
+
+    def save(self, rules):
+        """Replace the stored rules (validated by compiling them first)"""
+        ScoringTables(rules)
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute("DELETE FROM predictor_rules")
+            _insert_rules(cursor, rules)
+            bump_version(cursor, RULES_VERSION_KEY)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+            conn.close()
+        self.invalidate()
+
+    def create_table(self, cursor):
+        """Schema hook: the rules table, seeded with the built-in rules"""
+        cursor.execute(
+            """CREATE TABLE IF NOT EXISTS predictor_rules (
+                rule_type VARCHAR(16) NOT NULL,
+                rule_key VARCHAR(100) NOT NULL,
+                rule_value VARCHAR(100) NOT NULL DEFAULT '',
+                weight DECIMAL(8,4),
+                PRIMARY KEY (rule_type, rule_key, rule_value)
+            )"""
+        )
+        cursor.execute("SELECT COUNT(*) FROM predictor_rules")
+        row = cursor.fetchone()
+        if not (row[0] if not isinstance(row, dict) else next(iter(row.values()))):
+            _insert_rules(cursor, default_rules())
+
+
+def _insert_rules(cursor, rules):
+    rows = [("setting", _key(k), "", v) for k, v in rules.get("settings", {}).items()]
+    rows += [("condition", _key(k), "", v) for k, v in rules.get("condition_effectiveness", {}).items()]
+    rows += [("relevance", _key(k), _key(c), None)
+             for k, cats in rules.get("condition_categories", {}).items() for c in sorted(set(cats))]
+    rows += [("category", _key(k), "", v) for k, v in rules.get("category_adjustments", {}).items()]
+    cursor.executemany(
+        "INSERT INTO predictor_rules (rule_type, rule_key, rule_value, weight) VALUES (%s, %s, %s, %s)",
+        rows
+    )
+
+
+rule_store = RuleStore()
+register_schema(rule_store.create_table)
+
+
+def main(argv=None):
+    """python predictor_rules.py export FILE | import FILE"""
+    args = argv if argv is not None else sys.argv[1:]
+    if len(args) != 2 or args[0] not in ("export", "import"):
+        print("Usage: python predictor_rules.py export FILE | import FILE")
+        return 2
+    command, path = args
+    if command == "export":
+        with open(path, "w", encoding="utf-8") as handle:
+            json.dump(rule_store.load(), handle, indent=2, sort_keys=True)
+        print(f"Rules written to {path}")
+    else:
+        with open(path, encoding="utf-8") as handle:
+            rule_store.save(json.load(handle))
+        print(f"Rules loaded from {path}; terminals pick them up within {RULES_CHECK_INTERVAL:.0f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,6 +3,7 @@ from tkinter import messagebox
 from predictor import MedicineEffectivenessPredictor
 from medicines import Medicine
 from theme import setup_theme
+from autocomplete import MedicineAutocomplete
 
 class MedicinePredictorGUI:
     def __init__(self, root):
@@ -62,6 +63,7 @@ class MedicinePredictorGUI:
             placeholder_text="Enter medicine name..."
         )
         self.medicine_entry.grid(row=0, column=1, padx=5, pady=5, sticky="ew")
+        self.medicine_autocomplete = MedicineAutocomplete(self.medicine_entry)
         
         # Condition input
         self.condition_label = ctk.CTkLabel(
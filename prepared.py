@@ -0,0 +1,113 @@
+# prepared.py
+import threading
+import weakref
+from collections import OrderedDict
+
+from instrumentation import InstrumentedCursor, query_stats
+
+# Prepared statements kept per connection (least recently used are closed)
+MAX_PREPARED_PER_CONNECTION = 64
+
+
+class StatementRegistry:
+    """Named SQL statements, prepared once per pooled connection and reused.
+
+    Modules register their fixed hot statements at import time. The first
+    time a statement runs on a connection it is prepared there (a
+    server-side prepared statement on MySQL; SQLite's statement cache
+    plays the same role for the embedded backend); later runs on that
+    connection only send the parameters. ``{list}`` in a statement expands
+    to ``arity`` placeholders and ``{cases}`` to ``arity`` WHEN/THEN pairs,
+    so IN-list statements get one prepared form per list length.
+
+    Statements run on the connection of the caller's cursor and therefore
+    inside the caller's transaction. Results come back as tuples.
+    """
+
+    def __init__(self, per_connection=MAX_PREPARED_PER_CONNECTION):
+        self.per_connection = per_connection
+        self._statements = {}
+        self._expanded = {}
+        self._prepared = weakref.WeakKeyDictionary()   # driver connection -> OrderedDict
+        self._lock = threading.Lock()
+
+    def register(self, name, sql):
+        """Add a named statement; returns the name for use as a constant"""
+        sql = " ".join(sql.split())
+        if self._statements.get(name, sql) != sql:
+            raise ValueError(f"Statement '{name}' is already registered with different SQL")
+        self._statements[name] = sql
+        return name
+
+    def sql(self, name, arity=None):
+        """The SQL text of a statement, with list markers expanded for ``arity``"""
+        key = (name, arity)
+        text = self._expanded.get(key)
+        if text is None:
+            text = self._statements[name]
+            if arity is not None:
+                text = (text.replace("{list}", ", ".join(["%s"] * arity))
+                            .replace("{cases}", " ".join(["WHEN %s THEN %s"] * arity)))
+            self._expanded[key] = text
+        return text
+
+    # ---------- running statements ----------
+
+    def execute(self, cursor, name, params=(), arity=None):
+        """Run a statement on the cursor's connection; returns a cursor to fetch from"""
+        connection = cursor.connection
+        prepared = self._cursor_for(connection, name, arity)
+        wrapper = InstrumentedCursor(prepared, query_stats, connection)
+        wrapper.execute(self.sql(name, arity), tuple(params))
+        return wrapper
+
+    def fetchall(self, cursor, name, params=(), arity=None):
+        return self.execute(cursor, name, params, arity).fetchall()
+
+    def fetchone(self, cursor, name, params=(), arity=None):
+        """First row or None (the rest of the result is read and dropped)"""
+        rows = self.fetchall(cursor, name, params, arity)
+        return rows[0] if rows else None
+
+    def run(self, cursor, name, params=(), arity=None):
+        """Run a write; returns the number of affected rows"""
+        return self.execute(cursor, name, params, arity).rowcount
+
+    def forget(self, connection):
+        """Close the statements prepared on a connection"""
+        with self._lock:
+            cursors = self._prepared.pop(connection, {})
+        for prepared in cursors.values():
+            _close(prepared)
+
+    def _cursor_for(self, connection, name, arity):
+        key = (name, arity)
+        evicted = None
+        with self._lock:
+            cursors = self._prepared.get(connection)
+            if cursors is None:
+                cursors = self._prepared[connection] = OrderedDict()
+            prepared = cursors.get(key)
+            if prepared is not None:
+                cursors.move_to_end(key)
+                return prepared
+            try:
+                prepared = connection.cursor(prepared=True)
+            except TypeError:   # driver without prepared cursors: plain cursor, still reused
+                prepared = connection.cursor()
+            cursors[key] = prepared
+            if len(cursors) > self.per_connection:
+                _, evicted = cursors.popitem(last=False)
+        if evicted is not None:
+            _close(evicted)
+        return prepared
+
+
+def _close(cursor):
+    try:
+        cursor.close()
+    except Exception:
+        pass
+
+
+statements = StatementRegistry()
@@ -1,71 +1,212 @@
-from database import get_db_connection
+from database import get_db_connection, retry_on_deadlock, will_retry, StaleRowError
 from datetime import date
 from decimal import Decimal
 from medicines import Medicine
+from sequences import next_id
+from stock import stock_levels
+from dispensing import FifoDispenser, InsufficientStockError
+from paging import fetch_keyset_page
+from prepared import statements
+
+MEDICINE_PRICE = statements.register("medicine_price", "SELECT price FROM MEDICINES WHERE medicine_id = %s")
+MEDICINES_BY_NAME = statements.register(
+    "medicines_by_name", "SELECT medicine_id, name, price FROM MEDICINES WHERE name IN ({list})")
+MEDICINES_BY_ID = statements.register(
+    "medicines_by_id", "SELECT medicine_id, name, price FROM MEDICINES WHERE medicine_id IN ({list})")
+PRESCRIPTION_LINE = statements.register("prescription_line", """
+    SELECT quantity_bought, total_price FROM PRESCRIPTION_MEDICINES
+    WHERE prescription_id = %s AND medicine_id = %s""")
+DELETE_LINE = statements.register(
+    "prescription_delete_line",
+    "DELETE FROM PRESCRIPTION_MEDICINES WHERE prescription_id = %s AND medicine_id = %s")
+ADD_TO_TOTAL = statements.register("prescription_add_to_total", """
+    UPDATE PRESCRIPTIONS SET total_amount = total_amount + %s, row_version = row_version + 1
+    WHERE prescription_id = %s""")
+LOCK_PRESCRIPTION = statements.register(
+    "lock_prescription", "SELECT row_version FROM PRESCRIPTIONS WHERE prescription_id = %s FOR UPDATE")
+PRESCRIPTION_LINES = statements.register("prescription_lines", """
+    SELECT medicine_id, quantity_bought FROM PRESCRIPTION_MEDICINES
+    WHERE prescription_id = %s ORDER BY medicine_id""")
+
+
+class CheckoutError(Exception):
+    """Raised when a basket cannot be checked out (unknown medicine, no stock)"""
+
+
+class Receipt:
+    """Result of a checkout: the saved prescription and the batches it consumed"""
+
+    def __init__(self, prescription_id, prescription_date, lines, allocation):
+        self.prescription_id = prescription_id
+        self.date = prescription_date
+        self.lines = lines
+        self.allocation = allocation
+        self.total_amount = sum((line['total_price'] for line in lines), Decimal('0.00'))
+
+    def display(self):
+        """Print the receipt"""
+        print(f"\nReceipt - Prescription #{self.prescription_id} ({self.date})")
+        print("-" * 60)
+        print(f"{'Medicine':<25}{'Qty':<8}{'Unit Price':<12}{'Total':<10}")
+        print("-" * 60)
+        for line in self.lines:
+            print(f"{line['name']:<25}{line['quantity']:<8}"
+                  f"{line['unit_price']:<12.2f}{line['total_price']:<10.2f}")
+        print("-" * 60)
+        print(f"{'Total Amount:':<45}{self.total_amount:.2f}")
+
 
 class PrescriptionManager:
+    """Prescription operations; each call borrows a connection from the pool"""
     _instance = None
     
     def __new__(cls):
         if cls._instance is None:
             cls._instance = super(PrescriptionManager, cls).__new__(cls)
-            cls._instance.connection = get_db_connection()
         return cls._instance
     
     def create_prescription(self):
         """Create a new prescription with interactive medicine addition"""
+        basket = []
         try:
-            cursor = self.connection.cursor()
-            
-            # Get prescription details
-            cursor.execute("SELECT COALESCE(MAX(prescription_id), 0) FROM PRESCRIPTIONS")
-            max_id = cursor.fetchone()[0]
-            prescription_id = max_id + 1            
-            prescription_date = date.today()
-            
-            # Initialize prescription with 0 total amount
-            cursor.execute(
-                "INSERT INTO PRESCRIPTIONS (prescription_id, date, total_amount) VALUES (%s, %s, 0.00)",
-                (prescription_id, prescription_date)
-            )
-            
             # Add medicines until user stops
             while True:
-                self._add_medicine_to_prescription(cursor, prescription_id)
+                medicine_name = input("Enter medicine name: ")
+                qty = int(input("Enter quantity: "))
+                basket.append((medicine_name, qty))
                 if input("Add another medicine? (y/n): ").lower() != 'y':
                     break
             
-            self.connection.commit()
+            receipt = self.checkout(basket)
+            receipt.display()
             print("Prescription created successfully!")
+            return receipt
             
         except Exception as e:
-            self.connection.rollback()
             print(f"Error creating prescription: {e}")
+
+    @retry_on_deadlock
+    def checkout(self, basket, prescription_date=None):
+        """Save a whole basket as one prescription in a single transaction.
+
+        ``basket`` is an iterable of (medicine name or medicine_id, quantity).
+        Names are resolved in one query, line items are inserted with one
+        executemany, and stock is deducted FIFO in one batched step.
+        Returns a Receipt; raises CheckoutError and rolls back on failure.
+        """
+        basket = [(item, int(qty)) for item, qty in basket]
+        if not basket:
+            raise CheckoutError("Basket is empty")
+        for item, qty in basket:
+            if qty <= 0:
+                raise CheckoutError(f"Quantity for '{item}' must be positive")
+
+        # Reserve the ID before taking any stock locks; a fresh block is
+        # fetched on its own connection and must not queue behind them
+        prescription_id = next_id("prescriptions")
+        conn = get_db_connection()
+        cursor = conn.cursor(dictionary=True)
+        try:
+            medicines = self._resolve_medicines(cursor, [item for item, _ in basket])
+
+            # Merge repeated lines for the same medicine
+            quantities = {}
+            for item, qty in basket:
+                medicine_id = medicines[item]['medicine_id']
+                quantities[medicine_id] = quantities.get(medicine_id, 0) + qty
+
+            by_id = {med['medicine_id']: med for med in medicines.values()}
+            try:
+                allocation = FifoDispenser.plan(cursor, quantities.items())
+            except InsufficientStockError as e:
+                raise CheckoutError(
+                    f"Not enough stock for '{by_id[e.medicine_id]['name']}'! "
+                    f"Requested: {e.requested}, Available: {e.available}") from e
+
+            lines = []
+            for medicine_id, qty in quantities.items():
+                unit_price = Decimal(by_id[medicine_id]['price'])
+                lines.append({
+                    'medicine_id': medicine_id,
+                    'name': by_id[medicine_id]['name'],
+                    'quantity': qty,
+                    'unit_price': unit_price,
+                    'total_price': unit_price * qty
+                })
+
+            prescription_date = prescription_date or date.today()
+            receipt = Receipt(prescription_id, prescription_date, lines, allocation)
+
+            cursor.execute(
+                "INSERT INTO PRESCRIPTIONS (prescription_id, date, total_amount) VALUES (%s, %s, %s)",
+                (prescription_id, prescription_date, receipt.total_amount)
+            )
+            cursor.executemany(
+                """INSERT INTO PRESCRIPTION_MEDICINES 
+                (prescription_id, medicine_id, quantity_bought, total_price)
+                VALUES (%s, %s, %s, %s)""",
+                [(prescription_id, line['medicine_id'], line['quantity'], line['total_price'])
+                 for line in lines]
+            )
+            FifoDispenser.apply(cursor, allocation)
+            FifoDispenser.record_allocation(cursor, prescription_id, allocation, new=True)
+
+            conn.commit()
+            return receipt
+
+        except Exception:
+            conn.rollback()
+            raise
         finally:
             cursor.close()
+            conn.close()
+
+    @staticmethod
+    def _lock_prescription(cursor, prescription_id, expected_version=None):
+        """Lock a prescription's header row before its lines or stock are touched.
+
+        Every change to an existing prescription takes this lock first, so
+        edits of one prescription queue up instead of deadlocking. Returns
+        the row_version, or None if the prescription does not exist; raises
+        StaleRowError if it changed since ``expected_version``.
+        """
+        row = statements.fetchone(cursor, LOCK_PRESCRIPTION, (prescription_id,))
+        if row is None:
+            return None
+        if expected_version is not None and row[0] != expected_version:
+            raise StaleRowError(
+                f"Prescription #{prescription_id} was changed at another terminal; reload it and try again")
+        return row[0]
+
+    def _resolve_medicines(self, cursor, items):
+        """Look up names and IDs in one query; returns {item: medicine row}"""
+        names = sorted({item for item in items if isinstance(item, str)})
+        ids = sorted({item for item in items if not isinstance(item, str)})
+
+        rows = []
+        if names:
+            rows += statements.fetchall(cursor, MEDICINES_BY_NAME, names, arity=len(names))
+        if ids:
+            rows += statements.fetchall(cursor, MEDICINES_BY_ID, ids, arity=len(ids))
+        rows = [{'medicine_id': medicine_id, 'name': name, 'price': price} for medicine_id, name, price in rows]
+        by_name = {row['name'].lower(): row for row in rows}
+        by_id = {row['medicine_id']: row for row in rows}
+
+        resolved = {}
+        for item in items:
+            row = by_name.get(item.lower()) if isinstance(item, str) else by_id.get(item)
+            if not row:
+                raise CheckoutError(f"Medicine '{item}' not found")
+            resolved[item] = row
+        return resolved
     
-    def _add_medicine_to_prescription(self, cursor, prescription_id, medicine_id=None, qty=None):
+    def _add_medicine_to_prescription(self, cursor, prescription_id, medicine_id, qty):
         """Add a medicine to prescription with quantity and calculate price.
-        Can be used interactively or programmatically.
+        Returns the FIFO batch allocation that was consumed.
         """
         try:
-            # Interactive input if not provided
-            if medicine_id is None:
-                medicine_name = input("Enter medicine name: ")
-                medicine_id = Medicine.get_id_by_name(medicine_name)
-            if not medicine_id:
-                print("Medicine not found!")
-                return
-        
-            if qty is None:
-                qty = int(input("Enter quantity: "))
-        
             # Get price of the medicine
-            cursor.execute(
-            "SELECT price FROM MEDICINES WHERE medicine_id = %s",
-            (medicine_id,)
-            )
-            medicine = cursor.fetchone()
+            medicine = statements.fetchone(cursor, MEDICINE_PRICE, (medicine_id,))
         
             if not medicine:
                 print("Medicine not found!")
@@ -73,16 +214,15 @@ class PrescriptionManager:
         
             price = medicine[0]
         
-            # Check inventory
-            cursor.execute(
-            "SELECT SUM(current_quantity) FROM INVENTORY WHERE medicine_id = %s",
-            (medicine_id,)
-            )
-            total_stock = cursor.fetchone()[0] or 0
-            print(total_stock)
+            if self._lock_prescription(cursor, prescription_id) is None:
+                print("Prescription not found!")
+                return
         
-            if total_stock < qty:
-                print(f"Not enough stock! Available: {total_stock}")
+            # Lock the batches and plan the FIFO deduction (also checks stock)
+            try:
+                allocation = FifoDispenser.plan(cursor, [(medicine_id, qty)])
+            except InsufficientStockError as e:
+                print(f"Not enough stock! Available: {e.available}")
                 return
         
             total_price = Decimal(price) * qty
@@ -97,31 +237,12 @@ class PrescriptionManager:
             print('added the medicine')
         
             # Update prescription total
-            cursor.execute(
-            "UPDATE PRESCRIPTIONS SET total_amount = total_amount + %s WHERE prescription_id = %s",
-            (total_price, prescription_id)
-            )
+            statements.run(cursor, ADD_TO_TOTAL, (total_price, prescription_id))
         
-            # FIFO inventory deduction
-            cursor.execute(
-            """SELECT inventory_id, current_quantity 
-            FROM INVENTORY 
-            WHERE medicine_id = %s AND current_quantity > 0
-            ORDER BY expiry_date, date_added""",
-            (medicine_id,)
-            )
-            batches = cursor.fetchall()
-        
-            remaining = qty
-            for batch_id, batch_qty in batches:
-                deduct = min(remaining, batch_qty)
-                cursor.execute(
-                "UPDATE INVENTORY SET current_quantity = current_quantity - %s WHERE inventory_id = %s",
-                (deduct, batch_id)
-                )
-                remaining -= deduct
-                if remaining == 0:
-                    break
+            # FIFO inventory deduction, and which batches it drew from
+            FifoDispenser.apply(cursor, allocation)
+            FifoDispenser.record_allocation(cursor, prescription_id, allocation)
+            return allocation
     
         except Exception as e:
             print(f"Error adding medicine: {e}")
@@ -129,8 +250,9 @@ class PrescriptionManager:
     
     def read_prescription(self, prescription_id):
         """Read prescription details"""
+        conn = get_db_connection()
+        cursor = conn.cursor(dictionary=True)
         try:
-            cursor = self.connection.cursor(dictionary=True)
         
             # Get prescription header
             cursor.execute(
@@ -174,155 +296,108 @@ class PrescriptionManager:
             return None
         finally:
             cursor.close()
+            conn.close()
 
+
+    def get_dispensed_batches(self, prescription_id):
+        """Batches each line of a prescription was dispensed from (e.g. to trace a recall)"""
+        conn = get_db_connection()
+        cursor = conn.cursor(dictionary=True)
+        try:
+            cursor.execute(
+                """SELECT pb.medicine_id, m.name, pb.inventory_id, i.batch_number, i.expiry_date, pb.quantity
+                FROM prescription_batches pb
+                JOIN MEDICINES m ON m.medicine_id = pb.medicine_id
+                LEFT JOIN INVENTORY i ON i.inventory_id = pb.inventory_id
+                WHERE pb.prescription_id = %s
+                ORDER BY pb.medicine_id, i.expiry_date, pb.inventory_id""",
+                (prescription_id,)
+            )
+            return cursor.fetchall()
+        finally:
+            cursor.close()
+            conn.close()
     
     def update_prescription(self, prescription_id):
-        """Update prescription by adding/removing medicines"""
+        """Update prescription by adding/removing medicines
+
+        Every answer is collected before a connection is borrowed; each
+        change then runs in its own short transaction, so no row locks are
+        held while the user types.
+        """
+        conn = get_db_connection()
+        cursor = conn.cursor()
         try:
-            cursor = self.connection.cursor()
-            
             # Verify prescription exists
             cursor.execute(
                 "SELECT 1 FROM PRESCRIPTIONS WHERE prescription_id = %s",
                 (prescription_id,)
             )
-            if not cursor.fetchone():
-                print("Prescription not found!")
-                return
-            
-            while True:
-                print("\n1. Add medicine")
-                print("2. Remove medicine")
-                print("3. Finish updating")
-                choice = input("Select option: ")
-                
+            found = cursor.fetchone()
+        finally:
+            cursor.close()
+            conn.close()
+        if not found:
+            print("Prescription not found!")
+            return
+
+        while True:
+            print("\n1. Add medicine")
+            print("2. Remove medicine")
+            print("3. Finish updating")
+            choice = input("Select option: ")
+
+            try:
                 if choice == '1':
-                    self._add_medicine_to_prescription(cursor, prescription_id)
+                    medicine_id = Medicine.get_id_by_name(input("Enter medicine name: "))
+                    if not medicine_id:
+                        print("Medicine not found!")
+                        continue
+                    qty = int(input("Enter quantity: "))
+                    self.add_medicine_to_prescription(prescription_id, medicine_id, qty)
                 elif choice == '2':
-                    self._remove_medicine_from_prescription(cursor, prescription_id)
+                    medicine_id = Medicine.get_id_by_name(input("Enter medicine name to remove: "))
+                    if not medicine_id:
+                        print("Medicine not found!")
+                        continue
+                    self.remove_medicine_from_prescription(prescription_id, medicine_id)
                 elif choice == '3':
                     break
                 else:
                     print("Invalid choice!")
-            
-            self.connection.commit()
-            print("Prescription updated successfully!")
-            
-        except Exception as e:
-            self.connection.rollback()
-            print(f"Error updating prescription: {e}")
-        finally:
-            cursor.close()
+            except Exception as e:
+                print(f"Error updating prescription: {e}")
     
-    def _remove_medicine_from_prescription(self, cursor, prescription_id):
-        """Remove a medicine from prescription and adjust totals"""
+    @retry_on_deadlock
+    def delete_prescription(self, prescription_id, expected_version=None):
+        """Delete a prescription and restore medicine stocks
+
+        With ``expected_version`` (the row_version the user was shown) the
+        delete is refused with StaleRowError if the prescription has changed.
+        """
+        conn = get_db_connection()
+        cursor = conn.cursor()
         try:
-            medicine_name = input("Enter medicine name to remove: ")
-            medicine_id = Medicine.get_id_by_name(medicine_name)
-            if not medicine_id:
-                print("Medicine not found!")
-                return
-            
-            # Get medicine details from prescription
-            cursor.execute(
-                """SELECT quantity_bought, total_price 
-                FROM PRESCRIPTION_MEDICINES 
-                WHERE prescription_id = %s AND medicine_id = %s""",
-                (prescription_id, medicine_id)
-            )
-            medicine = cursor.fetchone()
             
-            if not medicine:
-                print("Medicine not found in this prescription!")
+            if self._lock_prescription(cursor, prescription_id, expected_version) is None:
+                print("Prescription not found!")
                 return
             
-            quantity, total_price = medicine
-            
-            # Remove from prescription_medicines
-            cursor.execute(
-                """DELETE FROM PRESCRIPTION_MEDICINES 
-                WHERE prescription_id = %s AND medicine_id = %s""",
-                (prescription_id, medicine_id)
-            )
+            # First restore all medicine stocks, in medicine order
+            medicines = statements.fetchall(cursor, PRESCRIPTION_LINES, (prescription_id,))
             
-            # Update prescription total amount
-            cursor.execute(
-                "UPDATE PRESCRIPTIONS SET total_amount = total_amount - %s WHERE prescription_id = %s",
-                (total_price, prescription_id)
-            )
-            
-            # Restore medicine to inventory - add to newest batch
-            cursor.execute(
-                """SELECT inventory_id 
-                FROM INVENTORY 
-                WHERE medicine_id = %s
-                ORDER BY date_added DESC
-                LIMIT 1""",
-                (medicine_id,)
-            )
-            batch = cursor.fetchone()
-            
-            if batch:
-                cursor.execute(
-                    "UPDATE INVENTORY SET current_quantity = current_quantity + %s WHERE inventory_id = %s",
-                    (quantity, batch[0])
-                )
-            else:
-                # If no batch exists, create a new one
-                cursor.execute(
-                    """INSERT INTO INVENTORY 
-                    (medicine_id, supplier_id, quantity_added, current_quantity, batch_number, expiry_date)
-                    VALUES (%s, 1, %s, %s, 'RETURN-'+%s, DATE_ADD(CURDATE(), INTERVAL 1 YEAR))""",
-                    (medicine_id, quantity, quantity, prescription_id)
-                )
-                
-        except Exception as e:
-            print(f"Error removing medicine: {e}")
-            raise
-    
-    def delete_prescription(self, prescription_id):
-        """Delete a prescription and restore medicine stocks"""
-        try:
-            cursor = self.connection.cursor()
+            for med_id, qty in medicines:
+                # Back onto the batches they were dispensed from
+                released = FifoDispenser.release_allocation(cursor, prescription_id, med_id)
+                FifoDispenser.restock(cursor, med_id, qty, f"RETURN-{prescription_id}", released)
             
-            # First restore all medicine stocks
+            # Delete prescription medicines and any batch records left over
             cursor.execute(
-                """SELECT medicine_id, quantity_bought 
-                FROM PRESCRIPTION_MEDICINES 
-                WHERE prescription_id = %s""",
+                "DELETE FROM PRESCRIPTION_MEDICINES WHERE prescription_id = %s",
                 (prescription_id,)
             )
-            medicines = cursor.fetchall()
-            
-            for med_id, qty in medicines:
-                # Restore to newest batch
-                cursor.execute(
-                    """SELECT inventory_id 
-                    FROM INVENTORY 
-                    WHERE medicine_id = %s
-                    ORDER BY date_added DESC
-                    LIMIT 1""",
-                    (med_id,)
-                )
-                batch = cursor.fetchone()
-                
-                if batch:
-                    cursor.execute(
-                        "UPDATE INVENTORY SET current_quantity = current_quantity + %s WHERE inventory_id = %s",
-                        (qty, batch[0])
-                    )
-                else:
-                    # If no batch exists, create a new one
-                    cursor.execute(
-                        """INSERT INTO INVENTORY 
-                        (medicine_id, supplier_id, quantity_added, current_quantity, batch_number, expiry_date)
-                        VALUES (%s, 1, %s, %s, 'RETURN-'+%s, DATE_ADD(CURDATE(), INTERVAL 1 YEAR))""",
-                        (med_id, qty, qty, prescription_id)
-                    )
-            
-            # Delete prescription medicines
             cursor.execute(
-                "DELETE FROM PRESCRIPTION_MEDICINES WHERE prescription_id = %s",
+                "DELETE FROM prescription_batches WHERE prescription_id = %s",
                 (prescription_id,)
             )
             
@@ -332,19 +407,34 @@ class PrescriptionManager:
                 (prescription_id,)
             )
             
-            self.connection.commit()
+            conn.commit()
             print("Prescription deleted successfully!")
             
         except Exception as e:
-            self.connection.rollback()
+            conn.rollback()
+            if will_retry(e) or isinstance(e, StaleRowError):
+                raise
             print(f"Error deleting prescription: {e}")
         finally:
             cursor.close()
+            conn.close()
+
+    def get_prescriptions_by_date(self, target_date, page_size=None, page_token=None):
+        """Get all prescriptions for a specific date
+
+        With ``page_size`` nothing is printed: one page is returned as (rows, next_token).
+        """
+        if page_size is not None:
+            return fetch_keyset_page(
+                "SELECT * FROM PRESCRIPTIONS",
+                [("prescription_id", "prescription_id")],
+                where=["date = %s"], params=(target_date,),
+                page_token=page_token, page_size=page_size
+            )
 
-    def get_prescriptions_by_date(self, target_date):
-        """Get all prescriptions for a specific date"""
+        conn = get_db_connection()
+        cursor = conn.cursor(dictionary=True)
         try:
-            cursor = self.connection.cursor(dictionary=True)
             cursor.execute(
                 "SELECT * FROM PRESCRIPTIONS WHERE date = %s ORDER BY prescription_id",
                 (target_date,)
@@ -363,11 +453,24 @@ class PrescriptionManager:
             print(f"Error retrieving prescriptions: {e}")
         finally:
             cursor.close()
+            conn.close()
+
+    def get_prescriptions_by_amount_range(self, min_amount, max_amount, page_size=None, page_token=None):
+        """Get prescriptions within a specific amount range
 
-    def get_prescriptions_by_amount_range(self, min_amount, max_amount):
-        """Get prescriptions within a specific amount range"""
+        With ``page_size`` nothing is printed: one page is returned as (rows, next_token).
+        """
+        if page_size is not None:
+            return fetch_keyset_page(
+                "SELECT * FROM PRESCRIPTIONS",
+                [("total_amount", "total_amount"), ("prescription_id", "prescription_id")],
+                where=["total_amount BETWEEN %s AND %s"], params=(min_amount, max_amount),
+                page_token=page_token, page_size=page_size
+            )
+
+        conn = get_db_connection()
+        cursor = conn.cursor(dictionary=True)
         try:
-            cursor = self.connection.cursor(dictionary=True)
             cursor.execute(
                 "SELECT * FROM PRESCRIPTIONS WHERE total_amount BETWEEN %s AND %s ORDER BY total_amount",
                 (min_amount, max_amount)
@@ -386,26 +489,85 @@ class PrescriptionManager:
             print(f"Error retrieving prescriptions: {e}")
         finally:
             cursor.close()
+            conn.close()
 
-    def update_prescription_medicine(self, prescription_id, medicine_id,quantity=None):
-        """Update specific medicine in a prescription"""
+    @retry_on_deadlock
+    def add_medicine_to_prescription(self, prescription_id, medicine_id, quantity, expected_version=None):
+        """Add a medicine line to a saved prescription in its own transaction
+
+        Returns the FIFO allocation, or None if nothing was added. Raises
+        StaleRowError if the prescription changed since ``expected_version``.
+        """
+        conn = get_db_connection()
+        cursor = conn.cursor()
         try:
-            cursor = self.connection.cursor()
-            
-            # Get current quantity
+            if self._lock_prescription(cursor, prescription_id, expected_version) is None:
+                print("Prescription not found!")
+                return None
+
+            allocation = self._add_medicine_to_prescription(cursor, prescription_id, medicine_id, quantity)
+            if allocation is None:
+                conn.rollback()
+                return None
+
+            conn.commit()
+            return allocation
+
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+            conn.close()
+
+    @retry_on_deadlock
+    def update_prescription_date(self, prescription_id, new_date, expected_version=None):
+        """Change the date of a prescription; returns False if it does not exist
+
+        Raises StaleRowError if the prescription changed since ``expected_version``.
+        """
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        try:
+            if self._lock_prescription(cursor, prescription_id, expected_version) is None:
+                print("Prescription not found!")
+                return False
+
             cursor.execute(
-                "SELECT quantity_bought FROM PRESCRIPTION_MEDICINES WHERE prescription_id = %s AND medicine_id = %s",
-                (prescription_id, medicine_id)
+                "UPDATE PRESCRIPTIONS SET date = %s, row_version = row_version + 1 WHERE prescription_id = %s",
+                (new_date, prescription_id)
             )
-            current_qty = cursor.fetchone()
+            conn.commit()
+            return True
+
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+            conn.close()
+
+    @retry_on_deadlock
+    def update_prescription_medicine(self, prescription_id, medicine_id, quantity, expected_version=None):
+        """Update specific medicine in a prescription
+
+        Raises StaleRowError if the prescription changed since ``expected_version``.
+        """
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        try:
+            
+            if self._lock_prescription(cursor, prescription_id, expected_version) is None:
+                print("Prescription not found!")
+                return
+            
+            # Get current quantity
+            current_qty = statements.fetchone(cursor, PRESCRIPTION_LINE, (prescription_id, medicine_id))
             
             if not current_qty:
                 print("This medicine is not in the specified prescription")
                 return
-            if quantity is None:
-                new_qty = int(input(f"Current quantity: {current_qty[0]}. Enter new quantity: "))
-            else:
-                new_qty=quantity
+            new_qty = quantity
             
             # Calculate difference
             qty_diff = new_qty - current_qty[0]
@@ -415,11 +577,7 @@ class PrescriptionManager:
                 return
                 
             # Get medicine price
-            cursor.execute(
-                "SELECT price FROM MEDICINES WHERE medicine_id = %s",
-                (medicine_id,)
-            )
-            price = cursor.fetchone()[0]
+            price = statements.fetchone(cursor, MEDICINE_PRICE, (medicine_id,))[0]
             
             # Update prescription_medicines
             cursor.execute(
@@ -431,84 +589,46 @@ class PrescriptionManager:
             
             # Update prescription total
             amount_diff = Decimal(price) * qty_diff
-            cursor.execute(
-                "UPDATE PRESCRIPTIONS SET total_amount = total_amount + %s WHERE prescription_id = %s",
-                (amount_diff, prescription_id)
-            )
+            statements.run(cursor, ADD_TO_TOTAL, (amount_diff, prescription_id))
             
             # Update inventory
             if qty_diff > 0:
-                # Deduct from oldest batch
-                cursor.execute(
-                    """SELECT inventory_id, current_quantity 
-                    FROM INVENTORY 
-                    WHERE medicine_id = %s AND current_quantity > 0
-                    ORDER BY expiry_date, date_added""",
-                    (medicine_id,)
-                )
-                batches = cursor.fetchall()
-                
-                remaining = qty_diff
-                for batch in batches:
-                    batch_id, batch_qty = batch
-                    deduct = min(remaining, batch_qty)
-                    
-                    cursor.execute(
-                        "UPDATE INVENTORY SET current_quantity = current_quantity - %s WHERE inventory_id = %s",
-                        (deduct, batch_id)
-                    )
-                    
-                    remaining -= deduct
-                    if remaining == 0:
-                        break
+                # Deduct from oldest batches
+                allocation = FifoDispenser.dispense(cursor, [(medicine_id, qty_diff)])
+                FifoDispenser.record_allocation(cursor, prescription_id, allocation)
             else:
-                # Add to newest batch
-                cursor.execute(
-                    """SELECT inventory_id 
-                    FROM INVENTORY 
-                    WHERE medicine_id = %s
-                    ORDER BY date_added DESC
-                    LIMIT 1""",
-                    (medicine_id,)
-                )
-                batch = cursor.fetchone()
-                
-                if batch:
-                    cursor.execute(
-                        "UPDATE INVENTORY SET current_quantity = current_quantity + %s WHERE inventory_id = %s",
-                        (-qty_diff, batch[0])
-                    )
-                else:
-                    # If no batch exists, create a new one
-                    cursor.execute(
-                        """INSERT INTO INVENTORY 
-                        (medicine_id, supplier_id, quantity_added, current_quantity, batch_number, expiry_date)
-                        VALUES (%s, 1, %s, %s, 'ADJUST-'+%s, DATE_ADD(CURDATE(), INTERVAL 1 YEAR))""",
-                        (medicine_id, -qty_diff, -qty_diff, prescription_id)
-                    )
-            
-            self.connection.commit()
+                # Back onto the batches the returned units came from
+                released = FifoDispenser.release_allocation(cursor, prescription_id, medicine_id, -qty_diff)
+                FifoDispenser.restock(cursor, medicine_id, -qty_diff, f"ADJUST-{prescription_id}", released)
+            
+            conn.commit()
             print("Prescription medicine updated successfully!")
             
         except Exception as e:
-            self.connection.rollback()
+            conn.rollback()
+            if will_retry(e) or isinstance(e, StaleRowError):
+                raise
             print(f"Error updating prescription medicine: {e}")
         finally:
             cursor.close()
+            conn.close()
+
+    @retry_on_deadlock
+    def remove_medicine_from_prescription(self, prescription_id, medicine_id, expected_version=None):
+        """Remove specific medicine from prescription
 
-    def remove_medicine_from_prescription(self, prescription_id, medicine_id):
-        """Remove specific medicine from prescription"""
+        Raises StaleRowError if the prescription changed since ``expected_version``.
+        """
+        conn = get_db_connection()
+        cursor = conn.cursor()
         try:
-            cursor = self.connection.cursor()
+            
+            if self._lock_prescription(cursor, prescription_id, expected_version) is None:
+                print("Prescription not found!")
+                return
             
             # Get medicine details from prescription
-            cursor.execute(
-                """SELECT quantity_bought, total_price 
-                FROM PRESCRIPTION_MEDICINES 
-                WHERE prescription_id = %s AND medicine_id = %s""",
-                (prescription_id, medicine_id)
-            )
-            medicine = cursor.fetchone()
+            medicine = statements.fetchone(cursor, PRESCRIPTION_LINE, (prescription_id, medicine_id))
             
             if not medicine:
                 print("Medicine not found in this prescription!")
@@ -517,63 +637,36 @@ class PrescriptionManager:
             quantity, total_price = medicine
             
             # Remove from prescription_medicines
-            cursor.execute(
-                """DELETE FROM PRESCRIPTION_MEDICINES 
-                WHERE prescription_id = %s AND medicine_id = %s""",
-                (prescription_id, medicine_id)
-            )
+            statements.run(cursor, DELETE_LINE, (prescription_id, medicine_id))
             
             # Update prescription total
-            cursor.execute(
-                "UPDATE PRESCRIPTIONS SET total_amount = total_amount - %s WHERE prescription_id = %s",
-                (total_price, prescription_id)
-            )
+            statements.run(cursor, ADD_TO_TOTAL, (-total_price, prescription_id))
             
-            # Restore inventory
-            cursor.execute(
-                """SELECT inventory_id 
-                FROM INVENTORY 
-                WHERE medicine_id = %s
-                ORDER BY date_added DESC
-                LIMIT 1""",
-                (medicine_id,)
-            )
-            batch = cursor.fetchone()
+            # Restore inventory to the batches the line was dispensed from
+            released = FifoDispenser.release_allocation(cursor, prescription_id, medicine_id)
+            FifoDispenser.restock(cursor, medicine_id, quantity, f"RETURN-{prescription_id}", released)
             
-            if batch:
-                cursor.execute(
-                    "UPDATE INVENTORY SET current_quantity = current_quantity + %s WHERE inventory_id = %s",
-                    (quantity, batch[0])
-                )
-            else:
-                # If no batch exists, create a new one
-                cursor.execute(
-                    """INSERT INTO INVENTORY 
-                    (medicine_id, supplier_id, quantity_added, current_quantity, batch_number, expiry_date)
-                    VALUES (%s, 1, %s, %s, 'RETURN-'+%s, DATE_ADD(CURDATE(), INTERVAL 1 YEAR))""",
-                    (medicine_id, quantity, quantity, prescription_id)
-                )
-            
-            self.connection.commit()
+            conn.commit()
             print("Medicine removed from prescription successfully!")
             
         except Exception as e:
-            self.connection.rollback()
+            conn.rollback()
+            if will_retry(e) or isinstance(e, StaleRowError):
+                raise
             print(f"Error removing medicine from prescription: {e}")
         finally:
             cursor.close()
+            conn.close()
 
+    @retry_on_deadlock
     def adjust_inventory_quantity(self, medicine_id, adjustment):
         """Adjust medicine quantity in inventory"""
+        conn = get_db_connection()
+        cursor = conn.cursor()
         try:
-            cursor = self.connection.cursor()
             
-            # Check current stock
-            cursor.execute(
-                "SELECT SUM(current_quantity) FROM INVENTORY WHERE medicine_id = %s",
-                (medicine_id,)
-            )
-            current_stock = cursor.fetchone()[0] or 0
+            # Check current stock on the locked batches, not the cached summary
+            current_stock = FifoDispenser.locked_stock(cursor, medicine_id)
             
             new_stock = current_stock + adjustment
             if new_stock < 0:
@@ -583,82 +676,28 @@ class PrescriptionManager:
             # Update inventory
             if adjustment > 0:
                 # Add to newest batch
-                cursor.execute(
-                    """SELECT inventory_id 
-                    FROM INVENTORY 
-                    WHERE medicine_id = %s
-                    ORDER BY date_added DESC
-                    LIMIT 1""",
-                    (medicine_id,)
-                )
-                batch = cursor.fetchone()
-                
-                if batch:
-                    cursor.execute(
-                        "UPDATE INVENTORY SET current_quantity = current_quantity + %s WHERE inventory_id = %s",
-                        (adjustment, batch[0])
-                    )
-                else:
-                    # If no batch exists, create a new one
-                    cursor.execute(
-                        """INSERT INTO INVENTORY 
-                        (medicine_id, supplier_id, quantity_added, current_quantity, batch_number, expiry_date)
-                        VALUES (%s, 1, %s, %s, 'ADJUST-'+%s, DATE_ADD(CURDATE(), INTERVAL 1 YEAR))""",
-                        (medicine_id, adjustment, adjustment, 'ADJUST')
-                    )
+                FifoDispenser.restock(cursor, medicine_id, adjustment, 'ADJUST')
             else:
                 # Deduct from oldest batches first
-                remaining = -adjustment
-                cursor.execute(
-                    """SELECT inventory_id, current_quantity 
-                    FROM INVENTORY 
-                    WHERE medicine_id = %s AND current_quantity > 0
-                    ORDER BY expiry_date, date_added""",
-                    (medicine_id,)
-                )
-                batches = cursor.fetchall()
-                
-                for batch in batches:
-                    batch_id, batch_qty = batch
-                    deduct = min(remaining, batch_qty)
-                    
-                    cursor.execute(
-                        "UPDATE INVENTORY SET current_quantity = current_quantity - %s WHERE inventory_id = %s",
-                        (deduct, batch_id)
-                    )
-                    
-                    remaining -= deduct
-                    if remaining == 0:
-                        break
-            
-            self.connection.commit()
+                FifoDispenser.dispense(cursor, [(medicine_id, -adjustment)])
+            
+            conn.commit()
             print(f"Inventory updated. New stock: {new_stock}")
             
         except Exception as e:
-            self.connection.rollback()
+            conn.rollback()
+            if will_retry(e):
+                raise
             print(f"Error adjusting inventory: {e}")
         finally:
             cursor.close()
+            conn.close()
 
     def check_medicine_availability(self, medicine_id):
         """Check if medicine exists and is in stock"""
         try:
-            cursor = self.connection.cursor()
-            cursor.execute(
-                "SELECT SUM(current_quantity) FROM INVENTORY WHERE medicine_id = %s",
-                (medicine_id,)
-            )
-            result = cursor.fetchone()
-            
-            if not result:
-                print("Medicine not found in database")
-                return False
-                
-            stock = result[0] or 0
-            return stock 
+            return stock_levels.get(medicine_id)
             
         except Exception as e:
             print(f"Error checking medicine availability: {e}")
-            return False
-        finally:
-            cursor.close()
\ No newline at end of file
+            return False
\ No newline at end of file
@@ -2,11 +2,15 @@
 import tkinter as tk
 from tkinter import ttk, messagebox, simpledialog
 from datetime import datetime
-from prescriptions import PrescriptionManager
+from prescriptions import PrescriptionManager, CheckoutError
 from medicines import Medicine
+from catalog import catalog
+from autocomplete import ask_medicine_name
+from background import BackgroundLoader
+from tree_sync import KeyedTreeview
+from substitutes import substitutes
 from theme import setup_theme
-import mysql.connector
-from database import get_db_connection
+from database import get_db_connection, db_errors, StaleRowError
 
 class PrescriptionGUI:
 
@@ -16,7 +20,8 @@ class PrescriptionGUI:
         self.root.title("PharmaCare - Prescription Management")
         self.pm = PrescriptionManager()
         self.current_prescription_id = None
-        self.connection = get_db_connection()
+        self.current_prescription_version = None    # row_version as loaded, for optimistic edits
+        self.loader = BackgroundLoader(self.root, indicator=self.show_loading)
     
         # Setup theme and colors
         self.theme = setup_theme()
@@ -223,6 +228,12 @@ class PrescriptionGUI:
         self.status_var.set(message)
         self.root.after(5000, lambda: self.status_var.set("Ready"))
     
+    def show_loading(self, busy):
+        """Loading indicator for background searches"""
+        self.root.configure(cursor="watch" if busy else "")
+        if busy:
+            self.status_var.set("Loading...")
+    
     def setup_create_tab(self):
         # Main container with padding
         create_container = ttk.Frame(self.create_tab)
@@ -504,13 +515,12 @@ class PrescriptionGUI:
             # Validate date format
             datetime.strptime(new_date, "%Y-%m-%d")
         
-            # Update prescription in database
-            cursor = self.connection.cursor()
-            cursor.execute(
-            "UPDATE PRESCRIPTIONS SET date = %s WHERE prescription_id = %s",
-            (new_date, self.current_prescription_id)
-            )
-            self.connection.commit()
+            # Update prescription in database, unless it changed since it was loaded
+            if not self.pm.update_prescription_date(
+                    self.current_prescription_id, new_date, self.current_prescription_version):
+                messagebox.showerror("Error", f"Prescription #{self.current_prescription_id} no longer exists")
+                dialog.destroy()
+                return
         
             messagebox.showinfo("Success", "Prescription updated successfully")
             dialog.destroy()
@@ -519,8 +529,11 @@ class PrescriptionGUI:
         
         except ValueError:
             messagebox.showerror("Error", "Invalid date format. Please use YYYY-MM-DD")
+        except StaleRowError as e:
+            messagebox.showerror("Prescription Changed", str(e))
+            dialog.destroy()
+            self.search_prescription()
         except Exception as e:
-            self.connection.rollback()
             messagebox.showerror("Error", f"Failed to update prescription: {str(e)}")
     
     def setup_search_tab(self):
@@ -614,37 +627,54 @@ class PrescriptionGUI:
         results_frame.grid_rowconfigure(0, weight=1)
         results_frame.grid_columnconfigure(0, weight=1)
         
+        # New searches diff rows by prescription ID instead of rebuilding the tree
+        self.search_rows = KeyedTreeview(self.search_tree, lambda pres: pres['prescription_id'], lambda pres: (
+            pres['prescription_id'],
+            pres['date'],
+            f"${pres['total_amount']:.2f}"
+        ))
+        
         # Double click to view prescription
         self.search_tree.bind("<Double-1>", self.view_selected_prescription)
     
     # ========== DATABASE OPERATIONS ==========
     def execute_query(self, query, params=None, fetch=False):
-        """Execute a database query and return results if needed"""
+        """Execute a database query on a pooled connection and return results if needed"""
+        conn = get_db_connection()
+        cursor = conn.cursor(dictionary=True)
         try:
-            cursor = self.connection.cursor(dictionary=True)
             cursor.execute(query, params or ())
             
             if fetch:
-                result = cursor.fetchall()
-                cursor.close()
-                return result
+                return cursor.fetchall()
             else:
-                self.connection.commit()
-                cursor.close()
+                conn.commit()
                 return True
                 
-        except mysql.connector.Error as err:
+        except db_errors() as err:
+            conn.rollback()
             messagebox.showerror("Database Error", f"Error: {err}")
             return None
+        finally:
+            cursor.close()
+            conn.close()
+    
+    def fetch_rows(self, query, params=None):
+        """Run a read query on a pooled connection; raises instead of showing
+        a dialog, so it is safe to call from a background loader thread"""
+        conn = get_db_connection()
+        cursor = conn.cursor(dictionary=True)
+        try:
+            cursor.execute(query, params or ())
+            return cursor.fetchall()
+        finally:
+            cursor.close()
+            conn.close()
     
     def get_medicine_details(self, medicine_id):
-        """Get medicine details from database"""
-        query = """
-        SELECT name, manufacturer, price, category, description, dosage, requires_prescription 
-        FROM MEDICINES 
-        WHERE medicine_id = %s
-        """
-        return self.execute_query(query, (medicine_id,), fetch=True)
+        """Get medicine details from the catalog cache"""
+        medicine = catalog.get_by_id(medicine_id)
+        return [medicine] if medicine else []
     
     def get_prescription_details(self, prescription_id):
         """Get complete prescription details from database"""
@@ -671,7 +701,7 @@ class PrescriptionGUI:
     # ========== CREATE TAB FUNCTIONS ==========
     def add_medicine(self):
         """Add a medicine to the current prescription"""
-        name = simpledialog.askstring("Add Medicine", "Enter medicine name:")
+        name = ask_medicine_name(self.root, "Add Medicine", "Enter medicine name:")
         if not name:
             return
             
@@ -685,8 +715,10 @@ class PrescriptionGUI:
             # Check availability
             available = self.pm.check_medicine_availability(medicine_id)
             if not available:
-                messagebox.showerror("Error", f"Medicine '{name}' is out of stock")
-                return
+                substitute = self.choose_substitute(name, medicine_id)
+                if not substitute:
+                    return
+                medicine_id, name, available = substitute
                 
             # Get quantity with validation
             qty = simpledialog.askinteger(
@@ -721,6 +753,74 @@ class PrescriptionGUI:
         except Exception as e:
             messagebox.showerror("Error", f"Failed to add medicine: {str(e)}")
     
+    def choose_substitute(self, name, medicine_id):
+        """Offer in-stock alternatives for an out-of-stock medicine.
+
+        Returns (medicine_id, name, available) for the chosen alternative,
+        or None if there is none or the pharmacist cancels.
+        """
+        condition = simpledialog.askstring(
+            "Out of Stock",
+            f"'{name}' is out of stock.\n\nCondition being treated "
+            "(leave blank for the same category):",
+            parent=self.root
+        )
+        if condition is None:
+            return None
+        alternatives = substitutes.recommend(medicine_id, condition.strip() or None)
+        if not alternatives:
+            messagebox.showerror("Error", f"Medicine '{name}' is out of stock and no alternative is in stock")
+            return None
+
+        dialog = tk.Toplevel(self.root)
+        dialog.title(f"Alternatives to {name}")
+        dialog.transient(self.root)
+        dialog.grab_set()
+        chosen = {"row": None}
+
+        frame = ttk.Frame(dialog, padding="10")
+        frame.pack(fill=tk.BOTH, expand=True)
+        columns = ("Name", "Category", "Effectiveness", "Price", "In Stock", "Nearest Expiry")
+        tree = ttk.Treeview(frame, columns=columns, show="headings", height=len(alternatives))
+        for col in columns:
+            tree.heading(col, text=col)
+            tree.column(col, width=160 if col == "Name" else 110)
+        for row in alternatives:
+            tree.insert('', tk.END, iid=str(row['medicine_id']), values=(
+                row['name'],
+                row['category'],
+                f"{row['effectiveness']:.0%}",
+                f"${row['price']:.2f}",
+                row['stock'],
+                row['nearest_expiry'] or "-"
+            ))
+        tree.pack(fill=tk.BOTH, expand=True)
+        tree.selection_set(tree.get_children()[0])
+
+        def use_selected(event=None):
+            selected = tree.selection()
+            if selected:
+                chosen["row"] = next(row for row in alternatives if str(row['medicine_id']) == selected[0])
+            dialog.destroy()
+
+        tree.bind("<Double-1>", use_selected)
+        buttons = ttk.Frame(frame)
+        buttons.pack(fill=tk.X, pady=(10, 0))
+        ttk.Button(buttons, text="Use Selected", command=use_selected,
+                   style='Accent.TButton').pack(side=tk.LEFT, padx=5)
+        ttk.Button(buttons, text="Cancel", command=dialog.destroy,
+                   style='Secondary.TButton').pack(side=tk.LEFT, padx=5)
+        self.root.wait_window(dialog)
+
+        row = chosen["row"]
+        if row is None:
+            return None
+        available = self.pm.check_medicine_availability(row['medicine_id'])
+        if not available:
+            messagebox.showerror("Error", f"Medicine '{row['name']}' is out of stock")
+            return None
+        return row['medicine_id'], row['name'], available
+
     def remove_medicine(self):
         """Remove selected medicine from current prescription"""
         selected = self.meds_tree.selection()
@@ -748,64 +848,29 @@ class PrescriptionGUI:
             messagebox.showwarning("Warning", "Please add at least one medicine")
             return
             
+        # The whole basket is saved and deducted in one transaction
+        basket = []
+        for child in self.meds_tree.get_children():
+            values = self.meds_tree.item(child, 'values')
+            basket.append((values[0], int(values[1])))
+        
         try:
-            cursor = self.connection.cursor()
-            
-            # Create prescription header
-            cursor.execute("SELECT COALESCE(MAX(prescription_id), 0) FROM PRESCRIPTIONS")
-            max_id = cursor.fetchone()[0]
-            prescription_id = max_id + 1            
-            prescription_date = datetime.now().date()
-            cursor.execute(
-                "INSERT INTO PRESCRIPTIONS (prescription_id,date, total_amount) VALUES (%s,%s, 0.00)",
-                (prescription_id,prescription_date,)
-            )
-            
-            # Add each medicine to the prescription
-            for child in self.meds_tree.get_children():
-                values = self.meds_tree.item(child, 'values')
-                medicine_name = values[0]
-                quantity = int(values[1])
-                price = float(values[2][1:])
-                
-                medicine_id = Medicine.get_id_by_name(medicine_name)
-                if not medicine_id:
-                    raise ValueError(f"Medicine '{medicine_name}' not found")
-                
-                # Add to prescription_medicines
-                cursor.execute(
-                    """INSERT INTO PRESCRIPTION_MEDICINES 
-                    (prescription_id, medicine_id, quantity_bought, total_price)
-                    VALUES (%s, %s, %s, %s)""",
-                    (prescription_id, medicine_id, quantity, quantity * price)
-                )
-                
-                # Update inventory
-                self.pm.adjust_inventory_quantity(medicine_id, -quantity)
-            
-            # Calculate and update total amount
-            cursor.execute(
-                """UPDATE PRESCRIPTIONS 
-                SET total_amount = (
-                    SELECT SUM(total_price) 
-                    FROM PRESCRIPTION_MEDICINES 
-                    WHERE prescription_id = %s
-                )
-                WHERE prescription_id = %s""",
-                (prescription_id, prescription_id)
-            )
-            
-            self.connection.commit()
+            receipt = self.pm.checkout(basket)
             messagebox.showinfo(
                 "Success", 
-                f"Prescription #{prescription_id} created successfully!"
+                f"Prescription #{receipt.prescription_id} created successfully!\n"
+                f"Total: ${receipt.total_amount:.2f}"
             )
             self.clear_form()
-            self.update_status(f"Created new prescription #{prescription_id}")
+            self.update_status(f"Created new prescription #{receipt.prescription_id}")
             
-        except Exception as e:
-            self.connection.rollback()
+        except CheckoutError as e:
+            messagebox.showerror("Error", f"Failed to create prescription: {str(e)}")
+        except db_errors() as e:
             messagebox.showerror("Error", f"Failed to create prescription: {str(e)}")
+        except Exception as e:
+            # Anything else must still reach the user rather than die in the Tk callback
+            messagebox.showerror("Error", f"Unexpected error while creating prescription: {str(e)}")
     
     def clear_form(self):
         """Clear the prescription creation form"""
@@ -828,6 +893,7 @@ class PrescriptionGUI:
                 return
                 
             self.current_prescription_id = prescription['prescription_id']
+            self.current_prescription_version = prescription.get('row_version')
             
             # Update display
             self.view_id_var.set(prescription['prescription_id'])
@@ -859,6 +925,7 @@ class PrescriptionGUI:
     def clear_view_form(self):
         """Clear the view prescription form"""
         self.current_prescription_id = None
+        self.current_prescription_version = None
         self.view_id_var.set("")
         self.view_date_var.set("")
         self.view_total_var.set("")
@@ -876,22 +943,26 @@ class PrescriptionGUI:
         try:
             # Validate date format
             datetime.strptime(date_str, "%Y-%m-%d")
-            
-            # Search prescriptions
-            query = "SELECT * FROM PRESCRIPTIONS WHERE date = %s ORDER BY prescription_id"
-            prescriptions = self.execute_query(query, (date_str,), fetch=True)
-            
+        except ValueError:
+            messagebox.showerror("Error", "Invalid date format. Please use YYYY-MM-DD")
+            return
+        
+        def show(prescriptions):
             if not prescriptions:
+                self.update_status("Ready")
                 messagebox.showinfo("Info", f"No prescriptions found for {date_str}")
                 return
                 
             self.display_search_results(prescriptions)
             self.update_status(f"Found {len(prescriptions)} prescriptions for {date_str}")
-            
-        except ValueError:
-            messagebox.showerror("Error", "Invalid date format. Please use YYYY-MM-DD")
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to search prescriptions: {str(e)}")
+        
+        # Search prescriptions in the background; a newer search replaces this one
+        query = "SELECT * FROM PRESCRIPTIONS WHERE date = %s ORDER BY prescription_id"
+        self.loader.submit(
+            "search", self.fetch_rows, query, (date_str,),
+            on_done=show,
+            on_error=lambda e: messagebox.showerror("Error", f"Failed to search prescriptions: {str(e)}")
+        )
     
     def search_by_amount(self):
         """Search prescriptions by amount range"""
@@ -902,16 +973,13 @@ class PrescriptionGUI:
             if min_amt > max_amt:
                 messagebox.showwarning("Warning", "Minimum amount cannot be greater than maximum")
                 return
-                
-            # Search prescriptions
-            query = """
-            SELECT * FROM PRESCRIPTIONS 
-            WHERE total_amount BETWEEN %s AND %s 
-            ORDER BY total_amount
-            """
-            prescriptions = self.execute_query(query, (min_amt, max_amt), fetch=True)
-            
+        except ValueError:
+            messagebox.showerror("Error", "Please enter valid amounts")
+            return
+        
+        def show(prescriptions):
             if not prescriptions:
+                self.update_status("Ready")
                 messagebox.showinfo(
                     "Info", 
                     f"No prescriptions found between ${min_amt:.2f} and ${max_amt:.2f}"
@@ -922,25 +990,22 @@ class PrescriptionGUI:
             self.update_status(
                 f"Found {len(prescriptions)} prescriptions in range ${min_amt:.2f}-${max_amt:.2f}"
             )
-            
-        except ValueError:
-            messagebox.showerror("Error", "Please enter valid amounts")
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to search prescriptions: {str(e)}")
+        
+        # Search prescriptions in the background; a newer search replaces this one
+        query = """
+        SELECT * FROM PRESCRIPTIONS 
+        WHERE total_amount BETWEEN %s AND %s 
+        ORDER BY total_amount
+        """
+        self.loader.submit(
+            "search", self.fetch_rows, query, (min_amt, max_amt),
+            on_done=show,
+            on_error=lambda e: messagebox.showerror("Error", f"Failed to search prescriptions: {str(e)}")
+        )
     
     def display_search_results(self, prescriptions):
         """Display search results in the treeview"""
-        # Clear existing items
-        for child in self.search_tree.get_children():
-            self.search_tree.delete(child)
-        
-        # Add new results
-        for pres in prescriptions:
-            self.search_tree.insert('', tk.END, values=(
-                pres['prescription_id'],
-                pres['date'],
-                f"${pres['total_amount']:.2f}"
-            ))
+        self.search_rows.sync(prescriptions)
     
     def view_selected_prescription(self, event):
         """View a prescription selected from search results"""
@@ -1026,7 +1091,7 @@ class PrescriptionGUI:
             messagebox.showwarning("Warning", "Please search for a prescription first")
             return
         
-        name = simpledialog.askstring("Add Medicine", "Enter medicine name:")
+        name = ask_medicine_name(self.root, "Add Medicine", "Enter medicine name:")
         if not name:
             return
         
@@ -1038,8 +1103,10 @@ class PrescriptionGUI:
             
             available = self.pm.check_medicine_availability(medicine_id)
             if not available:
-                messagebox.showerror("Error", f"Medicine '{name}' is out of stock")
-                return
+                substitute = self.choose_substitute(name, medicine_id)
+                if not substitute:
+                    return
+                medicine_id, name, available = substitute
             
             qty = simpledialog.askinteger(
             "Add Medicine", 
@@ -1050,17 +1117,22 @@ class PrescriptionGUI:
             if not qty:
                 return
             
-            # Add to prescription using the existing connection
-            cursor = self.connection.cursor()
-            self.pm._add_medicine_to_prescription(cursor, self.current_prescription_id, medicine_id, qty)
-            self.connection.commit()
+            # Add to prescription in one transaction, unless it changed since it was loaded
+            allocation = self.pm.add_medicine_to_prescription(
+                self.current_prescription_id, medicine_id, qty, self.current_prescription_version)
+            if allocation is None:
+                messagebox.showerror("Error", f"Could not add {name} to prescription #{self.current_prescription_id}")
+                self.search_prescription()
+                return
         
             # Refresh the view
             self.search_prescription()
             self.update_status(f"Added {name} to prescription #{self.current_prescription_id}")
         
+        except StaleRowError as e:
+            messagebox.showerror("Prescription Changed", str(e))
+            self.search_prescription()
         except Exception as e:
-            self.connection.rollback()
             messagebox.showerror("Error", f"Failed to add medicine: {str(e)}")
 
 
@@ -1083,14 +1155,15 @@ class PrescriptionGUI:
             "Confirm Removal",
             f"Remove {medicine_name} from prescription #{self.current_prescription_id}?"
             ):
-                cursor = self.connection.cursor()
-                self.pm.remove_medicine_from_prescription(self.current_prescription_id, medicine_id)
-                self.connection.commit()
+                self.pm.remove_medicine_from_prescription(
+                    self.current_prescription_id, medicine_id, self.current_prescription_version)
                 self.search_prescription()  # Refresh view
                 self.update_status(f"Removed {medicine_name} from prescription")
             
+        except StaleRowError as e:
+            messagebox.showerror("Prescription Changed", str(e))
+            self.search_prescription()
         except Exception as e:
-            self.connection.rollback()
             messagebox.showerror("Error", f"Failed to remove medicine: {str(e)}")
 
 
@@ -1123,19 +1196,20 @@ class PrescriptionGUI:
             )
         
             if new_qty and new_qty != current_qty:
-                cursor = self.connection.cursor()
                 self.pm.update_prescription_medicine(
                 
                 self.current_prescription_id, 
                 medicine_id, 
-                new_qty
+                new_qty,
+                self.current_prescription_version
             )
-            self.connection.commit()
             self.search_prescription()  # Refresh view
             self.update_status(f"Updated quantity for {medicine_name}")
             
+        except StaleRowError as e:
+            messagebox.showerror("Prescription Changed", str(e))
+            self.search_prescription()
         except Exception as e:
-            self.connection.rollback()
             messagebox.showerror("Error", f"Failed to update quantity: {str(e)}")
 
 
@@ -1151,15 +1225,15 @@ class PrescriptionGUI:
             icon='warning'
         ):
             try:
-                cursor = self.connection.cursor()
-                self.pm.delete_prescription(self.current_prescription_id)
-                self.connection.commit()
+                self.pm.delete_prescription(self.current_prescription_id, self.current_prescription_version)
                 messagebox.showinfo("Success", "Prescription deleted successfully")
                 self.clear_view_form()
                 self.update_status(f"Deleted prescription #{self.current_prescription_id}")
             
+            except StaleRowError as e:
+                messagebox.showerror("Prescription Changed", str(e))
+                self.search_prescription()
             except Exception as e:
-                self.connection.rollback()
                 messagebox.showerror("Error", f"Failed to delete prescription: {str(e)}")
 
 
@@ -0,0 +1,240 @@
+# price_list.py
+import sys
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+from database import get_db_connection, db_errors, describe_error
+from catalog import catalog, normalize_name
+from sequences import allocate_ids
+from spreadsheet import ImportFileError, iter_records
+
+CATALOG_ALIASES = {
+    "medicine": "name",
+    "medicine_name": "name",
+    "unit_price": "price",
+    "rx": "requires_prescription",
+    "prescription": "requires_prescription",
+    "rx_required": "requires_prescription",
+}
+
+# Columns a price list may change on an existing medicine (name is the key)
+UPDATABLE_FIELDS = ("manufacturer", "price", "category", "description", "dosage", "requires_prescription")
+
+LOOKUP_CHUNK = 500      # names resolved per IN query
+INSERT_BATCH_ROWS = 100  # rows per multi-row INSERT
+
+_TRUE = {"1", "y", "yes", "true"}
+_FALSE = {"0", "n", "no", "false"}
+
+
+def _parse_price(value):
+    try:
+        price = Decimal(str(value)).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+    except (InvalidOperation, ValueError):
+        raise ValueError(f"Invalid price '{value}'")
+    if price <= 0:
+        raise ValueError("Price must be positive")
+    return price
+
+
+def _parse_flag(value):
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in _TRUE:
+        return True
+    if text in _FALSE:
+        return False
+    raise ValueError(f"Invalid prescription flag '{value}' (use yes/no)")
+
+
+class CatalogImporter:
+    """Applies a supplier price list / catalog file to MEDICINES in one transaction.
+
+    Rows are matched to existing medicines by name (case-insensitive) with
+    one IN query per chunk of names. New names are inserted with a block of
+    IDs and multi-row INSERTs; existing ones get a batched UPDATE of the
+    columns present in the file, and only when a value actually changed.
+    The catalog cache is refreshed once after the commit.
+    """
+
+    def __init__(self, lookup_chunk=LOOKUP_CHUNK, insert_rows=INSERT_BATCH_ROWS):
+        self.lookup_chunk = lookup_chunk
+        self.insert_rows = insert_rows
+
+    def import_file(self, path, dry_run=False):
+        """Upsert a .csv/.xlsx catalog file; returns a change summary.
+
+        With ``dry_run`` the summary is computed but nothing is written.
+        """
+        result = {"success": False, "inserted": 0, "updated": 0, "unchanged": 0,
+                  "price_changes": [], "errors": []}
+        try:
+            items, errors = self._parse(iter_records(path, ("name",), CATALOG_ALIASES))
+            result["errors"] = errors
+            existing = self._existing([item["name"] for item in items])
+        except ImportFileError as e:
+            result["message"] = str(e)
+            return result
+        except db_errors() as db_error:
+            result["message"] = describe_error(db_error)
+            return result
+
+        inserts = []
+        updates = []
+        for item in items:
+            current = existing.get(normalize_name(item["name"]))
+            if current is None:
+                if "price" not in item:
+                    errors.append((item["line"], f"New medicine '{item['name']}' needs a price"))
+                    continue
+                inserts.append(item)
+                continue
+            changed = {field: item[field] for field in UPDATABLE_FIELDS
+                       if field in item and item[field] != current[field]}
+            if not changed:
+                result["unchanged"] += 1
+                continue
+            if "price" in changed:
+                result["price_changes"].append((current["name"], current["price"], changed["price"]))
+            updates.append((current, changed))
+        errors.sort()
+
+        if not dry_run and (inserts or updates):
+            try:
+                self._write(inserts, updates)
+            except db_errors() as db_error:
+                result["message"] = f"Import failed, nothing was changed: {describe_error(db_error)}"
+                return result
+
+        result.update(success=True, inserted=len(inserts), updated=len(updates))
+        result["message"] = (f"{'Would insert' if dry_run else 'Inserted'} {len(inserts)}, "
+                             f"{'update' if dry_run else 'updated'} {len(updates)}, "
+                             f"unchanged {result['unchanged']}"
+                             + (f", skipped {len(errors)} invalid line(s)" if errors else ""))
+        return result
+
+    # ---------- parsing ----------
+
+    def _parse(self, records):
+        items = []
+        errors = []
+        seen = {}
+        for line, record in records:
+            try:
+                item = self._parse_line(record)
+            except ValueError as e:
+                errors.append((line, str(e)))
+                continue
+            key = normalize_name(item["name"])
+            if key in seen:
+                errors.append((line, f"Duplicate of line {seen[key]} ('{item['name']}')"))
+                continue
+            seen[key] = line
+            item["line"] = line
+            items.append(item)
+        return items, errors
+
+    def _parse_line(self, record):
+        if record.get("name") is None:
+            raise ValueError("Name is required")
+        item = {"name": str(record["name"])}
+        for field in ("manufacturer", "category", "description", "dosage"):
+            if record.get(field) is not None:
+                item[field] = str(record[field])
+        if record.get("price") is not None:
+            item["price"] = _parse_price(record["price"])
+        if record.get("requires_prescription") is not None:
+            item["requires_prescription"] = _parse_flag(record["requires_prescription"])
+        return item
+
+    # ---------- database ----------
+
+    def _existing(self, names):
+        """{normalized name: current row} for the names already in the catalog"""
+        existing = {}
+        conn = get_db_connection()
+        cursor = conn.cursor(dictionary=True)
+        try:
+            for start in range(0, len(names), self.lookup_chunk):
+                chunk = names[start:start + self.lookup_chunk]
+                placeholders = ", ".join(["%s"] * len(chunk))
+                cursor.execute(
+                    f"SELECT medicine_id, name, {', '.join(UPDATABLE_FIELDS)} "
+                    f"FROM medicines WHERE name IN ({placeholders})",
+                    tuple(chunk)
+                )
+                for row in cursor.fetchall():
+                    row["requires_prescription"] = bool(row["requires_prescription"])
+                    existing[normalize_name(row["name"])] = row
+            return existing
+        finally:
+            cursor.close()
+            conn.close()
+
+    def _write(self, inserts, updates):
+        # Reserve the IDs before the transaction: the reservation commits on its own connection
+        new_ids = allocate_ids("medicines", len(inserts))
+        rows = [(medicine_id, item["name"], item.get("manufacturer"), item["price"], item.get("category"),
+                 item.get("description"), item.get("dosage"), item.get("requires_prescription", False))
+                for medicine_id, item in zip(new_ids, inserts)]
+
+        # One executemany per set of changed columns
+        grouped = {}
+        for current, changed in updates:
+            fields = tuple(field for field in UPDATABLE_FIELDS if field in changed)
+            grouped.setdefault(fields, []).append(
+                tuple(changed[field] for field in fields) + (current["medicine_id"],))
+
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        try:
+            for start in range(0, len(rows), self.insert_rows):
+                batch = rows[start:start + self.insert_rows]
+                placeholders = ", ".join(["(%s, %s, %s, %s, %s, %s, %s, %s)"] * len(batch))
+                cursor.execute(
+                    "INSERT INTO medicines (medicine_id, name, manufacturer, price, category, "
+                    f"description, dosage, requires_prescription) VALUES {placeholders}",
+                    tuple(value for row in batch for value in row)
+                )
+            for fields, params in grouped.items():
+                assignments = ", ".join(f"{field} = %s" for field in fields)
+                cursor.executemany(f"UPDATE medicines SET {assignments} WHERE medicine_id = %s", params)
+            version = catalog.bump_version(cursor)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+            conn.close()
+
+        changed_ids = new_ids + [current["medicine_id"] for current, _ in updates]
+        if len(changed_ids) > self.lookup_chunk:
+            catalog.invalidate()    # one bulk reload beats fetching thousands of rows by ID
+        else:
+            catalog.after_write(version, *changed_ids)
+
+
+def import_price_list(path, dry_run=False):
+    """Apply a catalog/price-list file; see CatalogImporter.import_file()"""
+    return CatalogImporter().import_file(path, dry_run)
+
+
+def main(argv=None):
+    """Command-line import: python price_list.py FILE [--dry-run]"""
+    args = argv if argv is not None else sys.argv[1:]
+    paths = [arg for arg in args if not arg.startswith("--")]
+    if len(paths) != 1:
+        print("Usage: python price_list.py FILE [--dry-run]")
+        return 2
+    result = import_price_list(paths[0], dry_run="--dry-run" in args)
+    for line, message in result["errors"]:
+        print(f"Line {line}: {message}")
+    for name, old, new in result["price_changes"]:
+        print(f"{name}: {old} -> {new}")
+    print(result["message"])
+    return 0 if result["success"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,249 @@
+# receiving.py
+import sys
+from datetime import date, datetime
+
+from database import get_db_connection, db_errors, describe_error
+from catalog import catalog
+from sequences import allocate_ids
+from stock import stock_levels
+from search import search_index
+from spreadsheet import ImportFileError, iter_records
+
+DELIVERY_COLUMNS = ("medicine", "supplier_id", "quantity", "batch_number", "expiry_date")
+DELIVERY_ALIASES = {
+    "medicine_id": "medicine",
+    "medicine_name": "medicine",
+    "name": "medicine",
+    "supplier": "supplier_id",
+    "qty": "quantity",
+    "quantity_added": "quantity",
+    "batch": "batch_number",
+    "expiry": "expiry_date",
+}
+
+VALIDATION_CHUNK = 1000     # delivery lines validated per set-based lookup
+INSERT_BATCH_ROWS = 100     # rows per multi-row INSERT (9 params each stays under SQLite's limit)
+
+INVENTORY_INSERT_COLUMNS = ("inventory_id, medicine_id, supplier_id, quantity_added, date_added, "
+                            "batch_number, expiry_date, current_quantity, location")
+
+
+def _parse_quantity(value):
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    try:
+        quantity = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid quantity '{value}'")
+    if quantity <= 0:
+        raise ValueError("Quantity must be positive")
+    return quantity
+
+
+def _parse_expiry(value, today):
+    if isinstance(value, datetime):
+        expiry = value.date()
+    elif isinstance(value, date):
+        expiry = value
+    else:
+        try:
+            expiry = datetime.strptime(str(value), '%Y-%m-%d').date()
+        except ValueError:
+            raise ValueError(f"Invalid expiry date '{value}'. Use YYYY-MM-DD")
+    if expiry <= today:
+        raise ValueError("Expiry date must be in the future")
+    return expiry
+
+
+def _parse_int(value, label):
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid {label} '{value}'")
+
+
+class DeliveryImporter:
+    """Receives a whole supplier delivery file into INVENTORY in one transaction.
+
+    The file is read a row at a time. Lines are validated in chunks:
+    medicines against the in-memory catalog, suppliers with one IN query
+    per chunk. IDs for every valid line are taken as one block, then the
+    batches go in with multi-row INSERTs, the stock totals and the search
+    index are updated once, and a single commit makes the delivery visible.
+    """
+
+    def __init__(self, chunk_size=VALIDATION_CHUNK, insert_rows=INSERT_BATCH_ROWS):
+        self.chunk_size = chunk_size
+        self.insert_rows = insert_rows
+
+    def import_file(self, path, skip_invalid=True):
+        """Import a .csv/.xlsx delivery.
+
+        Invalid lines are reported in "errors" as (line, message); with
+        ``skip_invalid`` False nothing is written if any line is invalid.
+        """
+        try:
+            lines, errors = self._validate(iter_records(path, DELIVERY_COLUMNS, DELIVERY_ALIASES))
+        except ImportFileError as e:
+            return {"success": False, "message": str(e), "imported": 0, "errors": []}
+        except db_errors() as db_error:
+            return {"success": False, "message": describe_error(db_error), "imported": 0, "errors": []}
+
+        if errors and not skip_invalid:
+            return {"success": False, "imported": 0, "errors": errors,
+                    "message": f"{len(errors)} invalid line(s); nothing was imported"}
+        if not lines:
+            return {"success": not errors, "imported": 0, "errors": errors,
+                    "message": "No valid delivery lines found"}
+
+        try:
+            inventory_ids = self._insert(lines)
+        except db_errors() as db_error:
+            return {"success": False, "imported": 0, "errors": errors,
+                    "message": f"Import failed, nothing was imported: {describe_error(db_error)}"}
+
+        return {
+            "success": True,
+            "imported": len(inventory_ids),
+            "inventory_ids": inventory_ids,
+            "errors": errors,
+            "message": f"Imported {len(inventory_ids)} batch(es)"
+                       + (f", skipped {len(errors)} invalid line(s)" if errors else "")
+        }
+
+    # ---------- validation ----------
+
+    def _validate(self, records):
+        lines = []
+        errors = []
+        known_suppliers = set()
+        chunk = []
+        for line, record in records:
+            chunk.append((line, record))
+            if len(chunk) >= self.chunk_size:
+                self._validate_chunk(chunk, known_suppliers, lines, errors)
+                chunk = []
+        if chunk:
+            self._validate_chunk(chunk, known_suppliers, lines, errors)
+        errors.sort()
+        return lines, errors
+
+    def _validate_chunk(self, chunk, known_suppliers, lines, errors):
+        today = date.today()
+        parsed = []
+        for line, record in chunk:
+            try:
+                parsed.append((line, self._parse_line(record, today)))
+            except ValueError as e:
+                errors.append((line, str(e)))
+
+        wanted = {item["supplier_id"] for _, item in parsed} - known_suppliers
+        if wanted:
+            known_suppliers.update(self._existing_suppliers(wanted))
+
+        for line, item in parsed:
+            if item["supplier_id"] not in known_suppliers:
+                errors.append((line, f"Supplier ID {item['supplier_id']} not found"))
+            else:
+                lines.append(item)
+
+    def _parse_line(self, record, today):
+        medicine = record.get("medicine")
+        if medicine is None:
+            raise ValueError("Medicine is required")
+        if isinstance(medicine, (int, float)) or str(medicine).isdigit():
+            medicine_id = _parse_int(medicine, "medicine ID")
+            if catalog.get_by_id(medicine_id) is None:
+                raise ValueError(f"Medicine ID {medicine_id} not found")
+        else:
+            medicine_id = catalog.id_for_name(str(medicine))
+            if medicine_id is None:
+                raise ValueError(f"Medicine '{medicine}' not found")
+
+        if record.get("supplier_id") is None:
+            raise ValueError("Supplier ID is required")
+        if record.get("batch_number") is None:
+            raise ValueError("Batch number is required")
+        location = record.get("location")
+        return {
+            "medicine_id": medicine_id,
+            "supplier_id": _parse_int(record["supplier_id"], "supplier ID"),
+            "quantity": _parse_quantity(record.get("quantity")),
+            "batch_number": str(record["batch_number"]),
+            "expiry_date": _parse_expiry(record.get("expiry_date"), today),
+            "location": str(location) if location is not None else None,
+        }
+
+    def _existing_suppliers(self, supplier_ids):
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        try:
+            placeholders = ", ".join(["%s"] * len(supplier_ids))
+            cursor.execute(f"SELECT supplier_id FROM suppliers WHERE supplier_id IN ({placeholders})",
+                           tuple(supplier_ids))
+            return {row[0] for row in cursor.fetchall()}
+        finally:
+            cursor.close()
+            conn.close()
+
+    # ---------- insert ----------
+
+    def _insert(self, lines):
+        # Reserve the IDs before the transaction: the reservation commits on its own connection
+        inventory_ids = allocate_ids("inventory", len(lines))
+        received_at = datetime.now()
+        deltas = {}
+        rows = []
+        for inventory_id, item in zip(inventory_ids, lines):
+            rows.append((inventory_id, item["medicine_id"], item["supplier_id"], item["quantity"],
+                         received_at, item["batch_number"], item["expiry_date"], item["quantity"],
+                         item["location"]))
+            deltas[item["medicine_id"]] = deltas.get(item["medicine_id"], 0) + item["quantity"]
+
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        try:
+            for start in range(0, len(rows), self.insert_rows):
+                batch = rows[start:start + self.insert_rows]
+                placeholders = ", ".join(["(%s, %s, %s, %s, %s, %s, %s, %s, %s)"] * len(batch))
+                cursor.execute(
+                    f"INSERT INTO inventory ({INVENTORY_INSERT_COLUMNS}) VALUES {placeholders}",
+                    tuple(value for row in batch for value in row)
+                )
+            stock_levels.record(cursor, deltas)
+            version = search_index.bump_batches(cursor)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+            conn.close()
+
+        search_index.batches_added(version, [(row[0], row[1], row[5], row[8]) for row in rows])
+        return inventory_ids
+
+
+def import_delivery(path, skip_invalid=True):
+    """Import a delivery file; see DeliveryImporter.import_file()"""
+    return DeliveryImporter().import_file(path, skip_invalid)
+
+
+def main(argv=None):
+    """Command-line import: python receiving.py DELIVERY_FILE [--strict]"""
+    args = argv if argv is not None else sys.argv[1:]
+    paths = [arg for arg in args if not arg.startswith("--")]
+    if len(paths) != 1:
+        print("Usage: python receiving.py DELIVERY_FILE [--strict]")
+        return 2
+    result = import_delivery(paths[0], skip_invalid="--strict" not in args)
+    for line, message in result["errors"]:
+        print(f"Line {line}: {message}")
+    print(result["message"])
+    return 0 if result["success"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
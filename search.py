@@ -0,0 +1,480 @@
+import itertools
+import re
+import threading
+import time
+
+from catalog import catalog, bump_version, read_version, normalize_name
+from database import get_db_connection
+from stock import stock_levels
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+# How often (seconds) the batch index asks whether another terminal changed it
+BATCH_CHECK_INTERVAL = 2.0
+BATCH_VERSION_KEY = "inventory_batches"
+
+# Rank buckets, best first
+EXACT, NAME_PREFIX, WORD_PREFIX, NAME_SUBSTRING, FIELD_SUBSTRING, FUZZY = range(6)
+
+
+def _normalize(text):
+    return normalize_name(text) if text else ""
+
+
+def _words(text):
+    return set(_WORD.findall(text))
+
+
+def max_typos(term):
+    """Edit distance tolerated for a search term of this length"""
+    if len(term) < 4:
+        return 0
+    return 1 if len(term) < 8 else 2
+
+
+class PrefixTrie:
+    """Character trie mapping words to sets of document keys"""
+
+    _KEYS = "\0"
+
+    def __init__(self):
+        self._root = {}
+
+    def add(self, word, key):
+        node = self._root
+        for char in word:
+            node = node.setdefault(char, {})
+        node.setdefault(self._KEYS, set()).add(key)
+
+    def remove(self, word, key):
+        path = [self._root]
+        for char in word:
+            node = path[-1].get(char)
+            if node is None:
+                return
+            path.append(node)
+        keys = path[-1].get(self._KEYS)
+        if not keys:
+            return
+        keys.discard(key)
+        if not keys:
+            del path[-1][self._KEYS]
+        # Prune branches that no longer lead to any key
+        for depth in range(len(word), 0, -1):
+            if path[depth]:
+                break
+            del path[depth - 1][word[depth - 1]]
+
+    def complete(self, prefix):
+        """Lazily yield keys of words starting with ``prefix`` in word order"""
+        node = self._root
+        for char in prefix:
+            node = node.get(char)
+            if node is None:
+                return
+        # Depth-first, so the first few completions cost O(depth) each;
+        # the terminal marker sorts first, so shorter words come out first
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            for char in sorted(node, reverse=True):
+                if char != self._KEYS:
+                    stack.append(node[char])
+            if self._KEYS in node:
+                yield from node[self._KEYS]
+
+    def fuzzy(self, word, max_distance):
+        """{key: distance} for words within ``max_distance`` edits of ``word``.
+
+        Only words sharing the first letter are considered: misspellings
+        rarely start wrong, and it keeps the walk to one branch of the trie.
+        """
+        found = {}
+        if not word or word[0] not in self._root:
+            return found
+        length = len(word)
+        beyond = max_distance + 1
+        first_row = [column if column <= max_distance else beyond for column in range(length + 1)]
+        stack = [(self._root[word[0]], word[0], 1, first_row)]
+        while stack:
+            node, char, depth, previous = stack.pop()
+            # One Levenshtein DP row per trie edge, computed only inside the
+            # diagonal band that can still stay within max_distance
+            row = [beyond] * (length + 1)
+            row[0] = depth if depth <= max_distance else beyond
+            best = row[0]
+            for column in range(max(1, depth - max_distance), min(length, depth + max_distance) + 1):
+                cost = 0 if word[column - 1] == char else 1
+                value = min(row[column - 1] + 1, previous[column] + 1, previous[column - 1] + cost)
+                row[column] = value if value < beyond else beyond
+                if value < best:
+                    best = value
+            if row[length] <= max_distance and self._KEYS in node:
+                for key in node[self._KEYS]:
+                    if row[length] < found.get(key, beyond):
+                        found[key] = row[length]
+            if best <= max_distance:
+                stack.extend((child, next_char, depth + 1, row) for next_char, child in node.items()
+                             if next_char != self._KEYS)
+        return found
+
+
+class TrigramIndex:
+    """Substring search through trigram postings, verified against the text"""
+
+    def __init__(self):
+        self._texts = {}        # key -> normalized text
+        self._postings = {}     # trigram -> set of keys
+
+    def add(self, key, text):
+        self.remove(key)
+        self._texts[key] = text
+        for gram in self._grams(text):
+            self._postings.setdefault(gram, set()).add(key)
+
+    def remove(self, key):
+        text = self._texts.pop(key, None)
+        if text is None:
+            return
+        for gram in self._grams(text):
+            keys = self._postings.get(gram)
+            if keys:
+                keys.discard(key)
+                if not keys:
+                    del self._postings[gram]
+
+    def clear(self):
+        self._texts = {}
+        self._postings = {}
+
+    def matches(self, term):
+        """Lazily yield keys whose text contains ``term``"""
+        if len(term) < 3:
+            # Too short to have a trigram: scan the texts, as LIKE '%term%' did
+            yield from (key for key, text in self._texts.items() if term in text)
+            return
+        postings = sorted((self._postings.get(gram, ()) for gram in self._grams(term)), key=len)
+        if not postings or not postings[0]:
+            return
+        # Walk the rarest trigram's keys; check the others by set membership
+        rest = postings[1:]
+        for key in postings[0]:
+            if all(key in keys for keys in rest) and term in self._texts[key]:
+                yield key
+
+    @staticmethod
+    def _grams(text):
+        return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class ValueIndex:
+    """Keys grouped by a low-cardinality field (manufacturer, category, location).
+
+    There are few distinct values, so a substring match is a scan over the
+    values rather than over every document.
+    """
+
+    def __init__(self):
+        self._keys_by_value = {}
+
+    def add(self, key, value):
+        if value:
+            self._keys_by_value.setdefault(value, set()).add(key)
+
+    def remove(self, key, value):
+        keys = self._keys_by_value.get(value)
+        if keys:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_value[value]
+
+    def clear(self):
+        self._keys_by_value = {}
+
+    def matches(self, term):
+        """Lazily yield keys whose value contains ``term``, shortest values first"""
+        for value in sorted((value for value in self._keys_by_value if term in value), key=len):
+            yield from self._keys_by_value[value]
+
+
+class _BatchIndex:
+    """Inventory batches by batch number and location (one SearchIndex snapshot)"""
+
+    def __init__(self, rows=()):
+        self.batches = {}                   # inventory_id -> (medicine_id, batch_number, location)
+        self.by_medicine = {}
+        self.words = PrefixTrie()
+        self.text = TrigramIndex()
+        self.locations = ValueIndex()
+        for row in rows:
+            self.add(*row)
+
+    def add(self, inventory_id, medicine_id, batch_number, location):
+        batch_number, location = _normalize(batch_number), _normalize(location)
+        self.batches[inventory_id] = (medicine_id, batch_number, location)
+        self.by_medicine.setdefault(medicine_id, set()).add(inventory_id)
+        for word in _words(batch_number):
+            self.words.add(word, inventory_id)
+        self.text.add(inventory_id, batch_number)
+        self.locations.add(inventory_id, location)
+
+    def remove(self, inventory_id):
+        entry = self.batches.pop(inventory_id, None)
+        if entry is None:
+            return
+        medicine_id, batch_number, location = entry
+        self.by_medicine.get(medicine_id, set()).discard(inventory_id)
+        for word in _words(batch_number):
+            self.words.remove(word, inventory_id)
+        self.text.remove(inventory_id)
+        self.locations.remove(inventory_id, location)
+
+
+def _take(candidates, count, seen):
+    """First ``count`` unseen keys from an iterable (marking them seen)"""
+    chosen = []
+    if count <= 0:
+        return chosen
+    for key in candidates:
+        if key not in seen:
+            seen.add(key)
+            chosen.append(key)
+            if len(chosen) >= count:
+                break
+    return chosen
+
+
+class SearchIndex:
+    """In-process search over the medicine catalog and inventory batches.
+
+    Medicines are indexed by name (trie and trigrams), by the words of the
+    name, and by manufacturer and category. The medicine side follows the
+    catalog cache through its listener hooks. The batch side indexes batch
+    number and location; the inventory write paths keep it current, and a
+    version stamp catches other terminals' writes. Results come in rank
+    buckets: exact name, name prefix, word prefix, name substring,
+    manufacturer/category, then misspellings within a small edit distance.
+    Only as many candidates as the limit asks for are ever collected.
+    """
+
+    def __init__(self, check_interval=BATCH_CHECK_INTERVAL):
+        self.check_interval = check_interval
+        self._lock = threading.RLock()      # guards the index; never held for I/O
+
+        self._medicines = {}                # medicine_id -> (name, manufacturer, category)
+        self._name_trie = PrefixTrie()
+        self._name_words = PrefixTrie()
+        self._name_text = TrigramIndex()
+        self._manufacturers = ValueIndex()
+        self._categories = ValueIndex()
+
+        self._batch_index = _BatchIndex()
+        self._batch_version = None
+        self._batch_checked_at = 0.0
+        self._batch_generation = 0          # bumped by every write-through and invalidate_batches()
+
+        catalog.subscribe(self)
+
+    # ---------- medicine search ----------
+
+    def search_medicines(self, term, limit=50):
+        """Ranked catalog rows with a 'stock' column (best match first)"""
+        catalog.refresh()
+        with self._lock:
+            ranked = self._rank_medicines(_normalize(term), limit)
+        results = []
+        for medicine_id, _ in ranked:
+            medicine = catalog.get_by_id(medicine_id)
+            if medicine:
+                medicine['stock'] = stock_levels.get(medicine_id)
+                results.append(medicine)
+        return results
+
+    def suggest(self, prefix, limit=10):
+        """(name, stock) suggestions for autocomplete"""
+        return [(medicine['name'], medicine['stock']) for medicine in self.search_medicines(prefix, limit)]
+
+    def _rank_medicines(self, term, limit):
+        """[(medicine_id, rank bucket)] best first"""
+        if not term:
+            return []
+        with self._lock:
+            candidates = self._medicine_candidates(term, limit)
+        # Within a bucket: in-stock medicines first, then shorter names. The
+        # stock mirror may reload from the database, so it is asked outside the lock
+        candidates.sort(key=lambda candidate: (candidate[0], candidate[1],
+                                               stock_levels.get(candidate[3]) <= 0,
+                                               len(candidate[2]), candidate[2]))
+        return [(medicine_id, score) for _, score, _, medicine_id in candidates]
+
+    def _medicine_candidates(self, term, limit):
+        """[(bucket, rank, name, medicine_id)] in bucket order; caller holds the lock"""
+        candidates = []
+        seen = set()
+        buckets = itertools.count()
+
+        def bucket(matches, score):
+            position = next(buckets)
+            for medicine_id in _take(matches, limit - len(candidates), seen):
+                candidates.append((position, score(medicine_id), self._medicines[medicine_id][0], medicine_id))
+
+        bucket(self._name_trie.complete(term),
+               lambda medicine_id: EXACT if self._medicines[medicine_id][0] == term else NAME_PREFIX)
+        bucket(self._name_words.complete(term), lambda medicine_id: WORD_PREFIX)
+        bucket(self._name_text.matches(term), lambda medicine_id: NAME_SUBSTRING)
+        bucket(self._manufacturers.matches(term), lambda medicine_id: FIELD_SUBSTRING)
+        bucket(self._categories.matches(term), lambda medicine_id: FIELD_SUBSTRING)
+
+        # Typo tolerance only when the term is not already a known name;
+        # words never contain spaces, so a one-word term is matched against
+        # name words and a longer one against whole names
+        typos = max_typos(term)
+        if len(candidates) < limit and typos and not any(rank == EXACT for _, rank, _, _ in candidates):
+            trie = self._name_trie if " " in term else self._name_words
+            distances = trie.fuzzy(term, typos)
+            bucket(sorted(distances, key=distances.get), lambda medicine_id: FUZZY + distances[medicine_id])
+        return candidates
+
+    # ---------- inventory search ----------
+
+    def search_inventory_ids(self, term, limit=200):
+        """Ranked inventory_ids matching a medicine name, batch number or location"""
+        term = _normalize(term)
+        if not term:
+            return []
+        self._ensure_batches()
+        catalog.refresh()
+        medicines = self._rank_medicines(term, limit)
+        with self._lock:
+            batch_index = self._batch_index
+            ranked = []
+            seen = set()
+            for medicine_id, _ in medicines:
+                batches = sorted(batch_index.by_medicine.get(medicine_id, ()))
+                ranked.extend(_take(batches, limit - len(ranked), seen))
+            ranked.extend(_take(batch_index.words.complete(term), limit - len(ranked), seen))
+            ranked.extend(_take(batch_index.text.matches(term), limit - len(ranked), seen))
+            ranked.extend(_take(batch_index.locations.matches(term), limit - len(ranked), seen))
+            return ranked
+
+    # ---------- catalog listener ----------
+
+    def catalog_reloaded(self, rows):
+        with self._lock:
+            self._medicines = {}
+            self._name_trie = PrefixTrie()
+            self._name_words = PrefixTrie()
+            self._name_text.clear()
+            self._manufacturers.clear()
+            self._categories.clear()
+            for row in rows:
+                self._add_medicine(row)
+
+    def catalog_changed(self, medicine_id, row):
+        with self._lock:
+            self._remove_medicine(medicine_id)
+            if row:
+                self._add_medicine(row)
+
+    def _add_medicine(self, row):
+        medicine_id = row['medicine_id']
+        name, manufacturer, category = fields = (
+            _normalize(row['name']), _normalize(row['manufacturer']), _normalize(row['category']))
+        self._medicines[medicine_id] = fields
+        self._name_trie.add(name, medicine_id)
+        for word in _words(name):
+            self._name_words.add(word, medicine_id)
+        self._name_text.add(medicine_id, name)
+        self._manufacturers.add(medicine_id, manufacturer)
+        self._categories.add(medicine_id, category)
+
+    def _remove_medicine(self, medicine_id):
+        fields = self._medicines.pop(medicine_id, None)
+        if fields is None:
+            return
+        name, manufacturer, category = fields
+        self._name_trie.remove(name, medicine_id)
+        for word in _words(name):
+            self._name_words.remove(word, medicine_id)
+        self._name_text.remove(medicine_id)
+        self._manufacturers.remove(medicine_id, manufacturer)
+        self._categories.remove(medicine_id, category)
+
+    # ---------- batch maintenance ----------
+
+    def bump_batches(self, cursor):
+        """Record that batches were added or removed; call before commit"""
+        return bump_version(cursor, BATCH_VERSION_KEY)
+
+    def batch_added(self, version, inventory_id, medicine_id, batch_number, location):
+        """Index a committed new batch (write-through)"""
+        with self._lock:
+            if self._in_step(version):
+                self._batch_index.add(inventory_id, medicine_id, batch_number, location)
+
+    def batches_added(self, version, batches):
+        """Index many batches committed under one version bump (bulk receiving)"""
+        with self._lock:
+            if self._in_step(version):
+                for batch in batches:
+                    self._batch_index.add(*batch)
+
+    def batch_removed(self, version, inventory_id):
+        """Drop a committed deleted batch (write-through)"""
+        with self._lock:
+            if self._in_step(version):
+                self._batch_index.remove(inventory_id)
+
+    def invalidate_batches(self):
+        """Reload the batch index on the next search"""
+        with self._lock:
+            self._batch_version = None
+            self._batch_generation += 1
+
+    def _in_step(self, version):
+        """Advance to ``version`` if no other write slipped in; else force a reload"""
+        # A reload in flight may have read the table before this write
+        self._batch_generation += 1
+        if self._batch_version is not None and self._batch_version == version - 1:
+            self._batch_version = version
+            return True
+        self._batch_version = None
+        return False
+
+    def _ensure_batches(self):
+        now = time.monotonic()
+        if self._batch_version is not None and now - self._batch_checked_at < self.check_interval:
+            return
+        # Read outside the lock; two threads may both reload, which is harmless
+        with self._lock:
+            generation = self._batch_generation
+            loaded = self._batch_version
+        current = read_version(BATCH_VERSION_KEY)
+        if current == loaded:
+            with self._lock:
+                if self._batch_generation == generation:
+                    self._batch_checked_at = now
+            return
+        self._load_batches(current, generation, now)
+
+    def _load_batches(self, version, generation, now):
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT inventory_id, medicine_id, batch_number, location FROM inventory")
+            rows = cursor.fetchall()
+        finally:
+            cursor.close()
+            conn.close()
+        batch_index = _BatchIndex(rows)
+        with self._lock:
+            self._batch_index = batch_index
+            # Written to while reading: keep the rows but reload on the next search
+            if self._batch_generation == generation:
+                self._batch_version = version
+                self._batch_checked_at = now
+            else:
+                self._batch_version = None
+
+
+search_index = SearchIndex()
@@ -0,0 +1,150 @@
+import threading
+
+from database import get_db_connection, db_errors, is_duplicate_key, register_schema
+
+# sequence name -> (table, key column) used to seed a new sequence
+SEQUENCES = {
+    "medicines": ("medicines", "medicine_id"),
+    "suppliers": ("suppliers", "supplier_id"),
+    "inventory": ("inventory", "inventory_id"),
+    "prescriptions": ("prescriptions", "prescription_id"),
+    "users": ("users", "user_id"),
+}
+
+# How many IDs a process reserves per round trip
+DEFAULT_BLOCK_SIZE = 10
+BLOCK_SIZES = {
+    "inventory": 50,
+    "prescriptions": 50,
+}
+
+
+class IdAllocator:
+    """Hands out primary keys from blocks reserved in the id_sequences table (hi/lo).
+
+    Reserving a block is a short transaction of its own on a separate pooled
+    connection. It bumps next_value under a row lock, so several processes
+    (terminals) never receive the same IDs. Within the process, IDs are
+    handed out from memory without touching the database. IDs from a block
+    that is never used are simply skipped.
+    """
+
+    def __init__(self, block_sizes=None):
+        self._block_sizes = dict(BLOCK_SIZES, **(block_sizes or {}))
+        self._blocks = {}  # name -> [next_value, limit)
+        self._lock = threading.Lock()
+
+    def next_id(self, name):
+        """Get one new ID for a sequence"""
+        return self.allocate(name, 1)[0]
+
+    def allocate(self, name, count):
+        """Get ``count`` new IDs for a sequence (used by bulk inserts)"""
+        if name not in SEQUENCES:
+            raise KeyError(f"Unknown ID sequence '{name}'")
+        if count <= 0:
+            return []
+
+        with self._lock:
+            ids = []
+            start, limit = self._blocks.get(name, (0, 0))
+            while len(ids) < count:
+                if start >= limit:
+                    wanted = max(self._block_sizes.get(name, DEFAULT_BLOCK_SIZE), count - len(ids))
+                    start, limit = self._reserve(name, wanted)
+                take = min(limit - start, count - len(ids))
+                ids.extend(range(start, start + take))
+                start += take
+            self._blocks[name] = (start, limit)
+            return ids
+
+    def reset(self):
+        """Forget cached blocks (e.g. after switching databases)"""
+        with self._lock:
+            self._blocks.clear()
+
+    def next_id_in(self, cursor, name):
+        """One new ID reserved through the caller's cursor, inside its transaction.
+
+        For code that already holds locks: reserving a block on another
+        connection would wait for them. The ID is not cached, so if the
+        caller rolls back the reservation simply never happened.
+        """
+        if name not in SEQUENCES:
+            raise KeyError(f"Unknown ID sequence '{name}'")
+        while True:
+            try:
+                return self._bump(cursor, name, 1)
+            except db_errors() as db_error:
+                if not is_duplicate_key(db_error):
+                    raise
+                # Another process seeded the sequence first; bump its row instead
+
+    def _reserve(self, name, size):
+        """Reserve [start, start + size) in the sequence table"""
+        while True:
+            conn = get_db_connection()
+            cursor = conn.cursor()
+            try:
+                start = self._bump(cursor, name, size)
+                conn.commit()
+                return start, start + size
+            except db_errors() as db_error:
+                conn.rollback()
+                if not is_duplicate_key(db_error):
+                    raise
+                # Another process seeded the sequence first; bump its row instead
+            finally:
+                cursor.close()
+                conn.close()
+
+    def _bump(self, cursor, name, size):
+        """Advance a sequence by ``size`` on the cursor; returns the first reserved value"""
+        # The UPDATE takes the row lock, so the read below sees our own bump
+        cursor.execute(
+            "UPDATE id_sequences SET next_value = next_value + %s WHERE name = %s",
+            (size, name)
+        )
+        if cursor.rowcount == 0:
+            start = self._seed_value(cursor, name)
+            cursor.execute(
+                "INSERT INTO id_sequences (name, next_value) VALUES (%s, %s)",
+                (name, start + size)
+            )
+            return start
+        cursor.execute("SELECT next_value FROM id_sequences WHERE name = %s", (name,))
+        return cursor.fetchone()[0] - size
+
+    def _seed_value(self, cursor, name):
+        """First ID of a new sequence: one past the highest existing key"""
+        table, column = SEQUENCES[name]
+        cursor.execute(f"SELECT MAX({column}) FROM {table}")
+        return (cursor.fetchone()[0] or 0) + 1
+
+    def create_table(self, cursor):
+        """Schema hook: create the sequence table"""
+        cursor.execute(
+            """CREATE TABLE IF NOT EXISTS id_sequences (
+                name VARCHAR(64) PRIMARY KEY,
+                next_value BIGINT NOT NULL
+            )"""
+        )
+
+
+id_allocator = IdAllocator()
+register_schema(id_allocator.create_table)
+
+
+def next_id(name):
+    """Get the next primary key for a table's sequence"""
+    return id_allocator.next_id(name)
+
+
+def next_id_in(cursor, name):
+    """Get one primary key inside the caller's transaction (see IdAllocator.next_id_in)"""
+    return id_allocator.next_id_in(cursor, name)
+
+
+def allocate_ids(name, count):
+    """Get a list of ``count`` primary keys for a table's sequence"""
+    return id_allocator.allocate(name, count)
@@ -0,0 +1,69 @@
+# spreadsheet.py
+import csv
+import os
+
+
+class ImportFileError(Exception):
+    """The file as a whole cannot be imported (type, header, unreadable)"""
+
+
+def normalize_header(name):
+    """'Batch Number' / 'batch-number' -> 'batch_number'"""
+    return "_".join(str(name or "").strip().lower().replace("-", " ").split())
+
+
+def _csv_rows(path):
+    with open(path, newline="", encoding="utf-8-sig") as handle:
+        yield from csv.reader(handle)
+
+
+def _xlsx_rows(path):
+    try:
+        import openpyxl
+    except ImportError:
+        raise ImportFileError("Reading .xlsx files needs the openpyxl package (pip install openpyxl)")
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        yield from workbook.active.iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+
+def iter_records(path, required, aliases=None):
+    """Yield (line number, {column: value}) for each data row of a CSV or .xlsx file.
+
+    Rows are read one at a time. Headers are normalized and mapped through
+    ``aliases`` ({alternative name: column}); ImportFileError is raised
+    before the first row if any ``required`` column is missing. Blank rows
+    are skipped, and text cells are stripped (empty text becomes None).
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".csv":
+        rows = _csv_rows(path)
+    elif extension in (".xlsx", ".xlsm"):
+        rows = _xlsx_rows(path)
+    else:
+        raise ImportFileError(f"Unsupported file type '{extension}' (use .csv or .xlsx)")
+
+    aliases = aliases or {}
+    try:
+        header = next(rows, None)
+        if header is None:
+            raise ImportFileError("The file is empty")
+        columns = [aliases.get(normalize_header(name), normalize_header(name)) for name in header]
+        missing = [column for column in required if column not in columns]
+        if missing:
+            raise ImportFileError(f"Missing column(s): {', '.join(missing)}")
+
+        for line, row in enumerate(rows, start=2):
+            record = {}
+            for column, value in zip(columns, row):
+                if isinstance(value, str):
+                    value = value.strip() or None
+                record[column] = value
+            if any(value is not None for value in record.values()):
+                yield line, record
+    except (OSError, UnicodeDecodeError, csv.Error) as e:
+        raise ImportFileError(f"Could not read {os.path.basename(path)}: {e}")
+    finally:
+        rows.close()
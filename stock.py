@@ -0,0 +1,310 @@
+import bisect
+import sys
+import threading
+import time
+
+from database import (get_db_connection, db_errors, is_duplicate_key, register_schema, after_commit,
+                      retry_on_deadlock)
+from prepared import statements
+
+# How long (seconds) the in-process mirror is trusted before it is re-read
+MIRROR_REFRESH_INTERVAL = 2.0
+
+ADD_TO_STOCK = statements.register(
+    "add_to_stock", "UPDATE stock_summary SET total_quantity = total_quantity + %s WHERE medicine_id = %s")
+BATCH_STOCK_TOTAL = statements.register(
+    "batch_stock_total", "SELECT COALESCE(SUM(current_quantity), 0) FROM inventory WHERE medicine_id = %s")
+
+
+def _scalar(row):
+    if row is None:
+        return None
+    return next(iter(row.values())) if isinstance(row, dict) else row[0]
+
+
+class StockLevels:
+    """Per-medicine stock totals kept in step with the INVENTORY batches.
+
+    ``stock_summary`` holds one row per medicine with the sum of its batches'
+    current_quantity. Every inventory mutation calls record() on its own
+    cursor, so the summary changes in the same transaction as the batches.
+    Reads come from an in-process mirror of that (small) table. Local writes
+    are folded into the mirror as they commit; it is re-read once
+    MIRROR_REFRESH_INTERVAL has passed, to pick up other terminals' sales.
+    """
+
+    def __init__(self, refresh_interval=MIRROR_REFRESH_INTERVAL):
+        self.refresh_interval = refresh_interval
+        self._totals = {}
+        self._by_level = []         # sorted (total, medicine_id) pairs, for below()
+        self._loaded_at = None      # None = mirror must be (re)loaded
+        self._generation = 0        # bumped by invalidate() and by each applied local write
+        self._lock = threading.RLock()          # serializes reloads (held while reading the table)
+        self._state_lock = threading.Lock()     # guards the mirror state; never held for I/O
+        self._listeners = []
+
+    # ---------- reads ----------
+
+    def get(self, medicine_id):
+        """Units in stock for one medicine (0 if it has no batches)"""
+        self._ensure_fresh()
+        return self._totals.get(medicine_id, 0)
+
+    def totals(self):
+        """{medicine_id: units in stock} for every medicine with batches"""
+        self._ensure_fresh()
+        with self._state_lock:
+            return dict(self._totals)
+
+    def refresh(self):
+        """Re-read the mirror now if it is due (local write or refresh interval)"""
+        self._ensure_fresh()
+
+    def below(self, threshold):
+        """(medicine_id, total) pairs under the threshold, lowest first"""
+        self._ensure_fresh()
+        with self._state_lock:
+            end = bisect.bisect_left(self._by_level, (threshold,))
+            return [(medicine_id, total) for total, medicine_id in self._by_level[:end]]
+
+    # ---------- writes ----------
+
+    def record(self, cursor, deltas):
+        """Apply {medicine_id: change in units} to the summary table.
+
+        Call after the batch rows have been changed, on the same cursor and
+        before commit. A medicine without a summary row yet is seeded from
+        its batches, which already include this change. The mirror picks the
+        change up when the transaction commits.
+        """
+        changes = {}
+        seeded = {}
+        for medicine_id in sorted(deltas):
+            delta = deltas[medicine_id]
+            if not delta:
+                continue
+            if statements.run(cursor, ADD_TO_STOCK, (delta, medicine_id)) == 0:
+                total = self._seed(cursor, medicine_id, delta)
+                if total is not None:
+                    seeded[medicine_id] = total
+                    continue
+            changes[medicine_id] = delta
+        if changes or seeded:
+            after_commit(cursor, lambda: self._apply(changes, seeded))
+
+    def forget(self, cursor, medicine_id):
+        """Drop the summary row of a deleted medicine"""
+        cursor.execute("DELETE FROM stock_summary WHERE medicine_id = %s", (medicine_id,))
+        after_commit(cursor, lambda: self._apply({}, {medicine_id: None}))
+
+    def invalidate(self):
+        """Make the next read reload the mirror.
+
+        Must not wait for a reload in progress: the caller may hold a pooled
+        connection or locks that the reload is waiting for.
+        """
+        with self._state_lock:
+            self._loaded_at = None
+            self._generation += 1
+
+    def subscribe(self, listener):
+        """Keep a derived structure in step with the stock totals.
+
+        ``listener.stock_changed(medicine_ids)`` is called after each mirror
+        reload with the medicines whose total differs from the previous load
+        (every medicine on the first load), whichever terminal changed them,
+        and after each committed local write with the medicines it changed.
+        """
+        with self._lock:
+            self._listeners.append(listener)
+            if self._loaded_at is not None:
+                listener.stock_changed(set(self._totals))
+
+    # ---------- reconciliation ----------
+
+    @retry_on_deadlock
+    def reconcile(self, fix=False):
+        """Compare the summary with the raw batches.
+
+        Returns a list of {"medicine_id", "recorded", "actual"} mismatches;
+        with ``fix`` the summary rows are rewritten to the actual totals.
+        """
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        try:
+            if fix:
+                # Lock the batches, then the summary rows, in the order every
+                # writer takes them, so no sale lands between the sums below
+                # and the rewrite (on SQLite: the database write lock)
+                cursor.execute(
+                    """SELECT inventory_id FROM inventory
+                    ORDER BY medicine_id, expiry_date, date_added, inventory_id FOR UPDATE"""
+                )
+                cursor.fetchall()
+                cursor.execute("SELECT medicine_id FROM stock_summary ORDER BY medicine_id FOR UPDATE")
+                cursor.fetchall()
+            cursor.execute(
+                "SELECT medicine_id, SUM(current_quantity) FROM inventory GROUP BY medicine_id"
+            )
+            actual = {medicine_id: int(total or 0) for medicine_id, total in cursor.fetchall()}
+            cursor.execute("SELECT medicine_id, total_quantity FROM stock_summary")
+            recorded = {medicine_id: total for medicine_id, total in cursor.fetchall()}
+
+            mismatches = []
+            for medicine_id in sorted(set(actual) | set(recorded)):
+                if actual.get(medicine_id) != recorded.get(medicine_id):
+                    mismatches.append({
+                        "medicine_id": medicine_id,
+                        "recorded": recorded.get(medicine_id),
+                        "actual": actual.get(medicine_id)
+                    })
+
+            if fix and mismatches:
+                for item in mismatches:
+                    # The summary rows are locked, so "recorded" says whether one exists
+                    if item["actual"] is None:
+                        cursor.execute("DELETE FROM stock_summary WHERE medicine_id = %s", (item["medicine_id"],))
+                    elif item["recorded"] is None:
+                        cursor.execute(
+                            "INSERT INTO stock_summary (medicine_id, total_quantity) VALUES (%s, %s)",
+                            (item["medicine_id"], item["actual"])
+                        )
+                    else:
+                        cursor.execute(
+                            "UPDATE stock_summary SET total_quantity = %s WHERE medicine_id = %s",
+                            (item["actual"], item["medicine_id"])
+                        )
+                conn.commit()
+                self.invalidate()
+            return mismatches
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+            conn.close()
+
+    # ---------- internals ----------
+
+    def _seed(self, cursor, medicine_id, delta):
+        """Create a missing summary row from the batches; returns its total.
+
+        Returns None if another terminal created the row in the meantime: its
+        total was summed without this (uncommitted) change, so ``delta`` is
+        added to it instead.
+        """
+        total = int(statements.fetchone(cursor, BATCH_STOCK_TOTAL, (medicine_id,))[0] or 0)
+        try:
+            cursor.execute(
+                "INSERT INTO stock_summary (medicine_id, total_quantity) VALUES (%s, %s)",
+                (medicine_id, total)
+            )
+            return total
+        except db_errors() as db_error:
+            if not is_duplicate_key(db_error):
+                raise
+            statements.run(cursor, ADD_TO_STOCK, (delta, medicine_id))
+            return None
+
+    def _apply(self, deltas, totals):
+        """Fold a committed local write into the mirror (runs from after_commit).
+
+        ``deltas`` maps medicine IDs to changes in units, ``totals`` to new
+        totals (None for a dropped row). No I/O and no reload lock: the
+        committing thread still holds its connection.
+        """
+        with self._state_lock:
+            for medicine_id, delta in deltas.items():
+                if medicine_id not in self._totals:
+                    # Row created by another terminal since the last load
+                    self._loaded_at = None
+                    continue
+                self._set_total(medicine_id, self._totals[medicine_id] + delta)
+            for medicine_id, total in totals.items():
+                self._set_total(medicine_id, total)
+            # A reload in flight may have read the table before this commit
+            self._generation += 1
+        changed = set(deltas) | set(totals)
+        for listener in self._listeners:
+            listener.stock_changed(changed)
+
+    def _set_total(self, medicine_id, total):
+        # Caller holds _state_lock
+        old = self._totals.pop(medicine_id, None)
+        if old is not None:
+            index = bisect.bisect_left(self._by_level, (old, medicine_id))
+            if index < len(self._by_level) and self._by_level[index] == (old, medicine_id):
+                del self._by_level[index]
+        if total is not None:
+            self._totals[medicine_id] = total
+            bisect.insort(self._by_level, (total, medicine_id))
+
+    def _ensure_fresh(self):
+        now = time.monotonic()
+        loaded_at = self._loaded_at
+        if loaded_at is not None and now - loaded_at < self.refresh_interval:
+            return
+        with self._lock:
+            if self._loaded_at is not None and now - self._loaded_at < self.refresh_interval:
+                return
+            with self._state_lock:
+                generation = self._generation
+            conn = get_db_connection()
+            cursor = conn.cursor()
+            try:
+                cursor.execute("SELECT medicine_id, total_quantity FROM stock_summary")
+                totals = {medicine_id: total for medicine_id, total in cursor.fetchall()}
+            finally:
+                cursor.close()
+                conn.close()
+            by_level = sorted((total, medicine_id) for medicine_id, total in totals.items())
+            with self._state_lock:
+                previous = self._totals
+                self._totals = totals
+                self._by_level = by_level
+                # Invalidated or written to while reading: keep the totals but reload next time
+                if self._generation == generation:
+                    self._loaded_at = now
+            if self._listeners:
+                changed = {medicine_id for medicine_id in set(previous) | set(totals)
+                           if previous.get(medicine_id) != totals.get(medicine_id)}
+                if changed:
+                    for listener in self._listeners:
+                        listener.stock_changed(changed)
+
+    def create_table(self, cursor):
+        """Schema hook: create the summary table, building it from the batches if empty"""
+        cursor.execute(
+            """CREATE TABLE IF NOT EXISTS stock_summary (
+                medicine_id INT PRIMARY KEY,
+                total_quantity BIGINT NOT NULL
+            )"""
+        )
+        cursor.execute("SELECT COUNT(*) FROM stock_summary")
+        if not _scalar(cursor.fetchone()):
+            cursor.execute(
+                """INSERT INTO stock_summary (medicine_id, total_quantity)
+                SELECT medicine_id, SUM(current_quantity) FROM inventory GROUP BY medicine_id"""
+            )
+
+
+stock_levels = StockLevels()
+register_schema(stock_levels.create_table)
+
+
+def main(argv=None):
+    """Command-line reconciliation: python stock.py [--fix]"""
+    fix = "--fix" in (argv if argv is not None else sys.argv[1:])
+    mismatches = stock_levels.reconcile(fix=fix)
+    if not mismatches:
+        print("Stock summary matches the inventory batches.")
+        return 0
+    print(f"{'Medicine ID':<14}{'Recorded':<12}{'Actual':<12}")
+    for item in mismatches:
+        print(f"{item['medicine_id']:<14}{str(item['recorded']):<12}{str(item['actual']):<12}")
+    print(f"{len(mismatches)} mismatch(es) {'fixed' if fix else 'found (run with --fix to repair)'}.")
+    return 0 if fix else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
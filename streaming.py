@@ -0,0 +1,77 @@
+# streaming.py
+import copy
+
+from database import get_db_connection
+
+STREAM_CHUNK_SIZE = 500     # rows fetched from the server per round trip
+
+
+def stream_query(query, params=(), chunk_size=STREAM_CHUNK_SIZE):
+    """Yield the rows of a query as dicts without buffering the result set.
+
+    Rows come from an unbuffered cursor ``chunk_size`` at a time, so memory
+    stays flat and the first rows are available as soon as the server sends
+    them. The connection stays borrowed while the generator is alive; one
+    abandoned half-way is discarded rather than drained, because skipping
+    the rest of an unbuffered result means reading it all.
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor(dictionary=True, buffered=False)
+    finished = False
+    try:
+        cursor.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield from rows
+        finished = True
+    finally:
+        if finished:
+            cursor.close()
+            conn.close()
+        else:
+            conn.discard()
+
+
+class ReportStream:
+    """Report rows as a one-pass iterable with running summary statistics.
+
+    ``prepare(row)`` fills in derived fields and ``accumulate(summary, row)``
+    folds each row into ``summary`` as it is yielded, so the summary is
+    complete once iteration finishes without the rows ever being kept.
+    """
+
+    def __init__(self, query, params=(), prepare=None, accumulate=None, summary=None,
+                 chunk_size=STREAM_CHUNK_SIZE):
+        self.query = query
+        self.params = params
+        self.prepare = prepare
+        self.accumulate = accumulate
+        self._initial = copy.deepcopy(summary or {})
+        self.summary = copy.deepcopy(self._initial)
+        self.chunk_size = chunk_size
+        self.finished = False
+
+    def __iter__(self):
+        self.summary = copy.deepcopy(self._initial)
+        self.finished = False
+        for row in stream_query(self.query, self.params, self.chunk_size):
+            if self.prepare:
+                self.prepare(row)
+            if self.accumulate:
+                self.accumulate(self.summary, row)
+            yield row
+        self.finished = True
+
+
+def count_batch(summary, row):
+    """Summary of batch-level reports: batches, units and units per location"""
+    summary["batches"] += 1
+    summary["total_quantity"] += row["current_quantity"] or 0
+    location = row.get("location")
+    summary["by_location"][location] = summary["by_location"].get(location, 0) + (row["current_quantity"] or 0)
+
+
+def batch_summary():
+    return {"batches": 0, "total_quantity": 0, "by_location": {}}
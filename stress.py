@@ -0,0 +1,332 @@
+# stress.py
+# Multi-threaded companion to the unit tests under tests/: simulated
+# terminals race against a real database, and stock must stay non-negative
+# and conserved throughout.
+import argparse
+import contextlib
+import os
+import random
+import sys
+import threading
+import time
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+from database import transaction, retry_counts, StaleRowError
+from catalog import catalog
+from search import search_index
+from sequences import allocate_ids
+from stock import stock_levels
+from inventory import PharmacyInventory
+from prescriptions import PrescriptionManager, CheckoutError
+from datagen import add_database_arguments, configure_database
+
+DEFAULT_TERMINALS = 8
+DEFAULT_OPERATIONS = 100    # per terminal
+MONITOR_INTERVAL = 0.01     # seconds between stock samples
+
+# Relative weights of the simulated counter operations
+OPERATION_MIX = (
+    ("checkout", 6),
+    ("edit_line", 2),
+    ("delete_prescription", 1),
+    ("transfer", 1),
+    ("recount", 1),
+)
+
+
+class ConcurrencyStressTest:
+    """N simulated terminals selling the same few medicines at once.
+
+    Each run creates its own medicines, one supplier and a handful of small
+    batches, with far less stock than the terminals will try to sell, so
+    they fight over the last units. The terminals check out baskets, edit
+    and delete their prescriptions, move stock between shelves and recount
+    batches with a stale-read guard. A monitor samples the batches while
+    they run, and afterwards the invariants are checked:
+
+    - no batch and no stock summary row ever goes below zero;
+    - stock is conserved: what is on the shelves equals the initial stock
+      minus what the remaining prescriptions hold (a lost update shows up
+      here);
+    - the stock summary matches the batches and every prescription's total
+      matches its lines.
+    """
+
+    def __init__(self, terminals=DEFAULT_TERMINALS, operations=DEFAULT_OPERATIONS, medicines=3,
+                 batches=4, units_per_batch=25, seed=1):
+        self.terminals = terminals
+        self.operations = operations
+        self.medicines = medicines
+        self.batches = batches
+        self.units_per_batch = units_per_batch
+        self.seed = seed
+        self.inventory = PharmacyInventory()
+        self.prescriptions = PrescriptionManager()
+        self._lock = threading.Lock()
+        self._counts = {}
+        self._errors = []
+        self._lowest = {"inventory": 0, "stock_summary": 0}
+
+    def run(self):
+        """Set up, run the terminals and check; returns the report dict"""
+        self._setup()
+        retries_before = retry_counts()
+        stop = threading.Event()
+        monitor = threading.Thread(target=self._monitor, args=(stop,), daemon=True)
+        workers = [threading.Thread(target=self._terminal, args=(n,)) for n in range(self.terminals)]
+
+        start = time.perf_counter()
+        with open(os.devnull, "w") as sink, contextlib.redirect_stdout(sink):
+            monitor.start()
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            stop.set()
+            monitor.join()
+        elapsed = time.perf_counter() - start
+
+        retries = retry_counts()
+        violations = self._check()
+        if self._lowest["inventory"] < 0 or self._lowest["stock_summary"] < 0:
+            violations.insert(0, f"stock went negative while running: lowest batch "
+                                 f"{self._lowest['inventory']}, lowest summary {self._lowest['stock_summary']}")
+        return {
+            "terminals": self.terminals,
+            "operations": self.terminals * self.operations,
+            "seconds": round(elapsed, 2),
+            "outcomes": dict(sorted(self._counts.items())),
+            "deadlock_retries": retries.get("retried", 0) - retries_before.get("retried", 0),
+            "gave_up": retries.get("gave_up", 0) - retries_before.get("gave_up", 0),
+            "errors": self._errors[:10],
+            "violations": violations,
+        }
+
+    # ---------- setup ----------
+
+    def _setup(self):
+        tag = datetime.now().strftime("%Y%m%d%H%M%S%f")
+        medicine_ids = allocate_ids("medicines", self.medicines)
+        supplier_id = allocate_ids("suppliers", 1)[0]
+        batch_ids = allocate_ids("inventory", self.medicines * self.batches)
+        with transaction() as (conn, cursor):
+            cursor.execute(
+                "INSERT INTO suppliers (supplier_id, name) VALUES (%s, %s)", (supplier_id, f"Stress {tag}")
+            )
+            for n, medicine_id in enumerate(medicine_ids):
+                cursor.execute(
+                    """INSERT INTO medicines (medicine_id, name, manufacturer, price, category, dosage)
+                       VALUES (%s, %s, %s, %s, %s, %s)""",
+                    (medicine_id, f"Stress {tag} {n + 1}", "Stress", Decimal("1.50"), "Painkiller", "1 tab")
+                )
+            batch_ids = iter(batch_ids)
+            for medicine_id in medicine_ids:
+                for n in range(self.batches):
+                    cursor.execute(
+                        """INSERT INTO inventory (inventory_id, medicine_id, supplier_id, quantity_added,
+                               date_added, batch_number, expiry_date, current_quantity, location)
+                           VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)""",
+                        (next(batch_ids), medicine_id, supplier_id, self.units_per_batch, datetime.now(),
+                         f"ST-{medicine_id}-{n}", date.today() + timedelta(days=60 + 30 * n),
+                         self.units_per_batch, f"Shelf {n + 1}")
+                    )
+            stock_levels.record(cursor, {medicine_id: self.units_per_batch * self.batches
+                                         for medicine_id in medicine_ids})
+            catalog.bump_version(cursor)
+            search_index.bump_batches(cursor)
+        catalog.invalidate()
+        search_index.invalidate_batches()
+        self.medicine_ids = medicine_ids
+        self.initial_stock = self.units_per_batch * self.batches
+
+    # ---------- terminals ----------
+
+    def _terminal(self, number):
+        rng = random.Random(f"{self.seed}:{number}")
+        names = [name for name, _ in OPERATION_MIX]
+        weights = [weight for _, weight in OPERATION_MIX]
+        mine = []       # prescriptions this terminal created: [id, {medicine_id: qty}]
+        for _ in range(self.operations):
+            name = rng.choices(names, weights)[0]
+            try:
+                outcome = getattr(self, f"_op_{name}")(rng, mine)
+            except StaleRowError:
+                outcome = "conflict"
+            except Exception as e:
+                outcome = "error"
+                with self._lock:
+                    self._errors.append(f"{name}: {type(e).__name__}: {e}")
+            self._count(f"{name}:{outcome}")
+
+    def _op_checkout(self, rng, mine):
+        basket = [(medicine_id, rng.randint(1, 3))
+                  for medicine_id in rng.sample(self.medicine_ids, rng.randint(1, len(self.medicine_ids)))]
+        try:
+            receipt = self.prescriptions.checkout(basket)
+        except CheckoutError:
+            return "out_of_stock"
+        lines = {}
+        for medicine_id, qty in basket:
+            lines[medicine_id] = lines.get(medicine_id, 0) + qty
+        mine.append((receipt.prescription_id, lines))
+        return "ok"
+
+    def _op_edit_line(self, rng, mine):
+        if not mine:
+            return "skipped"
+        prescription_id, lines = rng.choice(mine)
+        medicine_id = rng.choice(list(lines))
+        self.prescriptions.update_prescription_medicine(prescription_id, medicine_id, rng.randint(1, 4))
+        return "ok"
+
+    def _op_delete_prescription(self, rng, mine):
+        if not mine:
+            return "skipped"
+        prescription_id, _ = mine.pop(rng.randrange(len(mine)))
+        self.prescriptions.delete_prescription(prescription_id)
+        return "ok"
+
+    def _op_transfer(self, rng, mine):
+        batch = self._random_batch(rng)
+        result = self.inventory.transfer_inventory(batch[0], f"Counter {rng.randint(1, 3)}", rng.randint(1, 2))
+        return "ok" if result["success"] else "refused"
+
+    def _op_recount(self, rng, mine):
+        # Write back the quantity just read; only safe because a batch that
+        # changed in between is refused by its row version
+        inventory_id, quantity, row_version = self._random_batch(rng)
+        time.sleep(rng.random() * 0.005)
+        result = self.inventory.update_inventory_quantity(inventory_id, quantity, row_version)
+        if result["success"]:
+            return "ok"
+        return "conflict" if result.get("conflict") else "refused"
+
+    def _random_batch(self, rng):
+        with transaction() as (conn, cursor):
+            placeholders = ", ".join(["%s"] * len(self.medicine_ids))
+            cursor.execute(
+                f"""SELECT inventory_id, current_quantity, row_version FROM inventory
+                    WHERE medicine_id IN ({placeholders}) ORDER BY inventory_id""",
+                self.medicine_ids
+            )
+            return tuple(rng.choice(cursor.fetchall()))
+
+    # ---------- checking ----------
+
+    def _monitor(self, stop):
+        placeholders = ", ".join(["%s"] * len(self.medicine_ids))
+        while not stop.is_set():
+            try:
+                with transaction() as (conn, cursor):
+                    for table, column in (("inventory", "current_quantity"), ("stock_summary", "total_quantity")):
+                        cursor.execute(
+                            f"SELECT MIN({column}) FROM {table} WHERE medicine_id IN ({placeholders})",
+                            self.medicine_ids
+                        )
+                        lowest = cursor.fetchone()[0]
+                        if lowest is not None and lowest < self._lowest[table]:
+                            self._lowest[table] = lowest
+            except Exception as e:
+                with self._lock:
+                    self._errors.append(f"monitor: {type(e).__name__}: {e}")
+            stop.wait(MONITOR_INTERVAL)
+
+    def _check(self):
+        violations = []
+        placeholders = ", ".join(["%s"] * len(self.medicine_ids))
+        with transaction() as (conn, cursor):
+            cursor.execute(
+                f"""SELECT medicine_id, SUM(current_quantity), MIN(current_quantity) FROM inventory
+                    WHERE medicine_id IN ({placeholders}) GROUP BY medicine_id""",
+                self.medicine_ids
+            )
+            shelves = {medicine_id: (int(total), int(lowest)) for medicine_id, total, lowest in cursor.fetchall()}
+            cursor.execute(
+                f"""SELECT medicine_id, SUM(quantity_bought) FROM prescription_medicines
+                    WHERE medicine_id IN ({placeholders}) GROUP BY medicine_id""",
+                self.medicine_ids
+            )
+            sold = {medicine_id: int(total) for medicine_id, total in cursor.fetchall()}
+            cursor.execute(
+                f"""SELECT p.prescription_id, p.total_amount, SUM(pm.total_price)
+                    FROM prescriptions p
+                    JOIN prescription_medicines pm ON pm.prescription_id = p.prescription_id
+                    WHERE pm.medicine_id IN ({placeholders})
+                    GROUP BY p.prescription_id, p.total_amount""",
+                self.medicine_ids
+            )
+            totals = cursor.fetchall()
+            # Units on each line against the batches recorded for it, orphaned records included
+            cursor.execute(
+                f"""SELECT pb.prescription_id, pb.medicine_id, MAX(pm.quantity_bought), SUM(pb.quantity)
+                    FROM prescription_batches pb
+                    LEFT JOIN prescription_medicines pm
+                        ON pm.prescription_id = pb.prescription_id AND pm.medicine_id = pb.medicine_id
+                    WHERE pb.medicine_id IN ({placeholders})
+                    GROUP BY pb.prescription_id, pb.medicine_id
+                    UNION ALL
+                    SELECT pm.prescription_id, pm.medicine_id, pm.quantity_bought, 0
+                    FROM prescription_medicines pm
+                    WHERE pm.medicine_id IN ({placeholders}) AND NOT EXISTS (
+                        SELECT 1 FROM prescription_batches pb
+                        WHERE pb.prescription_id = pm.prescription_id AND pb.medicine_id = pm.medicine_id)""",
+                self.medicine_ids * 2
+            )
+            recorded = cursor.fetchall()
+
+        for medicine_id in self.medicine_ids:
+            on_shelves, lowest = shelves.get(medicine_id, (0, 0))
+            if lowest < 0:
+                violations.append(f"medicine {medicine_id}: a batch holds {lowest} units")
+            expected = self.initial_stock - sold.get(medicine_id, 0)
+            if on_shelves != expected:
+                violations.append(f"medicine {medicine_id}: {on_shelves} units on the shelves, "
+                                  f"expected {expected} ({sold.get(medicine_id, 0)} sold)")
+        for prescription_id, total_amount, line_total in totals:
+            if Decimal(str(total_amount)) != Decimal(str(line_total)):
+                violations.append(f"prescription {prescription_id}: total {total_amount}, lines add up to {line_total}")
+        for prescription_id, medicine_id, bought, dispensed in recorded:
+            if bought is None or int(bought) != int(dispensed):
+                violations.append(f"prescription {prescription_id}, medicine {medicine_id}: "
+                                  f"{bought or 0} bought, {dispensed} recorded against batches")
+        for mismatch in stock_levels.reconcile():
+            if mismatch["medicine_id"] in self.medicine_ids:
+                violations.append(f"stock summary for medicine {mismatch['medicine_id']}: "
+                                  f"{mismatch['recorded']} recorded, {mismatch['actual']} in batches")
+        return violations
+
+    def _count(self, key):
+        with self._lock:
+            self._counts[key] = self._counts.get(key, 0) + 1
+
+
+def main(argv=None):
+    """python stress.py [--sqlite PATH] [--terminals N] [--operations N] ...; exits 1 on a violation"""
+    parser = argparse.ArgumentParser(description="Concurrent dispensing stress check")
+    add_database_arguments(parser)
+    parser.add_argument("--terminals", type=int, default=DEFAULT_TERMINALS)
+    parser.add_argument("--operations", type=int, default=DEFAULT_OPERATIONS, help="per terminal")
+    parser.add_argument("--medicines", type=int, default=3)
+    parser.add_argument("--batches", type=int, default=4, help="per medicine")
+    parser.add_argument("--units", type=int, default=25, help="per batch")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+    configure_database(args)
+
+    report = ConcurrencyStressTest(args.terminals, args.operations, args.medicines, args.batches,
+                                   args.units, args.seed).run()
+    print(f"{report['operations']} operations on {report['terminals']} terminals in {report['seconds']}s")
+    for key, count in report["outcomes"].items():
+        print(f"  {key:<36}{count:>6}")
+    print(f"Deadlock/lock-timeout retries: {report['deadlock_retries']} (gave up: {report['gave_up']})")
+    for error in report["errors"]:
+        print(f"ERROR      {error}")
+    for violation in report["violations"]:
+        print(f"VIOLATION  {violation}")
+    print("FAILED" if report["violations"] else "OK: stock never went negative and was conserved")
+    return 1 if report["violations"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
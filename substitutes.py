@@ -0,0 +1,187 @@
+# substitutes.py
+import threading
+
+from database import get_db_connection, as_date
+from catalog import catalog
+from stock import stock_levels
+from predictor import MedicineEffectivenessPredictor
+
+DEFAULT_SUGGESTIONS = 5
+EXPIRY_LOOKUP_CHUNK = 500   # medicine IDs per IN query when refreshing expiries
+
+
+def _category_key(category):
+    return (category or "").strip().lower()
+
+
+class SubstituteRecommender:
+    """Suggests in-stock alternatives for a medicine that has run out.
+
+    An in-memory index maps each category to the medicines that currently
+    have stock, with their total units and nearest batch expiry. It is
+    built once, then kept in step incrementally: the stock mirror reports
+    which medicines' totals changed (on this or any other terminal) and the
+    catalog reports edited medicines, and only those entries are re-read
+    on the next request. Suggestions are ranked by the predictor's score
+    for the condition, then price, then nearest expiry.
+    """
+
+    def __init__(self, predictor=None):
+        self.predictor = predictor or MedicineEffectivenessPredictor()
+        self._entries = {}          # medicine_id -> catalog row + "stock", "nearest_expiry"
+        self._by_category = {}      # category key -> set of in-stock medicine IDs
+        self._stale = True          # full rebuild needed
+        self._dirty = set()         # medicine IDs to re-read
+        self._lock = threading.Lock()           # guards the pending changes and the index
+        self._refresh_lock = threading.Lock()   # one refresh at a time
+        catalog.subscribe(self)
+        stock_levels.subscribe(self)
+
+    def recommend(self, medicine, condition=None, limit=DEFAULT_SUGGESTIONS):
+        """In-stock alternatives for a medicine (name or ID), best first.
+
+        With a condition, medicines from every category the rules consider
+        relevant to it are candidates; without one (or for a condition the
+        rules do not know) only the medicine's own category is. Each result
+        is a catalog row plus "stock", "nearest_expiry" and "effectiveness".
+        """
+        if isinstance(medicine, int):
+            original = catalog.get_by_id(medicine)
+        else:
+            original = catalog.get_by_name(medicine)
+        if original is None:
+            return []
+
+        tables = self.predictor.tables
+        categories = tables.relevant_categories(condition) if condition else ()
+        if not categories:
+            categories = (_category_key(original['category']),)
+
+        self.refresh()
+        with self._lock:
+            candidates = [dict(self._entries[medicine_id])
+                          for category in categories
+                          for medicine_id in self._by_category.get(category, ())
+                          if medicine_id != original['medicine_id']]
+
+        for candidate in candidates:
+            candidate['effectiveness'] = tables.score(candidate['category'], condition)
+        candidates.sort(key=lambda row: (
+            -row['effectiveness'],
+            row['price'],
+            row['nearest_expiry'] is None,      # no expiry recorded: after dated stock
+            row['nearest_expiry'] or "",
+            row['medicine_id']
+        ))
+        return candidates[:limit]
+
+    def refresh(self):
+        """Apply the stock and catalog changes seen since the last request"""
+        catalog.refresh()
+        stock_levels.refresh()
+        with self._refresh_lock:
+            with self._lock:
+                stale, dirty = self._stale, self._dirty
+                self._stale, self._dirty = False, set()
+            if not stale and not dirty:
+                return
+            try:
+                if stale:
+                    self._rebuild()
+                else:
+                    self._update(dirty)
+            except Exception:
+                self.invalidate()
+                raise
+
+    def invalidate(self):
+        """Rebuild the whole index on the next request"""
+        with self._lock:
+            self._stale = True
+
+    # ---------- listeners ----------
+
+    def catalog_reloaded(self, rows):
+        self.invalidate()
+
+    def catalog_changed(self, medicine_id, row):
+        with self._lock:
+            self._dirty.add(medicine_id)
+
+    def stock_changed(self, medicine_ids):
+        with self._lock:
+            self._dirty.update(medicine_ids)
+
+    # ---------- internals ----------
+
+    def _rebuild(self):
+        rows = catalog.all()
+        totals = stock_levels.totals()
+        expiries = self._nearest_expiries()
+        entries = {}
+        by_category = {}
+        for row in rows:
+            entry = self._entry(row, totals.get(row['medicine_id'], 0), expiries)
+            if entry:
+                entries[row['medicine_id']] = entry
+                by_category.setdefault(_category_key(row['category']), set()).add(row['medicine_id'])
+        with self._lock:
+            self._entries = entries
+            self._by_category = by_category
+
+    def _update(self, medicine_ids):
+        medicine_ids = sorted(medicine_ids)
+        rows = {medicine_id: catalog.get_by_id(medicine_id) for medicine_id in medicine_ids}
+        expiries = self._nearest_expiries(medicine_ids)
+        with self._lock:
+            for medicine_id in medicine_ids:
+                self._remove(medicine_id)
+                row = rows[medicine_id]
+                entry = row and self._entry(row, stock_levels.get(medicine_id), expiries)
+                if entry:
+                    self._entries[medicine_id] = entry
+                    self._by_category.setdefault(_category_key(row['category']), set()).add(medicine_id)
+
+    def _remove(self, medicine_id):
+        entry = self._entries.pop(medicine_id, None)
+        if entry:
+            members = self._by_category.get(_category_key(entry['category']))
+            if members:
+                members.discard(medicine_id)
+                if not members:
+                    del self._by_category[_category_key(entry['category'])]
+
+    @staticmethod
+    def _entry(row, stock, expiries):
+        if stock <= 0:
+            return None
+        entry = dict(row)
+        entry['stock'] = stock
+        entry['nearest_expiry'] = expiries.get(row['medicine_id'])
+        return entry
+
+    @staticmethod
+    def _nearest_expiries(medicine_ids=None):
+        """{medicine_id: earliest expiry among batches with stock}; all medicines by default"""
+        query = "SELECT medicine_id, MIN(expiry_date) FROM inventory WHERE current_quantity > 0"
+        if medicine_ids is None:
+            chunks = [()]
+        else:
+            chunks = [medicine_ids[start:start + EXPIRY_LOOKUP_CHUNK]
+                      for start in range(0, len(medicine_ids), EXPIRY_LOOKUP_CHUNK)]
+        expiries = {}
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        try:
+            for chunk in chunks:
+                condition = f" AND medicine_id IN ({', '.join(['%s'] * len(chunk))})" if chunk else ""
+                cursor.execute(f"{query}{condition} GROUP BY medicine_id", tuple(chunk))
+                # MIN() of a DATE comes back as text on SQLite
+                expiries.update((medicine_id, as_date(expiry)) for medicine_id, expiry in cursor.fetchall())
+            return expiries
+        finally:
+            cursor.close()
+            conn.close()
+
+
+substitutes = SubstituteRecommender()
@@ -1,17 +1,13 @@
 from database import get_db_connection
+from datetime import date
 import re
 from medicines import Medicine
+from sequences import next_id
+from paging import fetch_keyset_page
+from streaming import ReportStream, batch_summary, count_batch
 
 class SupplierManager:
-    def __init__(self):
-        self.conn = get_db_connection()
-        self.cursor = self.conn.cursor(dictionary=True)
-
-    def _get_next_supplier_id(self):
-        """Manually get the next available supplier ID"""
-        self.cursor.execute("SELECT MAX(supplier_id) FROM suppliers")
-        result = self.cursor.fetchone()
-        return (result['MAX(supplier_id)'] or 0) + 1
+    """Supplier operations; each call borrows a connection from the pool"""
 
     # Validation helpers
     def _validate_phone(self, phone):
@@ -25,17 +21,27 @@ class SupplierManager:
     # New helper method
     def get_supplier_id_by_email(self, email):
         """Get supplier ID by email"""
+        conn = get_db_connection()
+        cursor = conn.cursor(dictionary=True)
         try:
-            self.cursor.execute("SELECT supplier_id FROM suppliers WHERE email = %s", (email,))
-            result = self.cursor.fetchone()
+            cursor.execute("SELECT supplier_id FROM suppliers WHERE email = %s", (email,))
+            result = cursor.fetchone()
             return result['supplier_id'] if result else None
         except Exception as e:
             print(f"Error getting supplier ID: {str(e)}")
             return None
+        finally:
+            cursor.close()
+            conn.close()
 
     # Core Supplier Functions
     def add_supplier(self, name, phone, email, address):
-        """Add a new supplier with validation and manual ID generation"""
+        """Add a new supplier with validation and an allocated ID"""
+        # Reserve the ID before borrowing a connection: a fresh block is
+        # fetched on a pooled connection of its own
+        supplier_id = next_id("suppliers")
+        conn = get_db_connection()
+        cursor = conn.cursor(dictionary=True)
         try:
             # Validate inputs
             if not self._validate_phone(phone):
@@ -45,29 +51,31 @@ class SupplierManager:
                 return {"success": False, "message": "Invalid email format"}
             
             # Check for duplicate phone or email
-            self.cursor.execute("SELECT supplier_id FROM suppliers WHERE phone = %s OR email = %s", 
+            cursor.execute("SELECT supplier_id FROM suppliers WHERE phone = %s OR email = %s", 
                               (phone, email))
-            if self.cursor.fetchone():
+            if cursor.fetchone():
                 return {"success": False, "message": "Supplier with this phone or email already exists"}
             
-            # Generate new supplier ID
-            supplier_id = self._get_next_supplier_id()
-            
-            # Insert new supplier with manual ID
+            # Insert new supplier with the allocated ID
             query = """
             INSERT INTO suppliers (supplier_id, name, phone, email, address)
             VALUES (%s, %s, %s, %s, %s)
             """
-            self.cursor.execute(query, (supplier_id, name, phone, email, address))
-            self.conn.commit()
+            cursor.execute(query, (supplier_id, name, phone, email, address))
+            conn.commit()
             return {"success": True, "message": "Supplier added successfully", 
                    "supplier_id": supplier_id}
         except Exception as e:
-            self.conn.rollback()
+            conn.rollback()
             return {"success": False, "message": f"Error adding supplier: {str(e)}"}
+        finally:
+            cursor.close()
+            conn.close()
 
     def update_supplier(self, identifier, name=None, phone=None, email=None, address=None):
         """Update supplier information with validation (can use ID or email)"""
+        conn = get_db_connection()
+        cursor = conn.cursor(dictionary=True)
         try:
             # Determine if identifier is ID or email
             if isinstance(identifier, int) or identifier.isdigit():
@@ -118,39 +126,62 @@ class SupplierManager:
                     check_params.append(email)
                 
                 check_query += " OR ".join(conditions) + ")"
-                self.cursor.execute(check_query, check_params)
-                if self.cursor.fetchone():
+                cursor.execute(check_query, check_params)
+                if cursor.fetchone():
                     return {"success": False, "message": "Another supplier with this phone or email already exists"}
             
             # Perform update
             query = f"UPDATE suppliers SET {', '.join(updates)} WHERE supplier_id = %s"
             params.append(supplier_id)
-            self.cursor.execute(query, params)
-            self.conn.commit()
+            cursor.execute(query, params)
+            conn.commit()
             
             return {"success": True, "message": "Supplier updated successfully"}
         except Exception as e:
-            self.conn.rollback()
+            conn.rollback()
             return {"success": False, "message": f"Error updating supplier: {str(e)}"}
+        finally:
+            cursor.close()
+            conn.close()
 
     def get_supplier_by_id_or_email(self, identifier):
         """Get supplier details by ID or email"""
+        conn = get_db_connection()
+        cursor = conn.cursor(dictionary=True)
         try:
             if isinstance(identifier, int) or identifier.isdigit():
                 query = "SELECT * FROM suppliers WHERE supplier_id = %s"
             else:
                 query = "SELECT * FROM suppliers WHERE email = %s"
             
-            self.cursor.execute(query, (identifier,))
-            supplier = self.cursor.fetchone()
+            cursor.execute(query, (identifier,))
+            supplier = cursor.fetchone()
             if not supplier:
                 return {"success": False, "message": "Supplier not found"}
             return {"success": True, "supplier": supplier}
         except Exception as e:
             return {"success": False, "message": f"Error fetching supplier: {str(e)}"}
+        finally:
+            cursor.close()
+            conn.close()
+
+    def search_suppliers(self, search_term, page_size=None, page_token=None):
+        """Search suppliers by name, phone, or email
+
+        With ``page_size`` returns one page as (rows, next_token).
+        """
+        if page_size is not None:
+            search_pattern = f"%{search_term}%"
+            return fetch_keyset_page(
+                "SELECT * FROM suppliers",
+                [("name", "name"), ("supplier_id", "supplier_id")],
+                where=["(name LIKE %s OR phone LIKE %s OR email LIKE %s)"],
+                params=(search_pattern, search_pattern, search_pattern),
+                page_token=page_token, page_size=page_size
+            )
 
-    def search_suppliers(self, search_term):
-        """Search suppliers by name, phone, or email"""
+        conn = get_db_connection()
+        cursor = conn.cursor(dictionary=True)
         try:
             query = """
             SELECT * FROM suppliers 
@@ -158,15 +189,18 @@ class SupplierManager:
             ORDER BY name
             """
             search_pattern = f"%{search_term}%"
-            self.cursor.execute(query, (search_pattern, search_pattern, search_pattern))
-            return self.cursor.fetchall()
+            cursor.execute(query, (search_pattern, search_pattern, search_pattern))
+            return cursor.fetchall()
         except Exception as e:
             return {"error": f"Error searching suppliers: {str(e)}"}
-
-    
+        finally:
+            cursor.close()
+            conn.close()
 
     def get_top_suppliers(self, limit=5):
         """Get top suppliers by inventory volume"""
+        conn = get_db_connection()
+        cursor = conn.cursor(dictionary=True)
         try:
             query = """
             SELECT 
@@ -180,8 +214,8 @@ class SupplierManager:
             ORDER BY total_quantity DESC
             LIMIT %s
             """
-            self.cursor.execute(query, (limit,))
-            suppliers = self.cursor.fetchall()
+            cursor.execute(query, (limit,))
+            suppliers = cursor.fetchall()
             
             # Convert None to 0 for suppliers with no inventory
             for supplier in suppliers:
@@ -193,16 +227,32 @@ class SupplierManager:
             return suppliers
         except Exception as e:
             return {"error": f"Error fetching top suppliers: {str(e)}"}
+        finally:
+            cursor.close()
+            conn.close()
+
+    def stream_supplier_inventory(self, supplier_id):
+        """Streaming get_supplier_inventory(): a ReportStream with a batch summary"""
+        today = date.today()
 
-    def __del__(self):
-        """Clean up database connection"""
-        if hasattr(self, 'conn') and self.conn.is_connected():
-            self.cursor.close()
-            self.conn.close()
+        def prepare(item):
+            expiry = item['expiry_date']
+            item['days_until_expiry'] = (expiry - today).days if expiry else None
 
+        return ReportStream(
+            """SELECT i.inventory_id, m.name AS medicine_name, i.batch_number,
+                      i.current_quantity, i.expiry_date, i.location
+               FROM INVENTORY i
+               JOIN MEDICINES m ON i.medicine_id = m.medicine_id
+               WHERE i.supplier_id = %s AND i.current_quantity > 0
+               ORDER BY i.expiry_date, m.name""",
+            (supplier_id,), prepare=prepare, accumulate=count_batch, summary=batch_summary()
+        )
 
     def get_supplier_inventory(self, supplier_id):
         """Get inventory items from a specific supplier with expiry information"""
+        conn = get_db_connection()
+        cursor = conn.cursor(dictionary=True)
         try:
             query = """
             SELECT 
@@ -211,7 +261,6 @@ class SupplierManager:
             i.batch_number,
             i.current_quantity,
             i.expiry_date,
-            DATEDIFF(i.expiry_date, CURDATE()) AS days_until_expiry,
             i.location
             FROM 
             INVENTORY i
@@ -223,8 +272,11 @@ class SupplierManager:
             ORDER BY 
             i.expiry_date, m.name
             """
-            self.cursor.execute(query, (supplier_id,))
-            inventory = self.cursor.fetchall()
+            cursor.execute(query, (supplier_id,))
+            inventory = cursor.fetchall()
+            today = date.today()
+            for item in inventory:
+                item['days_until_expiry'] = (item['expiry_date'] - today).days
         
             return {
             "success": True,
@@ -241,7 +293,6 @@ class SupplierManager:
             "success": False,
             "error": f"Error fetching supplier inventory: {str(e)}"
             }
-
-
-    
-
+        finally:
+            cursor.close()
+            conn.close()
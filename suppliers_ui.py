@@ -1,6 +1,8 @@
 import customtkinter as ctk
 from tkinter import messagebox, ttk
 from suppliers import SupplierManager
+from background import BackgroundLoader
+from tree_sync import KeyedTreeview
 from theme import setup_theme
 
 class SupplierGUI:
@@ -8,6 +10,7 @@ class SupplierGUI:
         self.root = root
         self.sm = SupplierManager()
         self.theme = setup_theme()
+        self.loader = BackgroundLoader(self.root)
         self.setup_ui()
         
     def setup_ui(self):
@@ -215,6 +218,15 @@ class SupplierGUI:
         self.tree.pack(fill="both", expand=True)
         tree_scroll.configure(command=self.tree.yview)
         
+        # Search refreshes diff rows by supplier ID instead of rebuilding the tree
+        self.rows = KeyedTreeview(self.tree, lambda supplier: supplier["supplier_id"], lambda supplier: (
+            supplier["supplier_id"],
+            supplier["name"],
+            supplier["phone"],
+            supplier["email"],
+            supplier["address"]
+        ))
+        
         # Bind double click to view details
         self.tree.bind("<Double-1>", self.view_supplier_details)
     
@@ -365,22 +377,15 @@ class SupplierGUI:
             messagebox.showerror("Error", "Please enter a search term")
             return
         
-        results = self.sm.search_suppliers(search_term)
-        
-        # Clear treeview
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-        
+        self.loader.submit("suppliers", self.sm.search_suppliers, search_term,
+                           on_done=self.show_search_results)
+    
+    def show_search_results(self, results):
+        """Fill the treeview with supplier search results"""
         if isinstance(results, list):
-            for supplier in results:
-                self.tree.insert("", "end", values=(
-                    supplier["supplier_id"],
-                    supplier["name"],
-                    supplier["phone"],
-                    supplier["email"],
-                    supplier["address"]
-                ))
+            self.rows.sync(results)
         else:
+            self.rows.clear()
             messagebox.showerror("Error", results.get("error", "Error searching suppliers"))
     
     def show_top_suppliers(self):
@@ -430,8 +435,11 @@ class SupplierGUI:
             messagebox.showerror("Error", "Supplier ID must be a number")
             return
     
-        result = self.sm.get_supplier_inventory(supplier_id)
+        self.loader.submit("supplier_inventory", self.sm.get_supplier_inventory, supplier_id,
+                           on_done=self.show_supplier_inventory)
     
+    def show_supplier_inventory(self, result):
+        """Fill the inventory treeview with a supplier's batches"""
         # Clear treeview
         for item in self.inventory_tree.get_children():
             self.inventory_tree.delete(item)
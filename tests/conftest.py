@@ -0,0 +1,37 @@
+# conftest.py
+import os
+import sys
+
+import pytest
+
+# The application modules live flat in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backends import SQLiteBackend                  # noqa: E402
+from instrumentation import InstrumentedCursor, query_stats     # noqa: E402
+from migrations import apply_migrations             # noqa: E402
+from prepared import statements                     # noqa: E402
+from stock import stock_levels                      # noqa: E402
+
+
+@pytest.fixture
+def memory_db():
+    """Fresh in-memory SQLite database with the full schema.
+
+    Yields ``cursor(dictionary=False)``, a factory for cursors wrapped the
+    way pooled connections wrap them, so the prepared statement registry
+    works on them too. Nothing here touches the process-wide pool.
+    """
+    backend = SQLiteBackend(":memory:")
+    conn = backend.connect()
+
+    def cursor(dictionary=False):
+        return InstrumentedCursor(conn.cursor(dictionary=dictionary), query_stats, conn)
+
+    setup = cursor()
+    apply_migrations(setup, backend)
+    stock_levels.create_table(setup)
+    conn.commit()
+    yield cursor
+    statements.forget(conn)
+    conn.close()
@@ -0,0 +1,113 @@
+# test_dispensing.py
+import pytest
+
+from dispensing import FifoDispenser, InsufficientStockError
+
+# (inventory_id, medicine_id, expiry_date, date_added, current_quantity)
+BATCHES = [
+    (1, 10, "2031-01-01", "2026-01-01", 50),
+    (2, 10, "2030-01-01", "2026-03-01", 5),
+    (3, 10, "2030-01-01", "2026-02-01", 8),     # same expiry as 2, delivered earlier
+    (4, 10, "2029-01-01", "2026-01-01", 0),     # empty: never picked
+    (5, 20, "2030-06-01", "2026-01-01", 4),
+    (6, 30, "2030-06-01", "2026-01-01", 1),
+]
+
+
+@pytest.fixture
+def cursor(memory_db):
+    cursor = memory_db()
+    cursor.executemany("INSERT INTO medicines (medicine_id, name, price) VALUES (%s, %s, %s)",
+                       [(10, "Panadol", 2.5), (20, "Amoxil", 5), (30, "Brufen", 3)])
+    cursor.executemany(
+        """INSERT INTO inventory (inventory_id, medicine_id, quantity_added, expiry_date, date_added,
+           current_quantity) VALUES (%s, %s, %s, %s, %s, %s)""",
+        [(inventory_id, medicine_id, max(quantity, 1), expiry, added, quantity)
+         for inventory_id, medicine_id, expiry, added, quantity in BATCHES]
+    )
+    return cursor
+
+
+def test_plan_takes_soonest_expiry_then_oldest_delivery(cursor):
+    assert FifoDispenser.plan(cursor, [(10, 20)]) == [
+        {"medicine_id": 10, "inventory_id": 3, "quantity": 8},
+        {"medicine_id": 10, "inventory_id": 2, "quantity": 5},
+        {"medicine_id": 10, "inventory_id": 1, "quantity": 7},
+    ]
+
+
+def test_plan_covers_a_basket_in_medicine_order(cursor):
+    allocation = FifoDispenser.plan(cursor, [(20, 3), (10, 2)])
+    assert [(item["medicine_id"], item["inventory_id"], item["quantity"]) for item in allocation] == [
+        (10, 3, 2), (20, 5, 3)]
+
+
+def test_plan_merges_repeated_lines(cursor):
+    assert FifoDispenser.plan(cursor, [(20, 1), (20, 3)]) == [
+        {"medicine_id": 20, "inventory_id": 5, "quantity": 4}]
+
+
+def test_plan_reports_the_short_medicine(cursor):
+    with pytest.raises(InsufficientStockError) as raised:
+        FifoDispenser.plan(cursor, [(10, 1), (20, 5)])
+    assert (raised.value.medicine_id, raised.value.requested, raised.value.available) == (20, 5, 4)
+
+
+def test_plan_treats_a_medicine_without_batches_as_out_of_stock(cursor):
+    with pytest.raises(InsufficientStockError) as raised:
+        FifoDispenser.plan(cursor, [(99, 1)])
+    assert raised.value.available == 0
+
+
+@pytest.mark.parametrize("quantity", [0, -1])
+def test_plan_rejects_non_positive_quantities(cursor, quantity):
+    with pytest.raises(ValueError):
+        FifoDispenser.plan(cursor, [(10, quantity)])
+
+
+def test_empty_basket_plans_nothing(cursor):
+    assert FifoDispenser.plan(cursor, []) == []
+
+
+def test_apply_deducts_the_planned_units(cursor):
+    FifoDispenser.apply(cursor, FifoDispenser.plan(cursor, [(10, 10), (30, 1)]))
+    cursor.execute("SELECT inventory_id, current_quantity FROM inventory ORDER BY inventory_id")
+    assert cursor.fetchall() == [(1, 50), (2, 3), (3, 0), (4, 0), (5, 4), (6, 0)]
+    cursor.execute("SELECT medicine_id, total_quantity FROM stock_summary ORDER BY medicine_id")
+    # Summary rows are seeded from the batches the first time a medicine changes
+    assert cursor.fetchall() == [(10, 53), (30, 0)]
+
+
+def test_recorded_allocation_follows_line_changes(cursor):
+    cursor.execute("INSERT INTO prescriptions (prescription_id, date, total_amount) VALUES (1, '2030-01-01', 0)")
+    FifoDispenser.record_allocation(cursor, 1, FifoDispenser.plan(cursor, [(10, 10)]), new=True)
+    # Drawing again from a batch already on record adds to its row
+    FifoDispenser.record_allocation(cursor, 1, [{"medicine_id": 10, "inventory_id": 2, "quantity": 3}])
+    FifoDispenser.release_allocation(cursor, 1, 10, 4)
+
+    cursor.execute("SELECT inventory_id, quantity FROM prescription_batches ORDER BY inventory_id")
+    # Returns come off the batch FIFO drew from last: 2 (same expiry as 3, delivered later)
+    assert cursor.fetchall() == [(2, 1), (3, 8)]
+
+    FifoDispenser.release_allocation(cursor, 1, 10)
+    cursor.execute("SELECT COUNT(*) FROM prescription_batches")
+    assert cursor.fetchone() == (0,)
+
+
+def test_released_units_go_back_to_the_batches_they_came_from(cursor):
+    cursor.execute("INSERT INTO prescriptions (prescription_id, date, total_amount) VALUES (1, '2030-01-01', 0)")
+    allocation = FifoDispenser.dispense(cursor, [(10, 10)])
+    FifoDispenser.record_allocation(cursor, 1, allocation, new=True)
+
+    released = FifoDispenser.release_allocation(cursor, 1, 10, 4)
+    assert released == [(2, 2), (3, 2)]
+    FifoDispenser.restock(cursor, 10, 4, "ADJUST-1", released)
+    cursor.execute("SELECT inventory_id, current_quantity FROM inventory WHERE medicine_id = 10 ORDER BY inventory_id")
+    assert cursor.fetchall() == [(1, 50), (2, 5), (3, 2), (4, 0)]
+
+    # Units with no batch on record go on the newest batch
+    FifoDispenser.restock(cursor, 10, 8, "RETURN-1", FifoDispenser.release_allocation(cursor, 1, 10) + [(99, 2)])
+    cursor.execute("SELECT inventory_id, current_quantity FROM inventory WHERE medicine_id = 10 ORDER BY inventory_id")
+    assert cursor.fetchall() == [(1, 50), (2, 7), (3, 8), (4, 0)]
+    cursor.execute("SELECT total_quantity FROM stock_summary WHERE medicine_id = 10")
+    assert cursor.fetchone() == (65,)
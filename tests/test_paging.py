@@ -0,0 +1,113 @@
+# test_paging.py
+from datetime import date, datetime
+from decimal import Decimal
+
+import pytest
+
+from paging import (InvalidCursor, cursor_for, decode_cursor, encode_cursor, keyset_page,
+                    seek_condition)
+
+ORDER = [("expiry_date", "expiry_date"), ("item_id", "item_id")]
+
+
+def test_cursor_round_trips_typed_values():
+    values = [date(2030, 1, 2), datetime(2030, 1, 2, 3, 4, 5), Decimal("12.50"), None, "Panadol", 7]
+    assert decode_cursor(encode_cursor(values)) == values
+
+
+def test_cursor_is_url_safe_without_padding():
+    token = encode_cursor(["a" * 7, 123456789])
+    assert "=" not in token
+    assert set(token) <= set("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-_")
+
+
+@pytest.mark.parametrize("token", ["", "not base64!", "eyJhIjoxfQ"])
+def test_malformed_cursor_is_rejected(token):
+    # Empty, garbage, and a well-formed JSON object instead of a list
+    with pytest.raises(InvalidCursor):
+        decode_cursor(token)
+
+
+def test_unknown_typed_value_is_rejected():
+    token = encode_cursor([{"x": 1}])
+    with pytest.raises(InvalidCursor):
+        decode_cursor(token)
+
+
+def test_cursor_for_takes_the_sort_keys_of_a_row():
+    row = {"item_id": 3, "expiry_date": date(2030, 5, 1), "name": "ignored"}
+    assert decode_cursor(cursor_for(row, ["expiry_date", "item_id"])) == [date(2030, 5, 1), 3]
+
+
+def test_seek_condition_forward():
+    sql, params = seek_condition(["a", "b"], [1, 2])
+    assert sql == "((a > %s) OR (a = %s AND b > %s))"
+    assert params == [1, 1, 2]
+
+
+def test_seek_condition_backward_includes_nulls():
+    sql, params = seek_condition(["a", "b"], [1, 2], backward=True)
+    assert sql == "(((a < %s OR a IS NULL)) OR (a = %s AND (b < %s OR b IS NULL)))"
+    assert params == [1, 1, 2]
+
+
+def test_seek_condition_with_null_values():
+    # NULL sorts first: past a NULL comes every non-NULL value; nothing is before it
+    assert seek_condition(["a", "b"], [None, 5]) == ("((a IS NOT NULL) OR (a IS NULL AND b > %s))", [5])
+    assert seek_condition(["a"], [None], backward=True) == ("((1 = 0))", [])
+
+
+@pytest.fixture
+def items(memory_db):
+    cursor = memory_db(dictionary=True)
+    cursor.execute("CREATE TABLE items (item_id INTEGER PRIMARY KEY, expiry_date DATE)")
+    rows = [(n, None if n % 5 == 0 else date(2030, 1, 1 + n % 3)) for n in range(1, 24)]
+    cursor.executemany("INSERT INTO items (item_id, expiry_date) VALUES (%s, %s)", rows)
+    # Expected order: NULL dates first, then by date, ties by ID
+    expected = sorted(rows, key=lambda row: (row[1] is not None, row[1] or date.min, row[0]))
+    return cursor, [item_id for item_id, _ in expected]
+
+
+def _pages(cursor, page_size, **options):
+    pages = []
+    token = None
+    while True:
+        rows, token = keyset_page(cursor, "SELECT * FROM items", ORDER, page_token=token, page_size=page_size,
+                                  **options)
+        pages.append([row["item_id"] for row in rows])
+        if token is None:
+            return pages
+
+
+def test_keyset_pages_cover_every_row_once_in_order(items):
+    cursor, expected = items
+    pages = _pages(cursor, 5)
+    assert [len(page) for page in pages] == [5, 5, 5, 5, 3]
+    assert [item_id for page in pages for item_id in page] == expected
+
+
+def test_keyset_page_with_extra_condition(items):
+    cursor, expected = items
+    pages = _pages(cursor, 4, where=["item_id > %s"], params=(10,))
+    assert [item_id for page in pages for item_id in page] == [item_id for item_id in expected if item_id > 10]
+
+
+def test_keyset_page_backward_returns_the_previous_page(items):
+    cursor, expected = items
+    forward = _pages(cursor, 5)
+    third_page_start = {"item_id": forward[2][0]}
+    cursor.execute("SELECT expiry_date FROM items WHERE item_id = %s", (forward[2][0],))
+    third_page_start["expiry_date"] = cursor.fetchone()["expiry_date"]
+
+    rows, token = keyset_page(cursor, "SELECT * FROM items", ORDER, page_size=5, backward=True,
+                              page_token=cursor_for(third_page_start, ["expiry_date", "item_id"]))
+    assert [row["item_id"] for row in rows] == forward[1]
+    rows, token = keyset_page(cursor, "SELECT * FROM items", ORDER, page_size=5, backward=True, page_token=token)
+    assert [row["item_id"] for row in rows] == forward[0]
+    assert token is None
+
+
+def test_cursor_from_another_listing_is_rejected(items):
+    cursor, _ = items
+    with pytest.raises(InvalidCursor):
+        keyset_page(cursor, "SELECT * FROM items", ORDER, page_token=encode_cursor([1]))
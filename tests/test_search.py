@@ -0,0 +1,76 @@
+# test_search.py
+import pytest
+
+from search import PrefixTrie, TrigramIndex, max_typos
+
+
+@pytest.fixture
+def trie():
+    trie = PrefixTrie()
+    for key, word in enumerate(["panadol", "panadeine", "pan", "paracetamol", "brufen", "amoxil"]):
+        trie.add(word, key)
+    return trie
+
+
+def test_complete_yields_shorter_words_first(trie):
+    assert list(trie.complete("pan")) == [2, 1, 0]
+    assert list(trie.complete("para")) == [3]
+    assert list(trie.complete("x")) == []
+
+
+def test_words_can_share_keys_and_keys_share_words():
+    trie = PrefixTrie()
+    trie.add("tab", 1)
+    trie.add("tab", 2)
+    trie.add("tablet", 1)
+    assert sorted(trie.complete("tab")) == [1, 1, 2]
+
+
+def test_remove_prunes_empty_branches(trie):
+    trie.remove("panadeine", 1)
+    assert list(trie.complete("panade")) == []
+    assert list(trie.complete("pan")) == [2, 0]
+    trie.remove("nothing", 9)   # unknown words are ignored
+
+
+@pytest.mark.parametrize("word, distance", [
+    ("panadol", 0),     # exact
+    ("panadl", 1),      # deletion
+    ("panaddol", 1),    # insertion
+    ("panedol", 1),     # substitution
+    ("pnaadol", 2),     # transposition counts as two edits
+])
+def test_fuzzy_finds_words_within_the_distance(trie, word, distance):
+    assert trie.fuzzy(word, 2).get(0) == distance
+
+
+def test_fuzzy_respects_the_maximum_distance(trie):
+    assert 0 not in trie.fuzzy("pnaadol", 1)
+    assert trie.fuzzy("brufn", 1) == {4: 1}
+
+
+def test_fuzzy_requires_the_first_letter(trie):
+    # "manadol" is one substitution away, but misspellings rarely start wrong
+    assert trie.fuzzy("manadol", 2) == {}
+    assert trie.fuzzy("", 2) == {}
+
+
+def test_fuzzy_keeps_the_smallest_distance_per_key():
+    trie = PrefixTrie()
+    trie.add("ibuprofen", 1)
+    trie.add("ibuprofan", 1)
+    assert trie.fuzzy("ibuprofen", 2) == {1: 0}
+
+
+@pytest.mark.parametrize("term, typos", [("ab", 0), ("abc", 0), ("abcd", 1), ("abcdefg", 1), ("abcdefgh", 2)])
+def test_max_typos_grows_with_the_term(term, typos):
+    assert max_typos(term) == typos
+
+
+@pytest.mark.parametrize("term, keys", [("b1", {1}), ("d3", {2}), ("o", {1, 2, 3}), ("adol", {3}), ("xyz", set())])
+def test_trigram_matches_any_substring_length(term, keys):
+    # Terms under three characters have no trigram and are found by a scan
+    index = TrigramIndex()
+    for key, text in [(1, "vitamin b12 complex"), (2, "d3 drops"), (3, "panadol")]:
+        index.add(key, text)
+    assert set(index.matches(term)) == keys
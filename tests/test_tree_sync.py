@@ -0,0 +1,119 @@
+# test_tree_sync.py
+import pytest
+
+from tree_sync import KeyedTreeview
+
+
+class FakeTreeview:
+    """The slice of ttk.Treeview that KeyedTreeview uses, recording each call"""
+
+    def __init__(self):
+        self.order = []
+        self.values = {}
+        self.calls = []
+
+    def get_children(self, item=""):
+        return tuple(self.order)
+
+    def exists(self, iid):
+        return iid in self.values
+
+    def insert(self, parent, index, iid=None, values=()):
+        self.calls.append(("insert", iid))
+        self.order.insert(len(self.order) if index == "end" else index, iid)
+        self.values[iid] = tuple(values)
+        return iid
+
+    def move(self, iid, parent, index):
+        self.calls.append(("move", iid))
+        self.order.remove(iid)
+        self.order.insert(len(self.order) if index == "end" else index, iid)
+
+    def delete(self, *iids):
+        self.calls.append(("delete",) + iids)
+        for iid in iids:
+            self.order.remove(iid)
+            del self.values[iid]
+
+    def item(self, iid, values=None):
+        self.calls.append(("item", iid))
+        self.values[iid] = tuple(values)
+
+    def shown(self):
+        return [(iid, self.values[iid]) for iid in self.order]
+
+
+def rows(*pairs):
+    return [{"id": key, "name": name} for key, name in pairs]
+
+
+@pytest.fixture
+def tree():
+    return FakeTreeview()
+
+
+@pytest.fixture
+def view(tree):
+    return KeyedTreeview(tree, row_key=lambda row: row["id"], row_values=lambda row: (row["name"],))
+
+
+def test_first_sync_inserts_rows_in_order(tree, view):
+    assert view.sync(rows((1, "a"), (2, "b"), (3, "c"))) == ["1", "2", "3"]
+    assert tree.shown() == [("1", ("a",)), ("2", ("b",)), ("3", ("c",))]
+
+
+def test_unchanged_rows_cost_no_tk_calls(tree, view):
+    view.sync(rows((1, "a"), (2, "b")))
+    tree.calls.clear()
+    view.sync(rows((1, "a"), (2, "b")))
+    assert tree.calls == []
+
+
+def test_only_the_changed_row_is_rewritten(tree, view):
+    view.sync(rows((1, "a"), (2, "b"), (3, "c")))
+    tree.calls.clear()
+    view.sync(rows((1, "a"), (2, "B"), (3, "c")))
+    assert tree.calls == [("item", "2")]
+    assert tree.shown()[1] == ("2", ("B",))
+
+
+def test_removed_and_added_rows(tree, view):
+    view.sync(rows((1, "a"), (2, "b"), (3, "c")))
+    tree.calls.clear()
+    view.sync(rows((1, "a"), (4, "d"), (3, "c")))
+    assert tree.calls == [("delete", "2"), ("insert", "4")]
+    assert [iid for iid, _ in tree.shown()] == ["1", "4", "3"]
+
+
+def test_reordered_rows_are_moved_not_recreated(tree, view):
+    view.sync(rows((1, "a"), (2, "b"), (3, "c")))
+    tree.calls.clear()
+    view.sync(rows((3, "c"), (1, "a"), (2, "b")))
+    assert {call[0] for call in tree.calls} == {"move"}
+    assert [iid for iid, _ in tree.shown()] == ["3", "1", "2"]
+
+
+def test_duplicate_keys_keep_the_first_row(tree, view):
+    assert view.sync(rows((1, "a"), (1, "dup"), (2, "b"))) == ["1", "2"]
+    assert tree.shown() == [("1", ("a",)), ("2", ("b",))]
+
+
+def test_items_added_by_other_code_are_dropped(tree, view):
+    view.sync(rows((1, "a")))
+    tree.insert("", "end", iid="stray", values=("x",))
+    view.sync(rows((1, "a"), (2, "b")))
+    assert [iid for iid, _ in tree.shown()] == ["1", "2"]
+
+
+def test_insert_remove_and_clear(tree, view):
+    view.sync(rows((1, "a"), (2, "b")))
+    assert view.insert(rows((3, "c"), (1, "A")), index=0) == ["3", "1"]
+    assert tree.shown() == [("3", ("c",)), ("1", ("A",)), ("2", ("b",))]
+
+    view.remove(["1", "missing"])
+    assert [iid for iid, _ in tree.shown()] == ["3", "2"]
+
+    view.clear()
+    assert tree.shown() == []
+    view.sync(rows((2, "b")))
+    assert tree.shown() == [("2", ("b",))]
@@ -0,0 +1,88 @@
+# tree_sync.py
+
+
+class KeyedTreeview:
+    """Keeps a ttk.Treeview in step with result sets keyed by primary key.
+
+    Each row becomes the item whose iid is ``str(row_key(row))``. sync()
+    diffs a new result set against what is shown and only deletes, inserts,
+    updates or moves the rows that changed. Unchanged rows keep their item,
+    so the selection, focus and scroll position survive a refresh, and a
+    refresh where one row changed costs a handful of Tk calls rather than
+    one per row. Items added to the tree by other code are treated as stale
+    and removed by the next sync().
+    """
+
+    def __init__(self, tree, row_key, row_values):
+        self.tree = tree
+        self.row_key = row_key
+        self.row_values = row_values
+        self._values = {}       # iid -> values last written to the tree
+
+    def sync(self, rows):
+        """Make the tree show exactly ``rows``, in order; returns their iids"""
+        wanted = []
+        values = {}
+        for row in rows:
+            iid = str(self.row_key(row))
+            if iid not in values:
+                wanted.append(iid)
+                values[iid] = tuple(self.row_values(row))
+
+        shown = list(self.tree.get_children())
+        stale = [iid for iid in shown if iid not in values]
+        if stale:
+            self.tree.delete(*stale)
+            stale = set(stale)
+            shown = [iid for iid in shown if iid not in stale]
+        self._values = {iid: self._values[iid] for iid in shown if iid in self._values}
+
+        for position, iid in enumerate(wanted):
+            if position < len(shown) and shown[position] == iid:
+                self._update(iid, values[iid])
+                continue
+            if iid in self._values or self.tree.exists(iid):
+                self.tree.move(iid, "", position)
+                shown.remove(iid)
+                self._update(iid, values[iid])
+            else:
+                self.tree.insert("", position, iid=iid, values=values[iid])
+                self._values[iid] = values[iid]
+            shown.insert(position, iid)
+        return wanted
+
+    def insert(self, rows, index="end"):
+        """Add rows at ``index`` without touching the others; returns their iids.
+
+        A row that is already shown is moved here and updated.
+        """
+        iids = []
+        for offset, row in enumerate(rows):
+            iid = str(self.row_key(row))
+            row_values = tuple(self.row_values(row))
+            position = index if index == "end" else index + offset
+            if self.tree.exists(iid):
+                self.tree.move(iid, "", position)
+                self._update(iid, row_values)
+            else:
+                self.tree.insert("", position, iid=iid, values=row_values)
+                self._values[iid] = row_values
+            iids.append(iid)
+        return iids
+
+    def remove(self, iids):
+        """Delete the given items (ignoring ones already gone)"""
+        present = [iid for iid in iids if self.tree.exists(iid)]
+        if present:
+            self.tree.delete(*present)
+        for iid in iids:
+            self._values.pop(iid, None)
+
+    def clear(self):
+        self.tree.delete(*self.tree.get_children())
+        self._values = {}
+
+    def _update(self, iid, row_values):
+        if self._values.get(iid) != row_values:
+            self.tree.item(iid, values=row_values)
+            self._values[iid] = row_values
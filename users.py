@@ -1,11 +1,10 @@
 from database import get_db_connection
+from sequences import next_id
 import re
 
 class UserManager:
     def __init__(self):
-        self.conn = get_db_connection()
-        self.cursor = self.conn.cursor(dictionary=True)
-        self._current_user = None 
+        self._current_user = None
 
 
     def set_current_user(self, user):
@@ -46,6 +45,8 @@ class UserManager:
     
     def authenticate_user(self, email, password):
         """Authenticate user with plaintext password"""
+        conn = get_db_connection()
+        cursor = conn.cursor(dictionary=True)
         try:
             if not email or not password:
                 return {"success": False, "message": "Email and password are required"}
@@ -54,8 +55,8 @@ class UserManager:
             email = email.strip()
 
             query = "SELECT * FROM USERS WHERE email = %s"
-            self.cursor.execute(query, (email,))
-            user = self.cursor.fetchone()
+            cursor.execute(query, (email,))
+            user = cursor.fetchone()
 
             if not user:
                 return {"success": False, "message": "Invalid credentials"}
@@ -71,9 +72,14 @@ class UserManager:
 
         except Exception as e:
             return {"success": False, "message": f"Authentication error: {str(e)}"}
+        finally:
+            cursor.close()
+            conn.close()
 
     def update_user(self, user_id, name=None, email=None, phone=None, role=None, password=None):
         """Update user information with validation"""
+        conn = get_db_connection()
+        cursor = conn.cursor(dictionary=True)
         try:
             updates = []
             params = []
@@ -121,36 +127,46 @@ class UserManager:
                     check_params.append(phone)
                 
                 check_query += " OR ".join(conditions) + ")"
-                self.cursor.execute(check_query, check_params)
-                if self.cursor.fetchone():
+                cursor.execute(check_query, check_params)
+                if cursor.fetchone():
                     return {"success": False, "message": "Another user with this email or phone already exists"}
             
             # Perform update
             query = f"UPDATE USERS SET {', '.join(updates)} WHERE user_id = %s"
             params.append(user_id)
-            self.cursor.execute(query, params)
-            self.conn.commit()
+            cursor.execute(query, params)
+            conn.commit()
             
             return {"success": True, "message": "User updated successfully"}
         except Exception as e:
-            self.conn.rollback()
+            conn.rollback()
             return {"success": False, "message": f"Error updating user: {str(e)}"}
+        finally:
+            cursor.close()
+            conn.close()
 
     # User Query Functions (remain unchanged)
     def get_user_by_id(self, user_id):
         """Get user details by ID (excluding password)"""
+        conn = get_db_connection()
+        cursor = conn.cursor(dictionary=True)
         try:
             query = "SELECT user_id, name, email, phone, role FROM USERS WHERE user_id = %s"
-            self.cursor.execute(query, (user_id,))
-            user = self.cursor.fetchone()
+            cursor.execute(query, (user_id,))
+            user = cursor.fetchone()
             if not user:
                 return {"success": False, "message": "User not found"}
             return {"success": True, "user": user}
         except Exception as e:
             return {"success": False, "message": f"Error fetching user: {str(e)}"}
+        finally:
+            cursor.close()
+            conn.close()
 
     def get_all_users(self, role_filter=None):
         """Get all users with optional role filter"""
+        conn = get_db_connection()
+        cursor = conn.cursor(dictionary=True)
         try:
             query = "SELECT user_id, name, email, phone, role FROM USERS"
             params = []
@@ -160,57 +176,64 @@ class UserManager:
                 params.append(role_filter)
             
             query += " ORDER BY name"
-            self.cursor.execute(query, params)
-            return self.cursor.fetchall()
+            cursor.execute(query, params)
+            return cursor.fetchall()
         except Exception as e:
             return {"error": f"Error fetching users: {str(e)}"}
+        finally:
+            cursor.close()
+            conn.close()
 
     def reset_password(self, email, new_password):
         """Reset user password without encryption"""
+        conn = get_db_connection()
+        cursor = conn.cursor(dictionary=True)
         try:
             if not self._validate_password(new_password):
                 return {"success": False, "message": "Password must be at least 8 characters with uppercase, lowercase, and numbers"}
             
             query = "UPDATE USERS SET password = %s WHERE email = %s"
-            self.cursor.execute(query, (new_password, email))
-            self.conn.commit()
+            cursor.execute(query, (new_password, email))
+            conn.commit()
             
-            if self.cursor.rowcount == 0:
+            if cursor.rowcount == 0:
                 return {"success": False, "message": "User not found"}
             
             return {"success": True, "message": "Password reset successfully"}
         except Exception as e:
-            self.conn.rollback()
+            conn.rollback()
             return {"success": False, "message": f"Error resetting password: {str(e)}"}
+        finally:
+            cursor.close()
+            conn.close()
 
     def delete_user(self, user_id):
         """Delete a user account"""
+        conn = get_db_connection()
+        cursor = conn.cursor(dictionary=True)
         try:
             query = "DELETE FROM USERS WHERE user_id = %s"
-            self.cursor.execute(query, (user_id,))
-            self.conn.commit()
+            cursor.execute(query, (user_id,))
+            conn.commit()
             
-            if self.cursor.rowcount == 0:
+            if cursor.rowcount == 0:
                 return {"success": False, "message": "User not found"}
             
             return {"success": True, "message": "User deleted successfully"}
         except Exception as e:
-            self.conn.rollback()
+            conn.rollback()
             return {"success": False, "message": f"Error deleting user: {str(e)}"}
-
-    def __del__(self):
-        try:
-            if hasattr(self, 'cursor') and self.cursor:
-                self.cursor.close()
-            if hasattr(self, 'conn') and self.conn:
-                self.conn.close()
-            
-        except Exception as e:
-            pass  # Optional: log this error if you want
-
+        finally:
+            cursor.close()
+            conn.close()
 
     def register_user(self, name, email, phone, role, password):
         """Register a new user with validation (plaintext password)"""
+        # Reserve the ID before borrowing a connection: a fresh block is
+        # fetched on a pooled connection of its own
+        user_id = next_id("users")
+        conn = get_db_connection()
+        cursor = conn.cursor(dictionary=True)
         try:
             # Validate inputs
             if not name or not email or not phone or not role or not password:
@@ -224,23 +247,18 @@ class UserManager:
                return {"success": False, "message": "Password must be 8+ chars with uppercase, lowercase, and numbers"}
 
             # Check for duplicate email or phone
-            self.cursor.execute("SELECT user_id FROM USERS WHERE email = %s OR phone = %s", 
+            cursor.execute("SELECT user_id FROM USERS WHERE email = %s OR phone = %s", 
             (email, phone))
-            if self.cursor.fetchone():
+            if cursor.fetchone():
                return {"success": False, "message": "User with this email or phone already exists"}
 
-            # Get the next available user_id
-            self.cursor.execute("SELECT MAX(user_id) AS max_id FROM USERS")
-            result = self.cursor.fetchone()
-            user_id = 1 if result['max_id'] is None else result['max_id'] + 1
-
             # Insert new user with the generated user_id
             query = """
             INSERT INTO USERS (user_id, name, email, phone, role, password)
             VALUES (%s, %s, %s, %s, %s, %s)
             """
-            self.cursor.execute(query, (user_id, name, email, phone, role, password))
-            self.conn.commit()
+            cursor.execute(query, (user_id, name, email, phone, role, password))
+            conn.commit()
     
             return {
             "success": True, 
@@ -249,8 +267,11 @@ class UserManager:
             }
     
         except Exception as e:
-            self.conn.rollback()
+            conn.rollback()
             return {
                 "success": False, 
                 "message": f"Error registering user: {str(e)}"
-            }
\ No newline at end of file
+            }
+        finally:
+            cursor.close()
+            conn.close()
\ No newline at end of file